@@ -0,0 +1,50 @@
+#   Startup time of the ds_info command, i.e. the time to import its modules
+#   and build the argument parser, over that of a bare interpreter. Exits with
+#   an error if it exceeds the budget, so it can guard the startup time in CI.
+#
+#   python -m benchmarks.bench_import_time --budget 500
+
+import sys
+import time
+import argparse
+import subprocess
+
+STARTUP = "from ds_info.cli import get_parser; get_parser()"
+
+def startup_time(code, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], check=True)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def slowest_imports(code, nr_imports=10):
+    """Modules with the largest cumulative import times, in microseconds."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], 
+        check=True, capture_output=True, text=True)
+    imports = []
+    for line in result.stderr.splitlines()[1:]:
+        _, cumulative, module = line.split('|')
+        # Only top-level imports, not those nested within other imports
+        if not module[1:].startswith(' '):
+            imports.append((int(cumulative), module.strip()))
+    return sorted(imports, reverse=True)[:nr_imports]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--budget", type=float, default=500, help="budget in ms")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+    bare = startup_time('pass', args.repeats)
+    total = startup_time(STARTUP, args.repeats)
+    overhead_ms = (total - bare) * 1000
+    print('Interpreter {:.0f} ms, ds_info startup {:.0f} ms over it (budget {:.0f} ms)'.format(
+        bare * 1000, overhead_ms, args.budget))
+    for cumulative, module in slowest_imports(STARTUP):
+        print('{:>8.1f} ms  {}'.format(cumulative / 1000, module))
+    if overhead_ms > args.budget:
+        sys.exit('Startup budget exceeded')
+
+if __name__ == "__main__":
+    main()
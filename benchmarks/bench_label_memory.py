@@ -0,0 +1,46 @@
+#   Peak memory of the label feature path with int64 label maps (the previous
+#   behaviour of get_arrays_from_img_label) and with compact label maps.
+#   Each variant runs in a fresh process, so the peak RSS is not shared.
+#
+#   python -m benchmarks.bench_label_memory --shape 300 512 512
+
+import argparse
+import resource
+import multiprocessing
+import numpy as np
+from ds_info.utils.label_utils import compact_label_map
+from ds_info.feature_extraction.label_features import label_statistics, connected_components
+from benchmarks.synthetic import synthetic_label_map
+
+def peak_rss_mb():
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def run_variant(variant, shape, queue):
+    y = synthetic_label_map(shape, nr_fragments=5, rng=np.random.default_rng(0))
+    start_rss = peak_rss_mb()
+    if variant == 'int64':
+        y = y.astype(int)
+    else:
+        y = compact_label_map(y)
+    for lbl in label_statistics(y).keys():
+        connected_components(y == lbl, connectivity=2)
+    queue.put((start_rss, peak_rss_mb()))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shape", type=int, nargs=3, default=[300, 512, 512])
+    args = parser.parse_args()
+    context = multiprocessing.get_context('spawn')
+    print('Label map of shape {}'.format(tuple(args.shape)))
+    for variant in ['int64', 'compact']:
+        queue = context.Queue()
+        process = context.Process(target=run_variant, args=(variant, tuple(args.shape), queue))
+        process.start()
+        start_rss, end_rss = queue.get()
+        process.join()
+        print('{:>8}: peak RSS {:.0f} MB ({:.0f} MB over the loaded uint8 map)'.format(
+            variant, end_rss, end_rss - start_rss))
+
+if __name__ == "__main__":
+    main()
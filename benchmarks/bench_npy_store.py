@@ -0,0 +1,59 @@
+#   Load times of a compressed NIfTI image with SimpleITK and of its npy copy,
+#   memory-mapped. Cold loads evict the file from the page cache first with
+#   posix_fadvise, which works for files that are not being written.
+#
+#   python -m benchmarks.bench_npy_store --shape 200 512 512
+
+import os
+import time
+import argparse
+import tempfile
+import SimpleITK as sitk
+from ds_info.utils.io_utils import convert_to_npy, load_img_label
+from benchmarks.synthetic import write_synthetic_task
+
+def evict(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+
+def timed(fn, paths, cold, repeats):
+    times = []
+    for _ in range(repeats):
+        if cold:
+            for path in paths:
+                evict(path)
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shape", type=int, nargs=3, default=[200, 512, 512])
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as dataset_path:
+        write_synthetic_task(dataset_path, nr_cases=1, shape=tuple(args.shape), shape_variation=0)
+        convert_to_npy(dataset_path, 'case_0000_0000.nii.gz')
+        nii_path = os.path.join(dataset_path, 'imagesTr', 'case_0000_0000.nii.gz')
+        npy_path = os.path.join(dataset_path, 'npy', 'imagesTr', 'case_0000_0000.npy')
+        crop = tuple(slice(n//2 - n//8, n//2 + n//8) for n in args.shape)
+        loaders = [
+            ('sitk.ReadImage', [nii_path], lambda: sitk.GetArrayFromImage(sitk.ReadImage(nii_path)).sum()),
+            ('npy memmap, whole image', [npy_path], 
+                lambda: load_img_label(dataset_path, 'case_0000_0000.nii.gz')[0].sum()),
+            ('npy memmap, central crop', [npy_path], 
+                lambda: load_img_label(dataset_path, 'case_0000_0000.nii.gz')[0][crop].sum())]
+        print('Image of shape {}, {:.1f} MB compressed, {:.1f} MB uncompressed'.format(
+            tuple(args.shape), os.path.getsize(nii_path)/2**20, os.path.getsize(npy_path)/2**20))
+        for name, paths, fn in loaders:
+            cold = timed(fn, paths, cold=True, repeats=args.repeats)
+            warm = timed(fn, paths, cold=False, repeats=args.repeats)
+            print('{:>26}: cold {:.3f} s, warm {:.3f} s'.format(name, cold, warm))
+
+if __name__ == "__main__":
+    main()
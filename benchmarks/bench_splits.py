@@ -0,0 +1,63 @@
+#   Time of create_new_splits for growing numbers of synthetic cases, and a
+#   check that, for a fixed seed, the splits are the same as those of the
+#   previous implementation, which removed sampled cases with list lookups.
+#
+#   python -m benchmarks.bench_splits --sizes 1000 10000 100000
+
+import os
+import time
+import random
+import argparse
+import tempfile
+from ds_info.ds_division.define_new_splits import create_new_splits, get_cases_from_splits, distribute_total
+from benchmarks.synthetic import write_old_splits
+
+def legacy_val_cases(old_ordered_tasks, old_task_split_paths, new_task_ratios, nr_folds):
+    """Validation cases of each new task and fold, sampled as the previous 
+    version of create_new_splits did."""
+    new_val = [[[] for _ in range(nr_folds)] for _ in new_task_ratios[0]]
+    for task_ix, task in enumerate(old_ordered_tasks):
+        for fold_ix, fold_cases in enumerate(get_cases_from_splits(old_task_split_paths[task_ix])):
+            all_val_cases = list(fold_cases['val'])
+            nr_val_new_task = distribute_total(new_task_ratios[task_ix], len(all_val_cases))
+            for new_task_ix, new_cases_val in enumerate(nr_val_new_task):
+                new_val_cases = random.sample(all_val_cases, new_cases_val)
+                all_val_cases = [x for x in all_val_cases if x not in new_val_cases]
+                new_val[new_task_ix][fold_ix] += ['['+task+']'+case for case in new_val_cases]
+    return new_val
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument("--legacy-max-size", type=int, default=10000,
+        help="largest size for which the previous, quadratic implementation is run")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    old_tasks = ['TaskA', 'TaskB']
+    new_tasks = ['TaskN1', 'TaskN2', 'TaskN3']
+    ratios = [[0.5, 0.3, 0.2], [0.2, 0.3, 0.5]]
+    previous_time = None
+    for nr_cases in args.sizes:
+        with tempfile.TemporaryDirectory() as root:
+            old_paths = [os.path.join(root, task) for task in old_tasks]
+            new_paths = [os.path.join(root, task) for task in new_tasks]
+            for task, path in zip(old_tasks, old_paths):
+                write_old_splits(path, task, nr_cases // len(old_tasks))
+            random.seed(args.seed)
+            start = time.perf_counter()
+            create_new_splits(new_tasks, new_paths, old_tasks, old_paths, ratios)
+            elapsed = time.perf_counter() - start
+            scaling = '' if previous_time is None else ', x{:.1f} time'.format(elapsed / previous_time)
+            print('{:>7} cases: {:.3f} s{}'.format(nr_cases, elapsed, scaling))
+            previous_time = elapsed
+            if nr_cases <= args.legacy_max_size:
+                random.seed(args.seed)
+                start = time.perf_counter()
+                legacy = legacy_val_cases(old_tasks, old_paths, ratios, nr_folds=5)
+                legacy_time = time.perf_counter() - start
+                same = all(list(get_cases_from_splits(path)[fold_ix]['val']) == legacy[task_ix][fold_ix]
+                    for task_ix, path in enumerate(new_paths) for fold_ix in range(5))
+                print('{:>13} previous sampling alone: {:.3f} s, same splits: {}'.format('', legacy_time, same))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+#   End-to-end timings of feature extraction, clustering and split creation
+#   on a synthetic task, compared with stored baselines. Each benchmark is
+#   timed as the best of several repeats. The exit code is 1 if a benchmark
+#   is slower than its baseline by more than the threshold.
+#
+#   python -m benchmarks.run_benchmarks --cases 16 --shape 32 64 64 --fragments 50
+#   python -m benchmarks.run_benchmarks --save-baselines
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+from collections import OrderedDict
+from benchmarks.synthetic import write_synthetic_task, write_old_splits
+from ds_info.extract_stats_ds import extract_ds_stats
+from ds_info.clustering.cluster_ds import save_clustering, save_feature_clustering
+from ds_info.ds_division.define_new_splits import create_new_splits
+
+BASELINES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+
+def get_benchmarks(root, task_name, args):
+    """Functions timed by the benchmarks, by name."""
+    dataset_path = os.path.join(root, 'nnUNet_raw_data', task_name)
+    roi_size = [n // 2 for n in args.shape]
+    def splits():
+        old_tasks, new_tasks = ['TaskA', 'TaskB'], ['TaskN1', 'TaskN2', 'TaskN3']
+        old_paths = [os.path.join(root, 'splits', task) for task in old_tasks]
+        for task, path in zip(old_tasks, old_paths):
+            write_old_splits(path, task, args.split_cases // len(old_tasks))
+        random.seed(0)
+        return lambda: create_new_splits(new_tasks, [os.path.join(root, 'splits', task) for task in new_tasks],
+            old_tasks, old_paths, [[0.5, 0.3, 0.2], [0.2, 0.3, 0.5]])
+    return OrderedDict([
+        ('extract_serial', lambda: extract_ds_stats(dataset_path, img_mode=0)),
+        ('extract_parallel', lambda: extract_ds_stats(dataset_path, img_mode=0, workers=args.jobs)),
+        ('extract_metadata', lambda: extract_ds_stats(dataset_path, img_mode=0, metadata_only=True)),
+        ('cluster', lambda: save_clustering(os.path.join(root, 'clustering'), task_name, 2, 2, roi_size)),
+        ('cluster_parallel', lambda: save_clustering(os.path.join(root, 'clustering'), task_name, 2, 2,
+            roi_size, workers=args.jobs, dtype='float32')),
+        ('cluster_props_cached', lambda: save_feature_clustering(os.path.join(root, 'clustering'), task_name, 2, 2,
+            features='props', workers=args.jobs, cache_path=os.path.join(root, 'cache.sqlite'))),
+        ('cluster_thumbnails', lambda: save_feature_clustering(os.path.join(root, 'clustering'), task_name,
+            2, 2, features='thumbnails', workers=args.jobs)),
+        ('cluster_streaming', lambda: save_clustering(os.path.join(root, 'clustering'), task_name, 2, 2,
+            roi_size, streaming=True, batch_size=4)),
+        ('splits', splits()),
+    ])
+
+def config_key(args):
+    """Benchmarks are only compared with baselines of the same configuration."""
+    return 'cases={} shape={} modes={} labels={} fragments={} jobs={} split_cases={}'.format(
+        args.cases, 'x'.join(str(n) for n in args.shape), args.modes, args.labels,
+        args.fragments, args.jobs, args.split_cases)
+
+def best_time(fn, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cases", type=int, default=16)
+    parser.add_argument("--shape", type=int, nargs=3, default=[32, 64, 64])
+    parser.add_argument("--modes", type=int, default=1)
+    parser.add_argument("--labels", type=int, default=2)
+    parser.add_argument("--fragments", type=int, default=20, help="components per label")
+    parser.add_argument("--jobs", type=int, default=2)
+    parser.add_argument("--split-cases", type=int, default=100000)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--only", nargs='+', default=None, help="names of the benchmarks to run")
+    parser.add_argument("--baselines", default=BASELINES_PATH)
+    parser.add_argument("--threshold", type=float, default=0.25,
+        help="relative slowdown wrt. the baseline that counts as a regression")
+    parser.add_argument("--save-baselines", action="store_true")
+    args = parser.parse_args()
+    key = config_key(args)
+    baselines = dict()
+    if os.path.isfile(args.baselines):
+        with open(args.baselines, 'r') as json_file:
+            baselines = json.load(json_file)
+    config_baselines = baselines.get(key, dict())
+    regressions = []
+    with tempfile.TemporaryDirectory() as root:
+        task_name = 'Task900_Synthetic'
+        write_synthetic_task(os.path.join(root, 'nnUNet_raw_data', task_name), nr_cases=args.cases,
+            shape=tuple(args.shape), nr_modes=args.modes, nr_labels=args.labels, nr_fragments=args.fragments)
+        os.makedirs(os.path.join(root, 'clustering'))
+        os.environ['nnUNet_raw_data_base'] = root
+        print(key)
+        for name, fn in get_benchmarks(root, task_name, args).items():
+            if args.only is not None and name not in args.only:
+                continue
+            elapsed = best_time(fn, args.repeats)
+            line = '{:<20} {:>9.3f} s'.format(name, elapsed)
+            if name in config_baselines:
+                ratio = elapsed / config_baselines[name]
+                line += '  x{:.2f} baseline'.format(ratio)
+                if ratio > 1 + args.threshold:
+                    regressions.append(name)
+                    line += '  REGRESSION'
+            if args.save_baselines:
+                config_baselines[name] = elapsed
+            print(line)
+    if args.save_baselines:
+        baselines[key] = config_baselines
+        with open(args.baselines, 'w') as json_file:
+            json.dump(baselines, json_file, indent=1, sort_keys=True)
+        print('Baselines stored in {}'.format(args.baselines))
+    if regressions:
+        print('Regressions: {}'.format(', '.join(regressions)))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#   Synthetic tasks with the MSD structure, used by the benchmarks and the
+#   tests. Images have smooth CT-like intensities, and each foreground label
+#   is divided into a number of separate components, e.g. to mimic vessels
+#   or lesions. Splits of tasks are written as nnU-Net's splits_final.pkl
+#   files.
+
+import os
+import json
+import numpy as np
+import SimpleITK as sitk
+from collections import OrderedDict
+from ds_info.ds_division.define_new_splits import save_splits_from_cases
+
+def synthetic_label_map(shape, nr_labels=2, nr_fragments=1, rng=None):
+    """Label map where each label is a set of nr_fragments boxes. Boxes do
+    not touch, so each is a connected component. Labels overwrite those of
+    smaller values where they overlap, which can split a component.
+
+    Parameters:
+    shape (tuple(int)): shape of the label map
+    nr_labels (int): number of foreground labels
+    nr_fragments (int): boxes per label
+    rng (numpy.random.Generator): random generator
+
+    Returns:
+    numpy.ndarray: uint8 label map
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    y = np.zeros(shape, dtype=np.uint8)
+    for label in range(1, nr_labels+1):
+        # The volume of a label is about 5% of the image, in smaller boxes
+        # the more fragmented it is
+        box_shape = np.maximum(1, (np.array(shape) * (0.05 / nr_fragments)**(1/3)).astype(int))
+        for _ in range(nr_fragments):
+            # Starts on a grid of even coordinates and boxes with odd sizes,
+            # so that boxes of the same label do not touch
+            start = [2 * rng.integers(0, max(1, (n - b) // 2)) for n, b in zip(shape, box_shape)]
+            box = tuple(slice(s, s + b - (1 - b % 2)) for s, b in zip(start, box_shape))
+            y[box] = label
+    return y
+
+def synthetic_image(shape, mode=0, rng=None):
+    """int16 image with smooth intensities, which compress like real scans."""
+    rng = np.random.default_rng() if rng is None else rng
+    steps = rng.integers(-2, 3, size=shape, dtype=np.int16)
+    return (np.cumsum(steps, axis=-1, dtype=np.int16) - 1000 + 100*mode).astype(np.int16)
+
+def write_synthetic_task(dataset_path, nr_cases=8, shape=(32, 64, 64), nr_modes=1,
+    nr_labels=2, nr_fragments=1, spacing=(0.8, 0.8, 2.5), seed=0, shape_variation=0.1,
+    case_name_format='case_{:04d}', missing_labels=None):
+    """Writes a task with the MSD structure and its dataset.json. This is
+    also the task of the test fixtures.
+
+    Parameters:
+    shape_variation (float): case shapes are smaller than shape by up to
+        this fraction per axis
+    case_name_format (str): format of the case name, given the case index
+    missing_labels (dict(int -> lst(int)) or None): labels removed from the
+        label map of some cases, by case index
+
+    Returns:
+    lst(str): case names
+    """
+    rng = np.random.default_rng(seed)
+    for dir_name in ['imagesTr', 'labelsTr', 'imagesTs']:
+        os.makedirs(os.path.join(dataset_path, dir_name), exist_ok=True)
+    case_names = [case_name_format.format(case_ix) for case_ix in range(nr_cases)]
+    for case_ix, case_name in enumerate(case_names):
+        case_shape = tuple(int(n * rng.uniform(1 - shape_variation, 1.0)) for n in shape)
+        y = synthetic_label_map(case_shape, nr_labels, nr_fragments, rng=rng)
+        for label in (missing_labels or dict()).get(case_ix, []):
+            y[y == label] = 0
+        y_sitk = sitk.GetImageFromArray(y)
+        y_sitk.SetSpacing(spacing)
+        sitk.WriteImage(y_sitk, os.path.join(dataset_path, 'labelsTr', case_name+'.nii.gz'))
+        for mode in range(nr_modes):
+            x_sitk = sitk.GetImageFromArray(synthetic_image(case_shape, mode, rng=rng))
+            x_sitk.SetSpacing(spacing)
+            sitk.WriteImage(x_sitk, os.path.join(dataset_path, 'imagesTr',
+                '{}_{:04d}.nii.gz'.format(case_name, mode)))
+    labels = OrderedDict([('0', 'background')] + [(str(label), 'label{}'.format(label))
+        for label in range(1, nr_labels+1)])
+    with open(os.path.join(dataset_path, 'dataset.json'), 'w') as json_file:
+        json.dump({'name': os.path.basename(dataset_path),
+            'modality': {str(mode): 'MODE{}'.format(mode) for mode in range(nr_modes)},
+            'labels': labels, 'numTraining': nr_cases,
+            'training': [{'image': './imagesTr/{}.nii.gz'.format(case_name),
+                'label': './labelsTr/{}.nii.gz'.format(case_name)} for case_name in case_names]},
+            json_file, indent=1)
+    return case_names
+
+def write_old_splits(split_path, task_name, nr_cases, nr_folds=5):
+    """Splits of a task as created by nnU-Net: each case is a validation case
+    in exactly one fold and a training case in all others."""
+    cases = ['{}_{:06d}'.format(task_name, ix) for ix in range(nr_cases)]
+    folds = [cases[fold_ix::nr_folds] for fold_ix in range(nr_folds)]
+    splits = [OrderedDict([('train', [c for other_ix, fold in enumerate(folds) if other_ix != fold_ix for c in fold]),
+        ('val', folds[fold_ix])]) for fold_ix in range(nr_folds)]
+    save_splits_from_cases(split_path, splits)
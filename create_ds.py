@@ -1,52 +1,64 @@
 #   Create a new dataset in MSD format.
 
 import os
-import shutil
-import SimpleITK as sitk
 from ds_info.utils.io_utils import pkl_load
+from ds_info.utils.file_utils import index_case_files, transfer_files
 from nnunet.dataset_conversion.utils import generate_dataset_json
 from ds_info.ds_division.define_new_splits import create_new_splits, split_to_new_cases, get_cases_from_splits
 
 def create_ds_from_nnunet_dss(new_task_full_name, new_cases, 
-    label_names, mode_names):
+    label_names, mode_names, strategy='copy', workers=8, dry_run=False):
     """For several existing nnunet datasets, determine a subset of case names. 
     All these files are stored as a new 'task'. The names remain the same but 
     are prefaced by the old task name
 
     param new_cases: dict(<full task name> -> list(<case names>))
+    param strategy (str): how files are created, 'copy', 'hardlink', 'reflink'
+        (copy-on-write clone, copies where not supported) or 'symlink'
+    param workers (int): number of threads for copies
+    param dry_run (bool): only report the bytes that would be written
+    returns (int): number of bytes written
     """
-
-    # Create new directories
     store_path = os.path.join(os.environ['nnUNet_raw_data_base'], 'nnUNet_raw_data')
     dataset_path = os.path.join(store_path, new_task_full_name)
     new_img_path = os.path.join(dataset_path, 'imagesTr')
     test_img_path = os.path.join(dataset_path, 'imagesTs')
     new_labels_path = os.path.join(dataset_path, 'labelsTr')
+
+    # Select files from relevant cases, matching exact case names
+    file_pairs = []
+    for old_task, case_names in new_cases.items():
+        old_task_path = os.path.join(store_path, old_task)
+        for dir_name, new_dir_path, has_mode in [('labelsTr', new_labels_path, False), 
+            ('imagesTr', new_img_path, True)]:
+            old_dir_path = os.path.join(old_task_path, dir_name)
+            index = index_case_files(old_dir_path, has_mode=has_mode)
+            missing = [case_name for case_name in case_names if case_name not in index]
+            assert not missing, "Cases {} not in {}".format(missing, old_dir_path)
+            for case_name in case_names:
+                for file_name in index[case_name]:
+                    file_pairs.append((os.path.join(old_dir_path, file_name),
+                        os.path.join(new_dir_path, '['+old_task+']'+file_name)))
+
+    if dry_run:
+        nr_bytes = transfer_files(file_pairs, strategy=strategy, dry_run=True)
+        print('{}: {} files, {:.2f} GB would be written'.format(new_task_full_name, 
+            len(file_pairs), nr_bytes / 2**30))
+        return nr_bytes
+
+    # Create new directories
     os.mkdir(dataset_path)
     os.mkdir(new_img_path)
     os.mkdir(test_img_path)
     os.mkdir(new_labels_path)
 
-    # Copy files from relevant cases
-    for old_task, case_names in new_cases.items():
-        old_task_path = os.path.join(store_path, old_task)
-        old_img_path = os.path.join(old_task_path, 'imagesTr')
-        old_labels_path = os.path.join(old_task_path, 'labelsTr')
-        for file_name in [f for f in os.listdir(old_labels_path) if 
-            os.path.isfile(os.path.join(old_labels_path, f)) and 
-            any(case_name in f for case_name in case_names)]:
-            shutil.copyfile(os.path.join(old_labels_path, file_name),
-                os.path.join(new_labels_path, '['+old_task+']'+file_name))
-        for file_name in [f for f in os.listdir(old_img_path) if 
-            os.path.isfile(os.path.join(old_img_path, f)) and 
-            any(case_name in f for case_name in case_names)]:
-            shutil.copyfile(os.path.join(old_img_path, file_name),
-                os.path.join(new_img_path, '['+old_task+']'+file_name))
+    nr_bytes = transfer_files(file_pairs, strategy=strategy, workers=workers)
 
     # Generate json
     generate_dataset_json(output_file=os.path.join(dataset_path, 'dataset.json'),
         imagesTr_dir=new_img_path, imagesTs_dir=test_img_path, modalities=mode_names, 
         labels=label_names, dataset_name=new_task_full_name)
+    return nr_bytes
 
 def case_names_from_cluster(old_task, cluster_ix, cluster_name, cluster_path):
     clustering = pkl_load(name=cluster_name, path=cluster_path)
@@ -54,7 +66,7 @@ def case_names_from_cluster(old_task, cluster_ix, cluster_name, cluster_path):
     return ids
 
 def generate_joint_tasks(new_task_name, old_ordered_tasks, 
-    label_names, mode_names, nr_folds=5):
+    label_names, mode_names, nr_folds=5, seed=None):
     """From a list of task names, generate a new task joining that data, 
     maintaining previous splits.
     """
@@ -63,7 +75,7 @@ def generate_joint_tasks(new_task_name, old_ordered_tasks,
     old_task_split_paths = [os.path.join(os.environ['nnUNet_preprocessed'], task) for task in old_ordered_tasks]
     new_task_ratios = [[1] for old_task in old_ordered_tasks]
     create_new_splits([new_task_name], [new_task_split_path], old_ordered_tasks, 
-    old_task_split_paths, new_task_ratios, nr_folds=nr_folds)
+    old_task_split_paths, new_task_ratios, nr_folds=nr_folds, seed=seed)
     # From splits, change to new_cases format and generate new data
     store_path = os.path.join(os.environ['nnUNet_raw_data_base'], 'nnUNet_raw_data')
     new_cases = split_to_new_cases(get_cases_from_splits(new_task_split_path))
@@ -0,0 +1,93 @@
+#   Entry point of the ds_info command. Modules for each subcommand, and their
+#   dependencies, are only imported when that subcommand runs.
+#
+#   ds_info stats Task006_Lung ./stats -j 8
+#   ds_info cluster Task010_Colon ./clusters --streaming
+#   ds_info splits Task993_ColonNC3 Task091_ColonC1 Task092_ColonC2
+
+import os
+import argparse
+
+def run_stats(args):
+    from ds_info import extract_stats_ds
+    extract_stats_ds.run(args)
+
+def run_cluster(args):
+    import numpy as np
+    from ds_info.clustering.cluster_ds import roi_sizes, min_dims_dataset, save_clustering, plot_clustering
+    if args.features != 'crops':
+        from ds_info.clustering.cluster_ds import save_feature_clustering
+        clustering_name = save_feature_clustering(args.save_path, args.task, args.components, args.clusters,
+            features=args.features, thumbnail_size=args.thumbnail_size, workers=args.jobs, 
+            cache_path=args.cache)
+        if args.plot:
+            plot_clustering(args.save_path, clustering_name=clustering_name)
+        print('Saved clustering {}'.format(clustering_name))
+        return
+    roi_size = args.roi_size
+    if roi_size is None:
+        roi_size = roi_sizes[args.task] if args.task in roi_sizes else min_dims_dataset(args.task)
+    clustering_name = save_clustering(args.save_path, args.task, args.components, args.clusters, 
+        roi_size, streaming=args.streaming, batch_size=args.batch_size, downsample=args.downsample,
+        dtype=np.float32 if args.float32 else None, workers=args.jobs)
+    if args.plot:
+        plot_clustering(args.save_path, clustering_name=clustering_name)
+    print('Saved clustering {}'.format(clustering_name))
+
+def run_splits(args):
+    from ds_info.ds_division.define_new_splits import create_new_splits
+    # Join the old tasks into one new task, maintaining their splits
+    new_task_split_path = os.path.join(os.environ['nnUNet_preprocessed'], args.new_task)
+    old_task_split_paths = [os.path.join(os.environ['nnUNet_preprocessed'], task) for task in args.old_tasks]
+    create_new_splits([args.new_task], [new_task_split_path], args.old_tasks, 
+        old_task_split_paths, [[1] for _ in args.old_tasks], nr_folds=args.folds, seed=args.seed)
+
+def get_parser():
+    parser = argparse.ArgumentParser(prog='ds_info', 
+        description='Statistics, clusters and splits of datasets with the nnUNet structure.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    stats_parser = subparsers.add_parser('stats', help='extract the statistics of a task')
+    # Importing the stats module is cheap, its heavy dependencies are lazy
+    from ds_info.extract_stats_ds import add_arguments
+    add_arguments(stats_parser)
+    stats_parser.set_defaults(run=run_stats)
+
+    cluster_parser = subparsers.add_parser('cluster', help='cluster the subjects of a task')
+    cluster_parser.add_argument("task")
+    cluster_parser.add_argument("save_path")
+    cluster_parser.add_argument("--components", type=int, default=2)
+    cluster_parser.add_argument("--clusters", type=int, default=5)
+    cluster_parser.add_argument("--features", choices=['crops', 'props', 'thumbnails'], default='crops',
+        help="cluster on the voxels of center crops, on the extracted features of each case, or on thumbnails")
+    cluster_parser.add_argument("--thumbnail-size", type=int, nargs=3, default=[16, 32, 32])
+    cluster_parser.add_argument("--cache", default=None,
+        help="SQLite file where the features of --features props are cached, as for the stats command")
+    cluster_parser.add_argument("--roi-size", type=int, nargs=3, default=None,
+        help="size of the center crop, by default the smallest image size in the task")
+    cluster_parser.add_argument("--streaming", action="store_true",
+        help="use IncrementalPCA and MiniBatchKMeans, so memory does not grow with the task size")
+    cluster_parser.add_argument("--batch-size", type=int, default=32)
+    cluster_parser.add_argument("--downsample", type=int, default=1)
+    cluster_parser.add_argument("-j", "--jobs", type=int, default=1,
+        help="number of processes used to load the crops")
+    cluster_parser.add_argument("--float32", action="store_true",
+        help="store the crops as float32, halving the memory of float64 scans")
+    cluster_parser.add_argument("--plot", action="store_true")
+    cluster_parser.set_defaults(run=run_cluster)
+
+    splits_parser = subparsers.add_parser('splits', help='join the splits of several tasks into a new task')
+    splits_parser.add_argument("new_task")
+    splits_parser.add_argument("old_tasks", nargs='+')
+    splits_parser.add_argument("--folds", type=int, default=5)
+    splits_parser.add_argument("--seed", type=int, default=None,
+        help="seed for the splits, which are then only created again if their inputs change")
+    splits_parser.set_defaults(run=run_splits)
+    return parser
+
+def main():
+    args = get_parser().parse_args()
+    args.run(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+#   Cluster subjects within MSD ds. More specifically, create a cluster file.
+#   scikit-learn, pandas and seaborn are imported by the functions that use them.
+
+import os
+import tempfile
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from ds_info.utils.io_utils import pkl_dump, pkl_load, list_files, list_cases
+from ds_info.utils.io_utils import load_img_label, load_array, get_case_paths, get_img_label_paths, get_img_label_info
+from ds_info.utils.img_utils import center_crop, thumbnail
+from ds_info.feature_extraction.props_table import PropsTable
+from ds_info.feature_extraction.props_index import PropsIndex
+from tqdm import tqdm
+
+def min_dims_dataset(task_name):
+    min_x, min_y, min_z = 1e5, 1e5, 1e5
+    dataset_path = os.path.join(os.environ['nnUNet_raw_data_base'], 'nnUNet_raw_data', task_name)
+    file_names = list_files(dataset_path)
+    ending = '_000{}.nii.gz'.format('0')
+    file_names = [file_name for file_name in file_names if ending in file_name]
+    for file_name in tqdm(file_names):
+        # Only the header is read
+        x_info, _ = get_img_label_info(dataset_path, file_name)
+        shape = x_info.array_shape()
+        min_x, min_y, min_z = min(min_x, shape[0]), min(min_y, shape[1]), min(min_z, shape[2])
+    return min_x, min_y, min_z
+
+def center_roi(dataset_path, file_name, roi_size, downsample=1):
+    """Flattened center crop of an image, optionally downsampled by taking 
+    every downsample-th voxel along each axis."""
+    x, y, _ = load_img_label(dataset_path, file_name, img_mode=None) # Arg. is for slicing, do not use here
+    # The crop is a view, so flattening it is the only copy. For memory-mapped
+    # images, only the cropped region is read.
+    return np.ravel(center_crop(x, roi_size=roi_size, downsample=downsample))
+
+def case_center_roi(dataset_path, case_name, roi_size, downsample=1):
+    """Concatenated flattened center crops of the images of all modes of a 
+    case. The label map is not read."""
+    img_paths, _ = get_case_paths(dataset_path, case_name)
+    return np.concatenate([np.ravel(center_crop(load_array(dataset_path, img_path)[0], 
+        roi_size=roi_size, downsample=downsample)) for img_path in img_paths])
+
+def _subject_roi(dataset_path, name, roi_size, img_mode, downsample):
+    if img_mode is None:
+        return case_center_roi(dataset_path, name, roi_size, downsample=downsample)
+    return center_roi(dataset_path, name, roi_size, downsample=downsample)
+
+def _mode_file_names(dataset_path, img_mode):
+    """Image files of one mode and their case names, or if img_mode is None,
+    the case names, for which all modes are used."""
+    if img_mode is None:
+        case_names = list(list_cases(dataset_path).keys())
+        return case_names, case_names
+    file_names = list_files(dataset_path)
+    ending = '_000{}.nii.gz'.format(img_mode)
+    file_names = [file_name for file_name in file_names if ending in file_name]
+    ids = [file_name.replace(ending, '') for file_name in file_names]
+    return file_names, ids
+
+def _subject_thumbnail(dataset_path, name, thumbnail_size, img_mode):
+    """Flattened thumbnail of the image of a subject, or the concatenated
+    thumbnails of all modes of a case if img_mode is None."""
+    if img_mode is None:
+        img_paths, _ = get_case_paths(dataset_path, name)
+        return np.concatenate([np.ravel(thumbnail(load_array(dataset_path, img_path)[0], thumbnail_size))
+            for img_path in img_paths])
+    # The label map is not read
+    img_path, _ = get_img_label_paths(dataset_path, name)
+    return np.ravel(thumbnail(load_array(dataset_path, img_path)[0], thumbnail_size))
+
+def _fill_rows(args):
+    """Write the rows of some subjects into a memory-mapped matrix. Defined
+    at module level so it can be sent to worker processes."""
+    X_path, shape, dtype, start, row_fn, dataset_path, file_names, row_args = args
+    X = np.memmap(X_path, dtype=dtype, mode='r+', shape=shape)
+    for row, file_name in enumerate(file_names, start=start):
+        X[row] = row_fn(dataset_path, file_name, *row_args)
+    X.flush()
+    return len(file_names)
+
+def _subjects_matrix(dataset_path, file_names, row_fn, row_args, dtype=None, workers=None, 
+    memmap_path=None):
+    """Matrix with row_fn(dataset_path, file_name, *row_args) in the row of
+    each file, see center_roi_all_subjects."""
+    # The first row determines the number of features
+    first_row = row_fn(dataset_path, file_names[0], *row_args)
+    dtype = np.dtype(first_row.dtype if dtype is None else dtype)
+    shape = (len(file_names), first_row.size)
+    if memmap_path is None and (workers is None or workers <= 1):
+        X = np.empty(shape, dtype=dtype)
+        X[0] = first_row
+        for row, file_name in enumerate(tqdm(file_names[1:]), start=1):
+            X[row] = row_fn(dataset_path, file_name, *row_args)
+        return X
+    X_path = memmap_path
+    if memmap_path is None:
+        fd, X_path = tempfile.mkstemp(suffix='.dat')
+        os.close(fd)
+    X = np.memmap(X_path, dtype=dtype, mode='w+', shape=shape)
+    X[0] = first_row
+    # A few chunks of rows per worker balance the load
+    chunk_starts = list(range(1, len(file_names), max(1, len(file_names) // (max(1, workers or 1) * 4))))
+    tasks = [(X_path, shape, dtype, start, row_fn, dataset_path, file_names[start:end], row_args) 
+        for start, end in zip(chunk_starts, chunk_starts[1:] + [len(file_names)])]
+    if workers is None or workers <= 1:
+        for task in tqdm(tasks):
+            _fill_rows(task)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for _ in tqdm(executor.map(_fill_rows, tasks), total=len(tasks)):
+                pass
+    if memmap_path is None:
+        # The mapping stays valid after the file is removed, and its pages
+        # are freed with the matrix
+        os.remove(X_path)
+    return X
+
+def center_roi_all_subjects(task_name, roi_size, img_mode=0, downsample=1, dtype=None, 
+    workers=None, memmap_path=None):
+    """Matrix with the flattened center crop of each subject in a row. The
+    matrix is allocated once and each crop is written into its row. If workers
+    > 1, processes fill the rows of a memory-mapped file, so crops are not sent
+    between processes.
+
+    Parameters:
+    task_name (str): name of the task
+    roi_size (tuple(int)): size of the center crop
+    img_mode (int or None): mode of the images, all modes if None
+    downsample (int): take every downsample-th voxel along each axis
+    dtype (numpy.dtype or None): dtype of the matrix, e.g. np.float32 for 
+        scans stored as float64, by default that of the first crop
+    workers (int or None): number of processes, serial if None or 1
+    memmap_path (str or None): file of the memory-mapped matrix, which is
+        kept. If None, a temporary file is used with workers.
+
+    Returns:
+    (numpy.ndarray, lst(str)): matrix, memory-mapped if filled by workers, 
+        and ids of the subjects
+    """
+    dataset_path = os.path.join(os.environ['nnUNet_raw_data_base'], 'nnUNet_raw_data', task_name)
+    file_names, ids = _mode_file_names(dataset_path, img_mode)
+    X = _subjects_matrix(dataset_path, file_names, _subject_roi, (roi_size, img_mode, downsample), 
+        dtype=dtype, workers=workers, memmap_path=memmap_path)
+    return X, ids
+
+def thumbnails_all_subjects(task_name, thumbnail_size, img_mode=0, workers=None, memmap_path=None):
+    """Matrix with the flattened float32 thumbnail of each subject in a row.
+    Unlike center crops, thumbnails have the same size for images of any 
+    shape, so no crop size needs to be chosen for the task. Parameters are 
+    those of center_roi_all_subjects."""
+    dataset_path = os.path.join(os.environ['nnUNet_raw_data_base'], 'nnUNet_raw_data', task_name)
+    file_names, ids = _mode_file_names(dataset_path, img_mode)
+    X = _subjects_matrix(dataset_path, file_names, _subject_thumbnail, (thumbnail_size, img_mode), 
+        dtype=np.float32, workers=workers, memmap_path=memmap_path)
+    return X, ids
+
+def feature_matrix(props, keys=None):
+    """Standardised matrix of the features of each subject, e.g. as returned
+    by extract_ds_stats. Vector features, such as the spacing, have a column
+    for each entry. Each column has zero mean and unit standard deviation, 
+    and missing values are set to the mean.
+
+    Parameters:
+    props (dict(str -> OrderedDict(str -> Any)) or PropsTable): properties
+    keys (lst(str) or None): features used, by default all numeric features
+
+    Returns:
+    (numpy.ndarray, lst(str)): matrix and subject names
+    """
+    table = props if isinstance(props, PropsTable) else PropsTable.from_props(props)
+    if keys is None:
+        keys = [key for key in table.keys() if table[key].dtype.kind in 'biuf']
+    index = PropsIndex(table, keys, scale='std')
+    X = index.scaled_values - np.nanmean(index.scaled_values, axis=0)
+    X[np.isnan(X)] = 0.0
+    return X, list(index.subjects)
+
+def center_roi_batches(task_name, roi_size, batch_size, img_mode=0, downsample=1):
+    """Yields the center crops of all subjects in batches, each with between
+    batch_size and 2*batch_size-1 subjects, so that only one batch is kept in
+    memory. The order of the subjects is the same as for center_roi_all_subjects.
+    """
+    dataset_path = os.path.join(os.environ['nnUNet_raw_data_base'], 'nnUNet_raw_data', task_name)
+    file_names, _ = _mode_file_names(dataset_path, img_mode)
+    nr_batches = max(1, len(file_names) // batch_size)
+    for batch_file_names in tqdm(np.array_split(file_names, nr_batches)):
+        yield np.array([_subject_roi(dataset_path, file_name, roi_size, img_mode, downsample)
+            for file_name in batch_file_names])
+
+def incremental_pca(task_name, roi_size, nr_components=1, batch_size=32, img_mode=0, downsample=1):
+    """PCA fitted batch by batch with IncrementalPCA, so the full data matrix
+    is never in memory. The data is read twice: for fitting and transforming.
+    """
+    # Each partial fit needs at least as many samples as components
+    assert batch_size >= nr_components
+    dataset_path = os.path.join(os.environ['nnUNet_raw_data_base'], 'nnUNet_raw_data', task_name)
+    _, ids = _mode_file_names(dataset_path, img_mode)
+    from sklearn.decomposition import IncrementalPCA
+    pca = IncrementalPCA(n_components=nr_components)
+    for X_batch in center_roi_batches(task_name, roi_size, batch_size, img_mode=img_mode, downsample=downsample):
+        pca.partial_fit(X_batch)
+    print("{} samples with {} features each".format(pca.n_samples_seen_, pca.n_features_in_))
+    print("Explained variance ratio: {}".format(pca.explained_variance_ratio_))
+    X = np.concatenate([pca.transform(X_batch) for X_batch in 
+        center_roi_batches(task_name, roi_size, batch_size, img_mode=img_mode, downsample=downsample)])
+    return X, pca.explained_variance_ratio_, ids
+
+def pca(X, nr_components=1):
+    from sklearn.decomposition import PCA
+    pca = PCA(n_components=nr_components)
+    pca.fit(X)
+    print("{} samples with {} features each".format(pca.n_samples_, pca.n_features_in_))
+    print("Explained variance ratio: {}".format(pca.explained_variance_ratio_))
+    X = pca.transform(X)
+    return X, pca.explained_variance_ratio_
+
+def plot_clusters(X, labels, file_path, file_name):
+    import pandas as pd
+    import seaborn as sns
+    sns.set_style("whitegrid")
+    df = pd.DataFrame(X, columns=["x", "y"])
+    color_palette = {0: "#4059AD", 1: "#F48942", 2: "#97D8C4", 3: "#F4B942", 4: "#EFF2F1", 5: "#6B9AC4"}
+    df["cluster"] = labels
+    plot = sns.scatterplot(data=df, x="x", y="y", hue=df["cluster"], palette=color_palette)
+    plot.figure.savefig(os.path.join(file_path, "{}.png".format(file_name)))
+
+def save_clustering(root_path, task_name, nr_components, nr_clusters, roi_size, 
+    streaming=False, batch_size=32, downsample=1, img_mode=0, dtype=None, workers=None):
+    """Clusters the center crops of all subjects and stores the clustering. If
+    streaming, the crops are fed in batches to IncrementalPCA and the projected
+    data is clustered with MiniBatchKMeans, so memory use does not grow with 
+    the number of subjects. If img_mode is None, the crops of all modes of
+    each case are concatenated, and ids are case names. Otherwise, the crops
+    are loaded by workers processes into a matrix of the given dtype, see
+    center_roi_all_subjects.
+    """
+    clustering_name = "{}_{}_{}_{}".format(task_name, nr_components, nr_clusters, "-".join([str(x) for x in roi_size]))
+    if downsample > 1:
+        clustering_name += "_ds{}".format(downsample)
+    if img_mode is None:
+        clustering_name += "_all-modes"
+    from sklearn.cluster import k_means, MiniBatchKMeans
+    if streaming:
+        X, explained_variance_ratio, ids = incremental_pca(task_name, roi_size, nr_components, 
+            batch_size=batch_size, img_mode=img_mode, downsample=downsample)
+        print('PCA done')
+        kmeans = MiniBatchKMeans(n_clusters=nr_clusters, batch_size=batch_size).fit(X)
+        centers, labels, sum_sq_dist = kmeans.cluster_centers_, kmeans.labels_, kmeans.inertia_
+        print('K-means done')
+    else:
+        X, ids = center_roi_all_subjects(task_name, roi_size, img_mode=img_mode, downsample=downsample,
+            dtype=dtype, workers=workers)
+        print('Data is prepared')
+        X, explained_variance_ratio = pca(X, nr_components)
+        print('PCA done')
+        centers, labels, sum_sq_dist = k_means(X, nr_clusters)
+        print('K-means done')
+    clustering = {'X': X, 'centers': centers, 'labels': labels, 'sum_sq_dist': sum_sq_dist, 'ids': ids, 'explained_variance_ratio': explained_variance_ratio}
+    pkl_dump(clustering, clustering_name, path=root_path)
+    return clustering_name
+
+def save_feature_clustering(root_path, task_name, nr_components, nr_clusters, features='props',
+    keys=None, thumbnail_size=(16, 32, 32), img_mode=None, workers=None, cache_path=None, props=None):
+    """Clusters the subjects on extracted features rather than on the voxels
+    of a center crop, and stores the clustering with the same entries as
+    save_clustering. The standardised features are projected with PCA and
+    clustered with k-means.
+
+    Parameters:
+    root_path (str): directory where the clustering is stored
+    task_name (str): name of the task
+    nr_components (int): PCA components
+    nr_clusters (int): number of clusters
+    features (str): 'props' for the features of extract_ds_stats, extracted
+        by case so that ids are case names, or 'thumbnails' for fixed-size
+        thumbnails of the images
+    keys (lst(str) or None): features used with 'props', all numeric if None
+    thumbnail_size (tuple(int)): size of the thumbnails
+    img_mode (int or None): mode of the thumbnails, all modes if None
+    workers (int or None): number of processes
+    cache_path (str or None): optional feature cache of extract_ds_stats
+    props (dict or PropsTable or None): features extracted by case, e.g. 
+        stored in an earlier run, which are then not extracted again
+
+    Returns:
+    str: name of the clustering
+    """
+    assert features in ['props', 'thumbnails']
+    dataset_path = os.path.join(os.environ['nnUNet_raw_data_base'], 'nnUNet_raw_data', task_name)
+    if features == 'props':
+        # Imported here, as the extraction module imports the whole pipeline
+        from ds_info.extract_stats_ds import extract_ds_stats
+        clustering_name = "{}_{}_{}_props".format(task_name, nr_components, nr_clusters)
+        if props is None:
+            props = extract_ds_stats(dataset_path, workers=workers, cache_path=cache_path, 
+                as_table=True, by_case=True)
+        X, ids = feature_matrix(props, keys=keys)
+    else:
+        clustering_name = "{}_{}_{}_thumbnails-{}".format(task_name, nr_components, nr_clusters, 
+            "-".join([str(x) for x in thumbnail_size]))
+        if img_mode is None:
+            clustering_name += "_all-modes"
+        X, ids = thumbnails_all_subjects(task_name, thumbnail_size, img_mode=img_mode, workers=workers)
+        X = (X - X.mean(axis=0)) / np.where(X.std(axis=0) > 0, X.std(axis=0), 1)
+    print('Data is prepared')
+    from sklearn.cluster import k_means
+    X, explained_variance_ratio = pca(X, nr_components)
+    print('PCA done')
+    centers, labels, sum_sq_dist = k_means(X, nr_clusters)
+    print('K-means done')
+    clustering = {'X': X, 'centers': centers, 'labels': labels, 'sum_sq_dist': sum_sq_dist, 'ids': ids, 'explained_variance_ratio': explained_variance_ratio}
+    pkl_dump(clustering, clustering_name, path=root_path)
+    return clustering_name
+
+def plot_clustering(root_path, clustering=None, clustering_name=None):
+    if clustering is None:
+        clustering = pkl_load(name=clustering_name, path=root_path)
+    plot_clusters(clustering['X'], clustering['labels'], file_path=root_path, file_name=clustering_name)
+
+def print_cluster_statistics(root_path, clustering_name, nr_clusters):
+    clustering = pkl_load(name=clustering_name, path=root_path)
+    # How far away is each cluster to the rest of the other clusters?
+    X, labels, explained_variance_ratio = clustering['X'], clustering['labels'], clustering['explained_variance_ratio']
+    print('Explained variance ratio: {}'.format(explained_variance_ratio))
+    for cluster_ix in range(nr_clusters):
+        in_cluster = [x for cl_ix, x in zip(labels, X) if cl_ix==cluster_ix]
+        outside_cluster = [x for cl_ix, x in zip(labels, X) if cl_ix!=cluster_ix]
+        print('Cluster {} inside {} outside {}'.format(cluster_ix, len(in_cluster), len(outside_cluster)))
+        in_mean = np.mean([x[0] for x in in_cluster])
+        out_mean = np.mean([x[0] for x in outside_cluster])
+        distance_in_in = np.mean([abs(x[0] - in_mean) for x in in_cluster])
+        distance_in_out = np.mean([abs(x[0] - out_mean) for x in in_cluster])
+        distance_out_out = np.mean([abs(x[0] - out_mean) for x in outside_cluster])
+        distance_out_in = np.mean([abs(x[0] - in_mean) for x in outside_cluster])
+        print('Distance IN-IN {} IN-OUT {} OUT-OUT {} OUT-IN {}'.format(distance_in_in, distance_in_out, distance_out_out, distance_out_in))
+
+# Obtained with min_dims_dataset
+roi_sizes = {'Task001_BrainTumour': (155, 240, 240), 'Task006_Lung': (112, 512, 512), 'Task007_Pancreas': (37, 512, 512), 'Task008_HepaticVessel': (24, 512, 512), 'Task010_Colon': (37, 512, 512)}
@@ -5,6 +5,8 @@ import math
 import numpy as np
 import pickle
 import random
+import json
+import hashlib
 from collections import OrderedDict
 
 def save_splits_from_cases(save_path, new_splits):
@@ -48,8 +50,108 @@ def distribute_total(ratios, total_nr):
             dist_total[ratios.index(ratio)] -= 1
     return dist_total
 
+def get_rng(seed=None):
+    """Random number generator for the split creators.
+
+    param seed (None, int, random.Random or numpy.random.Generator): None uses
+        the global state of the random module, an int seeds a random.Random
+    returns (random.Random, numpy.random.Generator or module): the generator
+    """
+    if seed is None:
+        return random
+    if isinstance(seed, (random.Random, np.random.Generator)):
+        return seed
+    return random.Random(int(seed))
+
+def sample_disjoint(cases, sizes, rng=random):
+    """Randomly distributes cases into disjoint subsets of the given sizes.
+    With a numpy Generator, the subsets are consecutive slices of a random 
+    permutation. Otherwise, each subset is sampled with rng.sample from the 
+    remaining cases, which are filtered with a set so this is linear in the 
+    number of cases.
+
+    param cases (list): cases to distribute
+    param sizes (list(int)): size of each subset, adding to at most len(cases)
+    param rng (random.Random, numpy.random.Generator or module): see get_rng
+    returns (list(list)): a subset for each size
+    """
+    if isinstance(rng, np.random.Generator):
+        permutation = rng.permutation(len(cases))
+        ends = np.cumsum(sizes)
+        return [[cases[ix] for ix in permutation[end-size:end]] for size, end in zip(sizes, ends)]
+    remaining_cases = list(cases)
+    subsets = []
+    for size in sizes:
+        subset = rng.sample(remaining_cases, size)
+        subset_set = set(subset)
+        remaining_cases = [x for x in remaining_cases if x not in subset_set]
+        subsets.append(subset)
+    return subsets
+
+def set_train_from_val(task_splits):
+    """Sets the training cases of each fold to the validation cases of all
+    other folds.
+
+    param task_splits (list(OrderedDict)): 'train' and 'val' cases per fold
+    """
+    for fold_ix in range(len(task_splits)):
+        for fold_ix_val in range(len(task_splits)):
+            if fold_ix != fold_ix_val:
+                task_splits[fold_ix]['train'] += task_splits[fold_ix_val]['val']
+
+def assert_split_integrity(new_task_splits, nr_folds):
+    """Checks with sets that, for each fold, different tasks do not share 
+    training cases and no case is both a training and validation case.
+
+    param new_task_splits (dict): for each task, 'train' and 'val' cases per fold
+    """
+    for fold_ix in range(nr_folds):
+        # For the same split, different tasks should not share training samples
+        all_train_samples = set()
+        for task_splits in new_task_splits.values():
+            new_train_samples = set(task_splits[fold_ix]['train'])
+            assert all_train_samples.isdisjoint(new_train_samples)
+            all_train_samples |= new_train_samples
+            # For no fold should a sample be in the train and val split
+            assert new_train_samples.isdisjoint(task_splits[fold_ix]['val'])
+
+def _file_hash(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def _manifest_inputs(creator, seed, old_task_split_paths, **inputs):
+    """Everything that determines the new splits, in json format. Seeds that
+    are not ints cannot be recorded, and are stored as None."""
+    inputs['creator'] = creator
+    inputs['seed'] = int(seed) if isinstance(seed, (int, np.integer)) else None
+    inputs['input_split_hashes'] = [_file_hash(os.path.join(path, 'splits_final.pkl')) 
+        for path in old_task_split_paths]
+    return json.loads(json.dumps(inputs))
+
+def _splits_up_to_date(new_task_split_paths, inputs):
+    """Whether all new splits exist and were created from the same inputs, 
+    with a recorded seed."""
+    if inputs['creator'] != 'create_new_splits_by_attribute' and inputs['seed'] is None:
+        return False
+    for path in new_task_split_paths:
+        manifest_path = os.path.join(path, 'splits_manifest.json')
+        if not (os.path.isfile(manifest_path) and os.path.isfile(os.path.join(path, 'splits_final.pkl'))):
+            return False
+        with open(manifest_path, 'r') as json_file:
+            if json.load(json_file)['inputs'] != inputs:
+                return False
+    return True
+
+def save_splits_manifest(save_path, inputs, new_splits):
+    """Saves the inputs and case counts of the splits next to splits_final.pkl,
+    so unchanged splits are not created again."""
+    manifest = {'inputs': inputs, 'case_counts': [{'train': len(fold_splits['train']), 
+        'val': len(fold_splits['val'])} for fold_splits in new_splits]}
+    with open(os.path.join(save_path, 'splits_manifest.json'), 'w') as json_file:
+        json.dump(manifest, json_file, indent=2)
+
 def create_new_splits(new_task_names, new_task_split_paths, old_ordered_tasks, 
-    old_task_split_paths, new_task_ratios, nr_folds=5):
+    old_task_split_paths, new_task_ratios, nr_folds=5, seed=None):
     """Creates new split files by distributing old cases into new tasks. Saves
     these new splits in the specified directories. Note that in the splits, 
     the case name is preceded by [old task name] to show where the case came from.
@@ -62,9 +164,19 @@ def create_new_splits(new_task_names, new_task_split_paths, old_ordered_tasks,
         where splits_final.pkl files are stored
     param new_task_ratios: for each old task, what raio of cases will be part of 
         each of the new tasks?
+    param seed (None, int, random.Random or numpy.random.Generator): see 
+        get_rng. With an int seed, the splits are not created again if a 
+        manifest shows they were created from the same inputs.
     """
     assert len(old_ordered_tasks) == len(old_task_split_paths) == len(new_task_ratios)
     assert len(new_task_names) == len(new_task_split_paths) == len(new_task_ratios[0])
+    inputs = _manifest_inputs('create_new_splits', seed, old_task_split_paths, 
+        new_task_names=new_task_names, old_tasks=old_ordered_tasks, 
+        ratios=new_task_ratios, nr_folds=nr_folds)
+    if _splits_up_to_date(new_task_split_paths, inputs):
+        print('Splits for {} are up to date'.format(', '.join(new_task_names)))
+        return
+    rng = get_rng(seed)
 
     new_task_splits = {new_task: [OrderedDict([('train', []), ('val', [])]) 
         for _ in range(nr_folds)] for new_task in new_task_names}
@@ -82,39 +194,26 @@ def create_new_splits(new_task_names, new_task_split_paths, old_ordered_tasks,
             # For each new task, select a subset of cases and remove from 
             # the array where remaining cases are stored. These are distributed
             # among all new tasks.
-            for new_task_ix, new_cases_val in enumerate(nr_val_new_task):
-                new_val_cases = random.sample(all_val_cases, new_cases_val)
-                all_val_cases = [x for x in all_val_cases if x not in new_val_cases]
+            for new_task_ix, new_val_cases in enumerate(sample_disjoint(all_val_cases, nr_val_new_task, rng=rng)):
                 # Add new task precedence
                 new_val_cases = ['['+task+']'+case for case in new_val_cases]
                 new_task_splits[new_task_names[new_task_ix]][fold_ix]['val'] += new_val_cases
         
     # Now set the training cases for each fold
     for new_task in new_task_names:
-        for fold_ix in range(nr_folds):
-            for fold_ix_val in range(nr_folds):
-                if fold_ix != fold_ix_val:
-                    new_task_splits[new_task][fold_ix]['train'] += new_task_splits[new_task][fold_ix_val]['val']
+        set_train_from_val(new_task_splits[new_task])
 
-    # Assert split integrity
-    for fold_ix in range(nr_folds):
-        # For the same split, different tasks should not share training samples
-        all_train_samples = []
-        for new_task in new_task_names:
-            new_train_samples = new_task_splits[new_task][fold_ix]['train']
-            assert not any(x in all_train_samples for x in new_train_samples)
-            all_train_samples += new_train_samples
-            # For no fold should a sample be in the train and val split
-            assert not any(x in new_train_samples for x in new_task_splits[new_task][fold_ix]['val'])
+    assert_split_integrity(new_task_splits, nr_folds)
 
     # Create splits_final and save for each task
     for new_task_name, new_task_split_path in zip(new_task_names, new_task_split_paths):
         if not os.path.exists(new_task_split_path):
             os.makedirs(new_task_split_path)
         save_splits_from_cases(new_task_split_path, new_task_splits[new_task_name])
+        save_splits_manifest(new_task_split_path, inputs, new_task_splits[new_task_name])
 
 def create_splits_from_splits(new_task_names, new_task_split_paths, old_task, 
-    old_task_split_path, nr_folds=5):
+    old_task_split_path, nr_folds=5, seed=None):
     """Creates new split files by distributing ald cases into new tasks. Saves
     these new splits in the specified directories. Note that in the splits, 
     the case name is preceded by [old task name] to show where the case came from.
@@ -124,7 +223,15 @@ def create_splits_from_splits(new_task_names, new_task_split_paths, old_task,
         split files will be stored. If these don't exist, they are created
     param old_tasks (str): old task name
     param old_task_split_path (str): path to old task split
+    param seed (None, int, random.Random or numpy.random.Generator): see 
+        create_new_splits
     """
+    inputs = _manifest_inputs('create_splits_from_splits', seed, [old_task_split_path], 
+        new_task_names=new_task_names, old_tasks=[old_task], nr_folds=nr_folds)
+    if _splits_up_to_date(new_task_split_paths, inputs):
+        print('Splits for {} are up to date'.format(', '.join(new_task_names)))
+        return
+    rng = get_rng(seed)
     new_task_splits = {new_task: [OrderedDict([('train', []), ('val', [])]) 
         for _ in range(nr_folds)] for new_task in new_task_names}
     per_fold_split_cases = get_cases_from_splits(old_task_split_path)
@@ -135,33 +242,20 @@ def create_splits_from_splits(new_task_names, new_task_split_paths, old_task,
         all_val_cases = list(fold_cases['val'])
         # How many case on each new fold?
         nr_val_new_task = distribute_total([1/nr_folds for _ in range(nr_folds)], len(all_val_cases))
-        for fold_ix, new_cases_val in enumerate(nr_val_new_task):
-            new_val_cases = random.sample(all_val_cases, new_cases_val)
-            all_val_cases = [x for x in all_val_cases if x not in new_val_cases]
+        for fold_ix, new_val_cases in enumerate(sample_disjoint(all_val_cases, nr_val_new_task, rng=rng)):
             new_val_cases = ['['+old_task+']'+case for case in new_val_cases]
             new_task_splits[new_task_name][fold_ix]['val'] += new_val_cases
 
     # Now set the training cases for each fold
     for new_task in new_task_names:
-        for fold_ix in range(nr_folds):
-            for fold_ix_val in range(nr_folds):
-                if fold_ix != fold_ix_val:
-                    new_task_splits[new_task][fold_ix]['train'] += new_task_splits[new_task][fold_ix_val]['val']
+        set_train_from_val(new_task_splits[new_task])
 
-    # Assert split integrity
-    for fold_ix in range(nr_folds):
-        # For the same split, different tasks should not share training samples
-        all_train_samples = []
-        for new_task in new_task_names:
-            new_train_samples = new_task_splits[new_task][fold_ix]['train']
-            assert not any(x in all_train_samples for x in new_train_samples)
-            all_train_samples += new_train_samples
-            # For no fold should a sample be in the train and val split
-            assert not any(x in new_train_samples for x in new_task_splits[new_task][fold_ix]['val'])
+    assert_split_integrity(new_task_splits, nr_folds)
 
     # Create splits_final and save for each task
     for new_task_name, new_task_split_path in zip(new_task_names, new_task_split_paths):
         save_splits_from_cases(new_task_split_path, new_task_splits[new_task_name])
+        save_splits_manifest(new_task_split_path, inputs, new_task_splits[new_task_name])
 
 def create_new_splits_by_attribute(new_task_names, new_task_split_paths, old_task, 
     old_task_split_path, old_task_info, info_key, boundaries, nr_folds=5):
@@ -177,7 +271,19 @@ def create_new_splits_by_attribute(new_task_names, new_task_split_paths, old_tas
     param info_key: the property that is considered
     param boundaries: the values that will divide the instance + an upped bound,
         or string values if working with categorical data.
+
+    The splits are deterministic, so they are not created again if a manifest
+    shows they were created from the same inputs.
     """
+    per_fold_split_cases = get_cases_from_splits(old_task_split_path)
+    all_cases = sorted(set(c for fold_cases in per_fold_split_cases for c in fold_cases['val']))
+    info_hash = hashlib.sha256(repr([(c, old_task_info[c][info_key]) for c in all_cases]).encode()).hexdigest()
+    inputs = _manifest_inputs('create_new_splits_by_attribute', None, [old_task_split_path], 
+        new_task_names=new_task_names, old_tasks=[old_task], info_key=info_key, 
+        info_hash=info_hash, boundaries=list(boundaries), nr_folds=nr_folds)
+    if _splits_up_to_date(new_task_split_paths, inputs):
+        print('Splits for {} are up to date'.format(', '.join(new_task_names)))
+        return
     categorical = False
     if isinstance(boundaries[0], str):
         assert len(new_task_names) == len(new_task_split_paths) == len(boundaries)
@@ -188,7 +294,6 @@ def create_new_splits_by_attribute(new_task_names, new_task_split_paths, old_tas
     new_task_splits = {new_task: [OrderedDict([('train', []), ('val', [])]) 
         for _ in range(nr_folds)] for new_task in new_task_names}
 
-    per_fold_split_cases = get_cases_from_splits(old_task_split_path)
     assert nr_folds == len(per_fold_split_cases)
     for fold_ix, fold_cases in enumerate(per_fold_split_cases):
         all_train_cases = list(fold_cases['train'])
@@ -208,20 +313,12 @@ def create_new_splits_by_attribute(new_task_names, new_task_split_paths, old_tas
             new_task_splits[new_task][fold_ix]['train'] = train_cases
             new_task_splits[new_task][fold_ix]['val'] = val_cases
 
-    # Assert split integrity
-    for fold_ix in range(nr_folds):
-        # For the same split, different tasks should not share training samples
-        all_train_samples = []
-        for new_task in new_task_names:
-            new_train_samples = new_task_splits[new_task][fold_ix]['train']
-            assert not any(x in all_train_samples for x in new_train_samples)
-            all_train_samples += new_train_samples
-            # For no fold should a sample be in the train and val split
-            assert not any(x in new_train_samples for x in new_task_splits[new_task][fold_ix]['val'])
+    assert_split_integrity(new_task_splits, nr_folds)
 
     # Create splits_final and save for each task
     for new_task_name, new_task_split_path in zip(new_task_names, new_task_split_paths):
         save_splits_from_cases(new_task_split_path, new_task_splits[new_task_name])
+        save_splits_manifest(new_task_split_path, inputs, new_task_splits[new_task_name])
 
 
 def split_to_new_cases(splits):
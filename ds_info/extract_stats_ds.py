@@ -1,56 +1,432 @@
 #   Extract statistics of a dataset with the MSD format.
 
-import os, argparse
-from ds_info.utils.io_utils import list_files
-from ds_info.utils.format_utils import zeros_in_format
-from ds_info.feature_extraction.feature_combinations import reduced_features, props_mean_std
-from ds_info.visualization.plots import props_to_pandas
+import os, argparse, contextlib
+from concurrent.futures import ProcessPoolExecutor
+from ds_info.utils.io_utils import list_files, list_cases, get_img_label_paths, get_case_paths, save_json, load_json, convert_ds_to_npy
+from ds_info.utils.cache_utils import FeatureCache, feature_set_version
+from ds_info.utils.format_utils import props_schema, fill_missing_props
+from ds_info.utils.record_utils import RecordWriter, read_records, read_header
+from ds_info.utils import profiling
+from ds_info.feature_extraction.feature_combinations import reduced_features, case_features, metadata_features, props_mean_std
+from ds_info.feature_extraction.chunked_features import chunked_reduced_features
+from ds_info.feature_extraction.props_table import PropsTable
+from ds_info.feature_extraction.intensity_stats import IntensityAccumulator
 
 import time
 from tqdm import tqdm
 
-def extract_ds_stats(dataset_path, img_mode = None, case_names=None):
-    # Extract properties for each subject
-    if case_names is None:
-        # All cases
-        file_names = list_files(dataset_path)
+def _case_features(args):
+    """Extract the features of one case. Defined at module level so it can be
+    sent to worker processes."""
+    feature_fn, dataset_path, file_name, feature_kwargs = args
+    with profiling.case(file_name.split('.')[0]):
+        return feature_fn(dataset_path, file_name, **feature_kwargs)
+
+def _discard_inherited_records():
+    """Clear the profiling records that a forked worker process inherits 
+    from the parent, so that they are not returned again with its own."""
+    profiling.pop_records()
+
+def _profiled_case_features(args):
+    """Extract the features of one case in a worker process with profiling
+    enabled, and return the profiling records with them."""
+    track_memory, args = args
+    if not profiling.is_enabled():
+        profiling.enable(track_memory=track_memory)
+    case_props = _case_features(args)
+    return case_props, profiling.pop_records()
+
+def _map_cases(feature_fn, dataset_path, file_names, feature_kwargs, workers=None, chunksize=None):
+    """Yields the features of each file, in the same order as file_names. If
+    workers > 1, cases are distributed in chunks among a pool of processes."""
+    tasks = [(feature_fn, dataset_path, file_name, feature_kwargs) for file_name in file_names]
+    if workers is None or workers <= 1:
+        for task in tasks:
+            yield _case_features(task)
     else:
-        file_names = ["{}.nii.gz".format(n) for n in case_names]
-    props = dict()
-    all_props_rep = dict()
-    for file_name in tqdm(file_names):
-        subject_name = file_name.split('.')[0]
-        props[subject_name] = reduced_features(dataset_path, file_name, img_mode=img_mode)
-        for key, value in props[subject_name].items():
-            all_props_rep[key] = value
-    # Check that all prop. are extracted for all subjects, and fill. This is 
+        if chunksize is None:
+            # A few chunks per worker balances the load without paying the
+            # inter-process overhead for every case
+            chunksize = max(1, len(tasks) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_discard_inherited_records) as executor:
+            # Results are returned in submission order
+            if profiling.is_enabled():
+                tasks = [(profiling.memory_tracked(), task) for task in tasks]
+                for case_props, records in executor.map(_profiled_case_features, tasks, chunksize=chunksize):
+                    profiling.extend_records(records)
+                    yield case_props
+            else:
+                for case_props in executor.map(_case_features, tasks, chunksize=chunksize):
+                    yield case_props
+
+def _subjects(dataset_path, case_names=None, metadata_only=False, by_case=False):
+    """Subject names, the file name passed to the feature function for each
+    subject, and a function that returns the paths of the files of a subject,
+    by index."""
+    if by_case:
+        cases = list_cases(dataset_path)
+        subject_names = list(cases.keys()) if case_names is None else list(case_names)
+        # Metadata is read from the header of the first mode
+        file_names = [cases[n][0] for n in subject_names] if metadata_only else subject_names
+        def file_paths(ix):
+            img_paths, label_path = get_case_paths(dataset_path, subject_names[ix], cases=cases)
+            return img_paths + [label_path]
+    else:
+        if case_names is None:
+            # All cases
+            file_names = list_files(dataset_path)
+        else:
+            file_names = ["{}.nii.gz".format(n) for n in case_names]
+        subject_names = [file_name.split('.')[0] for file_name in file_names]
+        def file_paths(ix):
+            return get_img_label_paths(dataset_path, file_names[ix])
+    return subject_names, file_names, file_paths
+
+def _check_options(by_case=False, memory_limit=None, metadata_only=False, histograms=False):
+    """Raise a ValueError for options of extract_ds_stats that cannot be 
+    combined, before any file is read or written."""
+    if by_case and memory_limit is not None:
+        raise ValueError("A memory limit is not supported when extracting by case, as all modes of "
+            "a case are read at once")
+    if histograms and (metadata_only or by_case):
+        raise ValueError("Label histograms are only stored when extracting by file, as they are not "
+            "computed with the metadata only or by case")
+
+def iter_ds_stats(dataset_path, img_mode=None, case_names=None, workers=None, chunksize=None,
+    cache_path=None, metadata_only=False, intensity_stats=False, by_case=False, memory_limit=None, 
+    histogram_writer=None, histogram_bin_width=1.0, skip=()):
+    """Yields the properties of each subject as soon as they are available:
+    first those of cached subjects, and then those extracted, in the order
+    of the subjects. Properties of labels missing in a subject are not 
+    filled, see fill_missing_props. Parameters are those of extract_ds_stats.
+
+    Parameters:
+    histogram_writer (RecordWriter or None): if given, the LabelHistogram
+        of each subject is written to it as (subject name, LabelHistogram)
+    histogram_bin_width (float): bin width of the label histograms
+    skip (collection(str)): subjects that are not extracted, e.g. because
+        they were stored in an earlier run
+
+    Yields:
+    (str, OrderedDict(str -> Any), Any): subject name, properties and, if 
+        intensity_stats, the intensity statistics of the subject, else None
+    """
+    _check_options(by_case=by_case, memory_limit=memory_limit, metadata_only=metadata_only,
+        histograms=histogram_writer is not None)
+    subject_names, file_names, file_paths = _subjects(dataset_path, case_names=case_names, 
+        metadata_only=metadata_only, by_case=by_case)
+    if metadata_only:
+        feature_fn, feature_kwargs = metadata_features, {'img_mode': img_mode}
+    elif by_case:
+        feature_fn, feature_kwargs = case_features, dict()
+    elif memory_limit is not None:
+        feature_fn = chunked_reduced_features
+        feature_kwargs = {'img_mode': img_mode, 'memory_limit': memory_limit}
+    else:
+        feature_fn, feature_kwargs = reduced_features, {'img_mode': img_mode}
+    if intensity_stats:
+        assert not metadata_only
+        feature_kwargs['return_intensity_stats'] = True
+    if histogram_writer is not None:
+        feature_kwargs['histogram_bin_width'] = histogram_bin_width
+    def record(ix, case_props):
+        if histogram_writer is not None:
+            # The histogram is returned last
+            histogram_writer.write((subject_names[ix], case_props[-1]))
+            case_props = case_props[:-1] if intensity_stats else case_props[0]
+        if intensity_stats:
+            return (subject_names[ix],) + tuple(case_props)
+        return subject_names[ix], case_props, None
+    todo = [ix for ix, subject_name in enumerate(subject_names) if subject_name not in skip]
+    cache = None
+    if cache_path is not None:
+        cache = FeatureCache(cache_path, feature_set_version(feature_fn, **feature_kwargs))
+    try:
+        missing = []
+        for ix in todo:
+            case_props = None if cache is None else cache.get(dataset_path, subject_names[ix], file_paths(ix))
+            if case_props is None:
+                missing.append(ix)
+            else:
+                yield record(ix, case_props)
+        results = _map_cases(feature_fn, dataset_path, [file_names[ix] for ix in missing], feature_kwargs,
+            workers=workers, chunksize=chunksize)
+        for ix, case_props in zip(missing, tqdm(results, total=len(missing))):
+            if cache is not None:
+                cache.put(dataset_path, subject_names[ix], file_paths(ix), case_props)
+            yield record(ix, case_props)
+    finally:
+        if cache is not None:
+            print(cache.report())
+            cache.close()
+
+def _merge_intensity_stats(ds_intensity_stats, case_intensity_stats):
+    """Merge the intensity statistics of a case, an IntensityAccumulator or, 
+    if extracted by case, one for each mode."""
+    if not isinstance(case_intensity_stats, list):
+        return (ds_intensity_stats or IntensityAccumulator()).merge(case_intensity_stats)
+    ds_intensity_stats = ds_intensity_stats or []
+    for mode, case_mode_stats in enumerate(case_intensity_stats):
+        if mode == len(ds_intensity_stats):
+            ds_intensity_stats.append(IntensityAccumulator())
+        ds_intensity_stats[mode].merge(case_mode_stats)
+    return ds_intensity_stats
+
+def extract_ds_stats(dataset_path, img_mode = None, case_names=None, workers=None, chunksize=None,
+    cache_path=None, metadata_only=False, intensity_stats=False, as_table=False, by_case=False,
+    memory_limit=None, histograms_path=None, histogram_bin_width=1.0):
+    """Extract properties for each subject.
+
+    Parameters:
+    dataset_path (str): path to a dataset with the MSD structure
+    img_mode (int or None): optional mode channel
+    case_names (lst(str) or None): cases to consider, all if None
+    workers (int or None): number of processes, serial if None or 1
+    chunksize (int or None): cases sent to a worker at a time
+    cache_path (str or None): optional feature cache, so only new or modified
+        cases are extracted
+    metadata_only (bool): only extract the resolution and spacing, reading
+        the image headers
+    intensity_stats (bool): also return the intensity statistics of all
+        foreground voxels, merged from the per-case statistics
+    as_table (bool): return the properties as a PropsTable
+    by_case (bool): extract the properties of each case, rather than of each
+        image file, with case_features. The label map is read once, and the 
+        intensity features are extracted for all modes. Subjects are then 
+        case names, and case_names holds case names rather than file names.
+    memory_limit (int or None): if given, images are read and processed in
+        slabs of slices so that each worker uses about memory_limit bytes,
+        with chunked_reduced_features. Compressed files need up-to-date npy
+        copies, see convert_ds_to_npy
+    histograms_path (str or None): if given, the LabelHistogram of each 
+        subject is stored in this records file, replacing an existing one, 
+        to be queried with a HistogramStore
+    histogram_bin_width (float): bin width of the label histograms
+
+    Returns:
+    dict(str -> OrderedDict(str -> Any)) or PropsTable: properties for each 
+        subject, and an IntensityAccumulator if intensity_stats, or one for
+        each mode if by_case
+    """
+    _check_options(by_case=by_case, memory_limit=memory_limit, metadata_only=metadata_only,
+        histograms=histograms_path is not None)
+    subject_names, _, _ = _subjects(dataset_path, case_names=case_names, 
+        metadata_only=metadata_only, by_case=by_case)
+    extracted = dict()
+    ds_intensity_stats = [] if by_case else IntensityAccumulator()
+    histogram_writer = None
+    if histograms_path is not None:
+        if os.path.isfile(histograms_path):
+            os.remove(histograms_path)
+        histogram_writer = RecordWriter(histograms_path)
+    try:
+        for subject_name, case_props, case_intensity_stats in iter_ds_stats(dataset_path, 
+            img_mode=img_mode, case_names=case_names, workers=workers, chunksize=chunksize, 
+            cache_path=cache_path, metadata_only=metadata_only, intensity_stats=intensity_stats, 
+            by_case=by_case, memory_limit=memory_limit, histogram_writer=histogram_writer, 
+            histogram_bin_width=histogram_bin_width):
+            extracted[subject_name] = case_props
+            if intensity_stats:
+                ds_intensity_stats = _merge_intensity_stats(ds_intensity_stats, case_intensity_stats)
+    finally:
+        if histogram_writer is not None:
+            histogram_writer.close()
+    # In the order of the subjects
+    props = dict((subject_name, extracted[subject_name]) for subject_name in subject_names)
+    # Check that all prop. are extracted for all subjects, and fill. This is
     # needed for cases where all labels are not represented in all cases
-    for subject, subject_props in props.items():
-        for key, value in  all_props_rep.items():
-            if key not in subject_props:
-                subject_props[key] = zeros_in_format(value)
+    schema = props_schema(props.values())
+    for subject_props in props.values():
+        fill_missing_props(subject_props, schema)
+    if as_table:
+        props = PropsTable.from_props(props)
+    if intensity_stats:
+        return props, ds_intensity_stats
     return props
 
-def save_ds_stats(dataset_path, save_df_path, ds_name, img_mode=None, case_names=None):
-    props = extract_ds_stats(dataset_path=dataset_path, img_mode=img_mode, case_names=case_names)
+def records_header(img_mode=None, case_names=None, metadata_only=False, intensity_stats=False,
+    by_case=False):
+    """Header of a records file of save_ds_stats, with the options that 
+    determine the stored properties. Parameters are those of extract_ds_stats."""
+    return {'img_mode': img_mode, 'case_names': None if case_names is None else list(case_names),
+        'metadata_only': metadata_only, 'intensity_stats': intensity_stats, 'by_case': by_case}
+
+def finalize_ds_stats(records_path, dataset_path=None, intensity_stats=False, as_table=False):
+    """Properties of the subjects stored in a records file by save_ds_stats.
+    The records are read twice, so that they are not all in memory while 
+    missing properties are determined. Properties of labels missing in a 
+    subject are filled with zeros, also for labels of dataset.json that are
+    missing in all subjects.
+
+    Parameters:
+    records_path (str): file written with a RecordWriter
+    dataset_path (str or None): dataset with a dataset.json file listing the
+        labels, or None to only consider the labels found in the records.
+        If given, subjects are in the order of extract_ds_stats, with the 
+        options of the header of the records file, else in the order of the
+        records
+    intensity_stats (bool): also return the merged intensity statistics
+    as_table (bool): return the properties as a PropsTable
+
+    Returns:
+    as extract_ds_stats
+    """
+    label_names = None
+    if dataset_path is not None:
+        label_names = [label for label in load_json(dataset_path, 'dataset.json')['labels'].keys() 
+            if label != '0']
+    schema = props_schema((case_props for _, case_props, _ in read_records(records_path)), label_names)
+    props = dict()
+    ds_intensity_stats = None
+    for subject_name, case_props, case_intensity_stats in read_records(records_path):
+        props[subject_name] = fill_missing_props(case_props, schema)
+        if intensity_stats:
+            ds_intensity_stats = _merge_intensity_stats(ds_intensity_stats, case_intensity_stats)
+    if dataset_path is not None:
+        options = read_header(records_path) or records_header()
+        subject_names, _, _ = _subjects(dataset_path, case_names=options['case_names'], 
+            metadata_only=options['metadata_only'], by_case=options['by_case'])
+        # Subjects that are no longer in the dataset follow those that are
+        subject_names = [name for name in subject_names if name in props]
+        in_dataset = set(subject_names)
+        subject_names += [name for name in props.keys() if name not in in_dataset]
+        props = dict((subject_name, props[subject_name]) for subject_name in subject_names)
+    if as_table:
+        props = PropsTable.from_props(props)
+    if intensity_stats:
+        return props, ds_intensity_stats
+    return props
+
+def save_ds_stats(dataset_path, save_df_path, ds_name, img_mode=None, case_names=None, workers=None,
+    cache_path=None, metadata_only=False, intensity_stats=False, format='csv', by_case=False,
+    records_path=None, memory_limit=None, histograms_path=None, histogram_bin_width=1.0):
+    """Extract and store the properties of a dataset. The 'csv' format holds
+    selected features and the mean and std of all subjects, while the 'parquet'
+    format holds all features of each subject with their types. If by_case,
+    there is a row per case and the csv holds the intensity mean of each mode.
+    If records_path is given, the properties of each subject are appended to
+    it as soon as they are extracted, and subjects already stored there by an 
+    interrupted run are not extracted again, and label histograms are 
+    appended to histograms_path, if given. Records of a run with other 
+    options, see records_header, are not resumed but raise a ValueError."""
+    assert format in ['csv', 'parquet']
+    _check_options(by_case=by_case, memory_limit=memory_limit, metadata_only=metadata_only,
+        histograms=histograms_path is not None)
+    if records_path is None:
+        props = extract_ds_stats(dataset_path=dataset_path, img_mode=img_mode, case_names=case_names, 
+            workers=workers, cache_path=cache_path, metadata_only=metadata_only, 
+            intensity_stats=intensity_stats, by_case=by_case, memory_limit=memory_limit, 
+            histograms_path=histograms_path, histogram_bin_width=histogram_bin_width)
+    else:
+        header = records_header(img_mode=img_mode, case_names=case_names, metadata_only=metadata_only,
+            intensity_stats=intensity_stats, by_case=by_case)
+        with contextlib.ExitStack() as stack:
+            writer = stack.enter_context(RecordWriter(records_path, header=header))
+            histogram_writer = None
+            if histograms_path is not None:
+                histogram_writer = stack.enter_context(RecordWriter(histograms_path, 
+                    header={'histogram_bin_width': histogram_bin_width}))
+            stored = set(subject_name for subject_name, _, _ in read_records(records_path))
+            if stored:
+                print('Resuming after {} stored subjects'.format(len(stored)))
+            for record in iter_ds_stats(dataset_path, img_mode=img_mode, case_names=case_names, 
+                workers=workers, cache_path=cache_path, metadata_only=metadata_only, 
+                intensity_stats=intensity_stats, by_case=by_case, memory_limit=memory_limit, 
+                histogram_writer=histogram_writer, histogram_bin_width=histogram_bin_width, 
+                skip=stored):
+                writer.write(record)
+        props = finalize_ds_stats(records_path, dataset_path=dataset_path, 
+            intensity_stats=intensity_stats)
+    if intensity_stats:
+        props, ds_intensity_stats = props
+        if by_case:
+            # As the intensity properties of nnU-Net, keyed by mode
+            summary = dict((str(mode), mode_stats.summary()) for mode, mode_stats in enumerate(ds_intensity_stats))
+        else:
+            summary = ds_intensity_stats.summary()
+        save_json(summary, save_df_path, "{}_intensity".format(ds_name))
+    if format == 'parquet':
+        file_name = "{}_{}.parquet".format(ds_name, 'metadata' if metadata_only else 'stats')
+        PropsTable.from_props(props).to_parquet(os.path.join(save_df_path, file_name))
+        return
     means, stds = props_mean_std(props)
     props['MEAN'] = means
     props['STD'] = stds
-    df = props_to_pandas(props, columns=['intensity_mean', 'resolution', 'spacing', '1_area-rel', '1_CC'])
-    csv_name = "{}_stats.csv".format(ds_name)
-    df.to_csv(os.path.join(save_df_path, csv_name))    
+    # Imports pandas, matplotlib and seaborn
+    from ds_info.visualization.plots import props_to_pandas
+    if metadata_only:
+        df = props_to_pandas(props, columns=['resolution', 'spacing'])
+        csv_name = "{}_metadata.csv".format(ds_name)
+    else:
+        if by_case:
+            intensity_columns = [key for key in means.keys() if key.startswith('intensity_mean_')]
+        else:
+            intensity_columns = ['intensity_mean']
+        df = props_to_pandas(props, columns=intensity_columns+['resolution', 'spacing', '1_area-rel', '1_CC'])
+        csv_name = "{}_stats.csv".format(ds_name)
+    df.to_csv(os.path.join(save_df_path, csv_name))
 
-def main():
-    parser = argparse.ArgumentParser()
+def add_arguments(parser):
+    """Arguments of the stats command, also used by the ds_info entry point."""
     parser.add_argument("task")
     parser.add_argument("save_path")
-    args = parser.parse_args()
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+        help="number of processes used to extract the cases")
+    parser.add_argument("--cache", default=None,
+        help="SQLite file where extracted features are cached between runs")
+    parser.add_argument("--metadata-only", action="store_true",
+        help="only extract resolution and spacing from the image headers")
+    parser.add_argument("--intensity-stats", action="store_true",
+        help="also save the intensity statistics of all foreground voxels")
+    parser.add_argument("--to-npy", action="store_true",
+        help="first store uncompressed copies of the dataset, which are memory-mapped in this and later runs")
+    parser.add_argument("--format", choices=['csv', 'parquet'], default='csv',
+        help="csv with selected features, or parquet with all features (requires pyarrow)")
+    parser.add_argument("--by-case", action="store_true",
+        help="one row per case with the features of all modes, reading each label map once")
+    parser.add_argument("--memory-limit", type=int, default=None, metavar="MB",
+        help="read and process each volume in slabs of its uncompressed copy, using about this much memory "
+        "per process. Implies --to-npy, which reads each volume whole once, as compressed volumes cannot "
+        "be read in slabs")
+    parser.add_argument("--histograms", default=None, metavar="HISTOGRAMS_PATH",
+        help="store a joint histogram of intensities and labels of each case in this file")
+    parser.add_argument("--histogram-bin-width", type=float, default=1.0,
+        help="intensity bin width of the histograms")
+    parser.add_argument("--records", default=None, metavar="RECORDS_PATH",
+        help="append the properties of each case to this file as they are extracted, resuming an interrupted run")
+    parser.add_argument("--profile", default=None, metavar="TRACE_PATH",
+        help="record the duration of each stage for each case, and store the trace as json or csv")
+    parser.add_argument("--profile-memory", action="store_true",
+        help="also record the peak memory of each stage, which slows down the extraction")
+
+def run(args):
     dataset_path = os.path.join(os.environ['nnUNet_raw_data_base'], 'nnUNet_raw_data', args.task)
     save_df_path = args.save_path
+    # Before the npy copies are stored
+    _check_options(by_case=args.by_case, memory_limit=args.memory_limit, 
+        metadata_only=args.metadata_only, histograms=args.histograms is not None)
     start = time.time()
-    save_ds_stats(dataset_path, save_df_path, ds_name=args.task, img_mode=None, case_names=None)
+    if args.profile is not None:
+        profiling.enable(track_memory=args.profile_memory)
+    if args.to_npy or args.memory_limit is not None:
+        convert_ds_to_npy(dataset_path)
+    save_ds_stats(dataset_path, save_df_path, ds_name=args.task, img_mode=None, case_names=None, workers=args.jobs,
+        cache_path=args.cache, metadata_only=args.metadata_only,
+        intensity_stats=args.intensity_stats, format=args.format, by_case=args.by_case,
+        records_path=args.records, 
+        memory_limit=None if args.memory_limit is None else args.memory_limit * 2**20,
+        histograms_path=args.histograms, histogram_bin_width=args.histogram_bin_width)
     time_passed = time.time() - start
     print('Finished {} time passed: {:.2f} s.'.format(args.task, time_passed))
+    if args.profile is not None:
+        records = profiling.pop_records()
+        profiling.save_trace(records, args.profile)
+        print(profiling.format_summary(profiling.summary(records)))
+
+def main():
+    parser = argparse.ArgumentParser()
+    add_arguments(parser)
+    run(parser.parse_args())
 import numpy as np
 if __name__ == "__main__":
     main()
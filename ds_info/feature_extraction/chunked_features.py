@@ -0,0 +1,171 @@
+#   Extraction of reduced_features slab by slab along the z axis, for volumes
+#   that do not fit in memory. Connected components are labeled within each
+#   slab and merged across slab boundaries with a union-find.
+
+import itertools
+import numpy as np
+from collections import OrderedDict
+from ds_info.utils.io_utils import get_img_label_paths, load_array_info, iter_slabs
+from ds_info.utils.profiling import profiled
+from ds_info.feature_extraction.img_features import voxel_spacing
+from ds_info.feature_extraction.intensity_stats import IntensityAccumulator, intensity_statistics
+from ds_info.feature_extraction.label_histograms import LabelHistogram
+
+class UnionFind:
+    """Disjoint sets of integer elements, with path compression."""
+    def __init__(self, size=0):
+        self.parent = np.arange(size, dtype=np.int64)
+
+    def grow(self, size):
+        """Add elements so that there are size elements."""
+        if size > len(self.parent):
+            self.parent = np.append(self.parent, np.arange(len(self.parent), size, dtype=np.int64))
+
+    def find(self, element):
+        root = element
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[element] != root:
+            self.parent[element], element = root, self.parent[element]
+        return root
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            self.parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    def roots(self):
+        """Root of each element."""
+        # Roots are the smallest element of their set, so one pass in
+        # increasing order resolves all parents
+        roots = self.parent.copy()
+        for element in range(len(roots)):
+            roots[element] = roots[roots[element]]
+        return roots
+
+def _boundary_offsets(connectivity):
+    """(dy, dx) offsets of the neighbors of a voxel in the next slice."""
+    return [(dy, dx) for dy, dx in itertools.product([-1, 0, 1], repeat=2)
+        if 1 + abs(dy) + abs(dx) <= connectivity]
+
+def _shifted(a, b, dy, dx):
+    """Overlapping parts of 2D arrays a and b, with b shifted by (dy, dx)."""
+    ny, nx = a.shape
+    a_part = a[max(0, -dy):ny-max(0, dy), max(0, -dx):nx-max(0, dx)]
+    b_part = b[max(0, dy):ny-max(0, -dy), max(0, dx):nx-max(0, -dx)]
+    return a_part, b_part
+
+class SlabComponents:
+    """Connected components of all labels of a label map, counted slab by
+    slab. Components touching across slab boundaries are merged, so the
+    result is the same as labeling the whole map.
+
+    Parameters:
+    connectivity (int): maximum number of orthogonal hops to consider a
+        voxel a neighbor
+    """
+    def __init__(self, connectivity=2):
+        self.connectivity = connectivity
+        self.union_find = UnionFind()
+        self.component_labels = np.zeros(1, dtype=np.int64) # 0 is the background
+        self.previous_slice = None
+
+    def update(self, y_slab):
+        """Label the components of the next slab of the label map."""
+        from skimage.measure import label
+        labeled_slab, nr_components = label(y_slab, return_num=True, connectivity=self.connectivity)
+        offset = len(self.component_labels) - 1
+        component_labels = np.zeros(nr_components+1, dtype=np.int64)
+        component_labels[labeled_slab] = y_slab
+        self.component_labels = np.append(self.component_labels, component_labels[1:])
+        self.union_find.grow(len(self.component_labels))
+        # Global component of each voxel of the first slice
+        first_slice = np.where(labeled_slab[0] > 0, labeled_slab[0].astype(np.int64) + offset, 0)
+        if self.previous_slice is not None:
+            for dy, dx in _boundary_offsets(self.connectivity):
+                previous_part, first_part = _shifted(self.previous_slice, first_slice, dy, dx)
+                touching = ((previous_part > 0) & (first_part > 0) &
+                    (self.component_labels[previous_part] == self.component_labels[first_part]))
+                pairs = np.unique(np.stack([previous_part[touching], first_part[touching]], axis=1), axis=0)
+                for a, b in pairs:
+                    self.union_find.union(a, b)
+        self.previous_slice = np.where(labeled_slab[-1] > 0, labeled_slab[-1].astype(np.int64) + offset, 0)
+
+    def nr_components(self):
+        """Number of components of each label, indexed by label."""
+        roots = np.unique(self.union_find.roots()[1:])
+        return np.bincount(self.component_labels[roots], minlength=1)
+
+def slab_size_for(shape, memory_limit, bytes_per_voxel):
+    """Number of slices of a slab so that slab processing stays within a
+    memory limit, given the bytes used per voxel of a slab."""
+    slice_bytes = int(np.prod(shape[1:])) * bytes_per_voxel
+    return int(max(1, min(shape[0], memory_limit // slice_bytes)))
+
+@profiled
+def chunked_reduced_features(dataset_path, file_name, img_mode=0, memory_limit=2**30,
+    slab_size=None, return_intensity_stats=False, histogram_bin_width=None):
+    """Same features as reduced_features, reading the image and label map in
+    slabs of slices, so that memory use is bound by memory_limit rather than
+    by the size of the volume. Compressed files are read from their npy 
+    copies, see iter_slabs.
+
+    Parameters:
+    dataset_path (str): path to a dataset with the MSD structure
+    file_name (str): name of the image file, including ending
+    img_mode (int or None): optional mode channel of a 4D image
+    memory_limit (int): approximate bytes used for slab processing
+    slab_size (int or None): slices of each slab, if None set from memory_limit
+    return_intensity_stats (bool): also return the IntensityAccumulator of
+        the foreground voxels
+    histogram_bin_width (float or None): if given, also return the 
+        LabelHistogram of the case, last
+
+    Returns:
+    OrderedDict(str -> Any): features, as in reduced_features
+    """
+    img_path, label_path = get_img_label_paths(dataset_path, file_name)
+    x_info = load_array_info(dataset_path, img_path)
+    shape = x_info.array_shape()
+    if img_mode is not None:
+        shape = shape[1:]
+    if slab_size is None:
+        # Image and label slabs, and about 16 bytes per voxel for the labeled
+        # slab and masks
+        slab_size = slab_size_for(shape, memory_limit, bytes_per_voxel=32)
+    intensity_sum, nr_voxels = 0.0, 0
+    label_counts = np.zeros(1, dtype=np.int64)
+    components = SlabComponents(connectivity=2)
+    intensity_stats = IntensityAccumulator()
+    histogram = None if histogram_bin_width is None else LabelHistogram(bin_width=histogram_bin_width)
+    for (_, x_slab), (_, y_slab) in zip(iter_slabs(dataset_path, img_path, slab_size, img_mode=img_mode),
+        iter_slabs(dataset_path, label_path, slab_size)):
+        x_slab, y_slab = np.asarray(x_slab), np.asarray(y_slab)
+        intensity_sum += x_slab.sum(dtype=np.float64)
+        nr_voxels += x_slab.size
+        slab_counts = np.bincount(y_slab.ravel())
+        if len(slab_counts) > len(label_counts):
+            label_counts = np.append(label_counts, np.zeros(len(slab_counts) - len(label_counts), dtype=np.int64))
+        label_counts[:len(slab_counts)] += slab_counts
+        components.update(y_slab)
+        if return_intensity_stats:
+            intensity_stats.merge(intensity_statistics(x_slab, mask=y_slab > 0))
+        if histogram is not None:
+            for x_slice, y_slice in zip(x_slab, y_slab):
+                histogram.update(x_slice, y_slice)
+    props = OrderedDict()
+    props['intensity_mean'] = intensity_sum / nr_voxels
+    props['resolution'] = tuple(shape)
+    props['spacing'] = voxel_spacing(x_info)
+    nr_components = components.nr_components()
+    for label in np.flatnonzero(label_counts):
+        if label == 0:
+            continue
+        props[str(label)+'_area-rel'] = label_counts[label] / label_counts.sum()
+        props[str(label)+'_CC'] = int(nr_components[label])
+    outputs = (props,)
+    if return_intensity_stats:
+        outputs += (intensity_stats,)
+    if histogram is not None:
+        outputs += (histogram,)
+    return outputs if len(outputs) > 1 else props
@@ -1,89 +1,138 @@
 import numpy as np
-from ds_info.utils.io_utils import get_img_label, get_arrays_from_img_label
-from ds_info.feature_extraction.img_features import resolution, voxel_spacing, intensity_mean_median
-from ds_info.feature_extraction.label_features import skimg_props, connected_components, relative_area, relative_bounding_boxes
-from ds_info.utils.label_utils import divide_label_maps
+from ds_info.utils.profiling import profiled
+from ds_info.utils.io_utils import load_img_label, load_case, get_img_label_paths, read_image_info
+from ds_info.feature_extraction.img_features import resolution, voxel_spacing, intensity_mean, intensity_mean_median
+from ds_info.feature_extraction.intensity_stats import intensity_statistics
+from ds_info.feature_extraction.label_histograms import label_histogram
+from ds_info.feature_extraction.props_table import PropsTable
+from ds_info.feature_extraction.label_features import skimg_props, relative_bounding_boxes, label_statistics, component_statistics
 import warnings
 from collections import OrderedDict
 import numbers
 
-def some_features(dataset_path, file_name, img_mode=0):
+@profiled
+def some_features(dataset_path, file_name, img_mode=0, expensive_props=[], timings=None):
+    """Features of the image, of each label and of the largest connected
+    component of each label. Expensive region properties, such as 
+    'area_convex', are calculated if listed in expensive_props, and the seconds
+    spent on each are added to timings if this is a dictionary."""
     # Fetch data
-    x_sitk, y_sitk = get_img_label(dataset_path, file_name)
-    x, y = get_arrays_from_img_label(x_sitk, y_sitk, img_mode=img_mode)
+    x, y, x_info = load_img_label(dataset_path, file_name, img_mode=img_mode)
     props = OrderedDict()
     # Image properties
     props['intensity_mean'], props['intensity_median'] = intensity_mean_median(x)
     props['resolution'] = resolution(x)
-    props['spacing'] = voxel_spacing(x_sitk)
-    # Properties for each label
-    label_maps = divide_label_maps(y)
-    for label, label_map in label_maps.items():
-        label_props = skimg_props(label_map, x)
-        for key, value in label_props.items():
-            props[str(label)+'_'+key] = value
+    props['spacing'] = voxel_spacing(x_info)
+    # Properties for each label, calculated for all labels at once
+    label_stats = label_statistics(y, x)
+    # Connected components of all labels, calculated at once
+    cc_stats = component_statistics(y, x, connectivity=2)
+    for label, stats in label_stats.items():
+        props[str(label)+'_area'] = stats['area']
+        if expensive_props:
+            # Within the bounding box of the label
+            bbox = stats['bbox']
+            slices = tuple(slice(start, stop) for start, stop in zip(bbox[:y.ndim], bbox[y.ndim:]))
+            label_map = (y[slices] == label).view(np.uint8)
+            for key, value in skimg_props(label_map, props_y=expensive_props, 
+                props_x_y=[], timings=timings).items():
+                props[str(label)+'_'+key] = value
+        for key in ['bbox', 'centroid', 'intensity_mean']:
+            props[str(label)+'_'+key] = stats[key]
         # Add relative area
-        props[str(label)+'_area-rel'] = relative_area(label_map, 1)
+        props[str(label)+'_area-rel'] = stats['area-rel']
         props[str(label)+'_bbox-rel'] = relative_bounding_boxes(props['resolution'], props[str(label)+'_bbox'])
         # Properties for the largest connected component of each label
-        labeled_image, nr_components = connected_components(label_map, connectivity=2)
-        props[str(label)+'_CC'] = nr_components
-        cc_maps = divide_label_maps(labeled_image).values()
-        # Sometimes, convex hull cannot be calculated for small components
-        with warnings.catch_warnings(): 
-            warnings.simplefilter("ignore")
-            largest_map = max(cc_maps, key=lambda m: skimg_props(m)['area'])
-        largest_cc_props = skimg_props(largest_map, x)
-        for key, value in largest_cc_props.items():
-            props[str(label)+'_CC_'+key] = value
+        largest_cc = cc_stats[label]
+        props[str(label)+'_CC'] = largest_cc['nr_components']
+        props[str(label)+'_CC_area'] = largest_cc['area']
+        if expensive_props:
+            # Sometimes, convex hull cannot be calculated for small components
+            with warnings.catch_warnings(): 
+                warnings.simplefilter("ignore")
+                for key, value in skimg_props(largest_cc['mask'].view(np.uint8),
+                    props_y=expensive_props, props_x_y=[], timings=timings).items():
+                    props[str(label)+'_CC_'+key] = value
+        for key in ['bbox', 'centroid', 'intensity_mean']:
+            props[str(label)+'_CC_'+key] = largest_cc[key]
         # Add area relative to whole label
-        props[str(label)+'_CC_area-rel-{}'.format(label)] = relative_area(largest_map, 1, vals_b=[1], array_b=label_map)
+        props[str(label)+'_CC_area-rel-{}'.format(label)] = largest_cc['area-rel-label']
     return props
 
-def reduced_features(dataset_path, file_name, img_mode=0):
+@profiled
+def reduced_features(dataset_path, file_name, img_mode=0, return_intensity_stats=False, 
+    histogram_bin_width=None):
+    """Features used for the dataset statistics. If return_intensity_stats,
+    the IntensityAccumulator of the foreground voxels is also returned, so 
+    these can be merged into dataset-wide intensity statistics. If 
+    histogram_bin_width is given, the LabelHistogram of the case with bins
+    of that width is returned last."""
     # Fetch data
-    x_sitk, y_sitk = get_img_label(dataset_path, file_name)
-    x, y = get_arrays_from_img_label(x_sitk, y_sitk, img_mode=img_mode)
+    x, y, x_info = load_img_label(dataset_path, file_name, img_mode=img_mode)
     props = OrderedDict()
     # Image properties
-    props['intensity_mean'], _ = intensity_mean_median(x)
+    props['intensity_mean'] = intensity_mean(x)
     props['resolution'] = resolution(x)
-    props['spacing'] = voxel_spacing(x_sitk)
+    props['spacing'] = voxel_spacing(x_info)
     # Properties for each label
-    label_maps = divide_label_maps(y)
-    for label, label_map in label_maps.items():
+    props.update(_label_features(y))
+    outputs = (props,)
+    if return_intensity_stats:
+        outputs += (intensity_statistics(x, mask=y > 0),)
+    if histogram_bin_width is not None:
+        outputs += (label_histogram(x, y, bin_width=histogram_bin_width),)
+    return outputs if len(outputs) > 1 else props
+
+def _label_features(y):
+    props = OrderedDict()
+    label_stats = label_statistics(y)
+    cc_stats = component_statistics(y, connectivity=2)
+    for label, stats in label_stats.items():
         # Add relative area
-        props[str(label)+'_area-rel'] = relative_area(label_map, 1)
-        # Properties for the largest connected component of each label
-        labeled_image, nr_components = connected_components(label_map, connectivity=2)
-        props[str(label)+'_CC'] = nr_components
+        props[str(label)+'_area-rel'] = stats['area-rel']
+        # Number of connected components of each label
+        props[str(label)+'_CC'] = cc_stats[label]['nr_components']
+    return props
+
+@profiled
+def case_features(dataset_path, case_name, return_intensity_stats=False):
+    """Features of reduced_features for all modes of a case. The label map
+    is read, and its features calculated, once. The intensity mean of mode m
+    is stored as 'intensity_mean_m'. If return_intensity_stats, the 
+    IntensityAccumulator of the foreground voxels of each mode is also 
+    returned."""
+    # Fetch data
+    xs, y, x_info = load_case(dataset_path, case_name)
+    props = OrderedDict()
+    # Image properties, for each mode
+    for mode, x in enumerate(xs):
+        props['intensity_mean_{}'.format(mode)] = intensity_mean(x)
+    props['resolution'] = resolution(xs[0])
+    props['spacing'] = voxel_spacing(x_info)
+    # Properties for each label
+    props.update(_label_features(y))
+    if return_intensity_stats:
+        mask = y > 0
+        return props, [intensity_statistics(x, mask=mask) for x in xs]
+    return props
+
+@profiled
+def metadata_features(dataset_path, file_name, img_mode=0):
+    # Only the image header is read
+    img_path, _ = get_img_label_paths(dataset_path, file_name)
+    x_info = read_image_info(img_path)
+    props = OrderedDict()
+    # Same resolution as for the numpy array, after selecting the mode
+    shape = x_info.array_shape()
+    props['resolution'] = shape if img_mode is None else shape[1:]
+    props['spacing'] = voxel_spacing(x_info)
     return props
 
 def props_mean_std(props, round=2):
-    ordered_vals = OrderedDict()
-    for subject_props in props.values():
-        for key, value in subject_props.items():
-            if key not in ordered_vals:
-                ordered_vals[key] = []
-            ordered_vals[key].append(value)
-    means, stds = OrderedDict(), OrderedDict()
-    for key, val in ordered_vals.items():
-        means[key], stds[key] = np.mean(val, axis=0), np.std(val, axis=0)
-        if round is not None:
-            means[key], stds[key] = np.round_(means[key], round), np.round_(stds[key], round)
-    return means, stds
+    return PropsTable.from_props(props).mean_std(round=round)
 
 def props_range(props):
-    ordered_vals = OrderedDict()
-    for subject_props in props.values():
-        for key, value in subject_props.items():
-            if key not in ordered_vals:
-                ordered_vals[key] = []
-            ordered_vals[key].append(value)
-    mins, maxs = OrderedDict(), OrderedDict()
-    for key, val in ordered_vals.items():
-        mins[key], maxs[key] = np.min(val, axis=0), np.max(val, axis=0)
-    return mins, maxs
+    return PropsTable.from_props(props).range()
 
 def in_range(x, min, max):
     if isinstance(min, numbers.Number):
@@ -95,22 +144,33 @@ def in_range(x, min, max):
         in_range = all(x[i]>= min[i] and x[i]<= max[i] for i in range(len(x)))
     return in_range
 
+def _column(props, prop_key):
+    """Subjects and the values of one feature, without building the columns
+    of the other features."""
+    if isinstance(props, PropsTable):
+        return props.subjects, props[prop_key]
+    subjects = list(props.keys())
+    return subjects, np.array([props[subject][prop_key] for subject in subjects])
+
 def select_subjects(props, prop_key, prop_min, prop_max):
-    return [s for s in props.keys() if 
-        in_range(props[s][prop_key], prop_min, prop_max)]
+    """Subjects with prop_key within [prop_min, prop_max]. For many queries 
+    over several features, build a PropsIndex once."""
+    subjects, values = _column(props, prop_key)
+    mask = (values >= np.asarray(prop_min)) & (values <= np.asarray(prop_max))
+    if mask.ndim > 1:
+        mask = np.all(mask, axis=1)
+    return [subject for subject, selected in zip(subjects, mask) if selected]
 
 def select_k_nearest_subjects(props, prop_key, value, k=None, ix=None):
     """Returns an ordered list of the specified length, order according to the
-    closeness to value.
+    closeness to value. Ties keep the order of the subjects. For many queries 
+    over several features, build a PropsIndex once.
     """
-    if isinstance(value, numbers.Number):
-        sorted_lst = sorted(list(props.keys()), key=
-            lambda k: abs(props[k][prop_key] - value))
-    else:
+    subjects, values = _column(props, prop_key)
+    if not isinstance(value, numbers.Number):
         assert ix is not None
-        sorted_lst = sorted(list(props.keys()), key=
-            lambda k: abs(props[k][prop_key][ix] - value[ix]))
-    if k is None:
-        return sorted_lst
-    else:
-        return sorted_lst[:k]
\ No newline at end of file
+        values, value = values[:, ix], value[ix]
+    order = np.argsort(np.abs(values - value), kind='stable')
+    if k is not None:
+        order = order[:k]
+    return [subjects[subject_ix] for subject_ix in order]
@@ -1,6 +1,8 @@
 from os import X_OK
 import numpy as np
+from ds_info.utils.profiling import profiled
 
+@profiled
 def resolution(x):
     """Image resolution. The order is different depending on input type.
 
@@ -15,6 +17,7 @@ def resolution(x):
     else:
         return x.GetSize()
 
+@profiled
 def voxel_spacing(x_sitk):
     """Voxel spacing
 
@@ -26,6 +29,12 @@ def voxel_spacing(x_sitk):
     """
     return [round(x_sp, 2) for x_sp in x_sitk.GetSpacing()]
 
+@profiled
+def intensity_mean(x):
+    # Accumulated in float64 without copying x
+    return float(x.mean(dtype=np.float64))
+
+@profiled
 def intensity_mean_median(x):
-    flattened_x = x.flatten()
-    return np.mean(flattened_x), np.median(flattened_x)
\ No newline at end of file
+    # np.median makes one copy of x to partition it, so x is not flattened
+    return np.mean(x), np.median(x)
\ No newline at end of file
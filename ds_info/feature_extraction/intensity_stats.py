@@ -0,0 +1,137 @@
+import numpy as np
+from collections import OrderedDict
+from ds_info.utils.profiling import profiled
+
+# Bins are limited to [-MAX_BIN, MAX_BIN], so that extreme values, such as
+# padding with the largest float, do not allocate an unbounded histogram.
+# Values beyond are counted in the first or last bin.
+MAX_BIN = 2**20
+
+class IntensityAccumulator:
+    """Intensity statistics that are updated chunk by chunk and can be merged,
+    e.g. for all cases of a dataset. The mean and variance are exact (merged
+    with the formula of Chan et al.), and percentiles are approximated from a
+    histogram with fixed bin width, so their error is in the order of the bin
+    width. The
+    default width of 1 suits the integer values of CT images. Non-finite
+    values (NaN and infinity) are skipped, and counted in nr_nonfinite.
+
+    Parameters:
+    bin_width (float): width of the histogram bins
+    """
+    def __init__(self, bin_width=1.0):
+        self.bin_width = bin_width
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0 # Sum of squared differences to the mean
+        self.min = np.inf
+        self.max = -np.inf
+        self.nr_nonfinite = 0
+        # Counts for bins hist_start, hist_start+1, ... where bin b holds the
+        # values in [b*bin_width, (b+1)*bin_width)
+        self.hist = np.zeros(0, dtype=np.int64)
+        self.hist_start = 0
+
+    def update(self, values):
+        """Add the values of an array, e.g. a slice of a volume."""
+        values = values.ravel()
+        if values.dtype.kind == 'f':
+            finite = np.isfinite(values)
+            if not finite.all():
+                self.nr_nonfinite += int(values.size - finite.sum())
+                values = values[finite]
+        if values.size == 0:
+            return
+        chunk_mean = values.mean(dtype=np.float64)
+        chunk_m2 = np.square(np.subtract(values, chunk_mean, dtype=np.float64)).sum()
+        self._merge_moments(values.size, chunk_mean, chunk_m2)
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        bins = np.clip(np.floor(values / self.bin_width), -MAX_BIN, MAX_BIN).astype(np.int64)
+        first_bin = bins.min()
+        self._add_hist(np.bincount(bins - first_bin), first_bin)
+
+    def merge(self, other):
+        """Add the statistics of another accumulator with the same bin width."""
+        assert self.bin_width == other.bin_width
+        self.nr_nonfinite += getattr(other, 'nr_nonfinite', 0)
+        if other.count == 0:
+            return self
+        self._merge_moments(other.count, other.mean, other.m2)
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._add_hist(other.hist, other.hist_start)
+        return self
+
+    def _merge_moments(self, count, mean, m2):
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta**2 * self.count * count / total
+        self.count = total
+
+    def _add_hist(self, hist, start):
+        if len(self.hist) == 0:
+            self.hist, self.hist_start = hist.astype(np.int64), start
+            return
+        new_start = min(self.hist_start, start)
+        new_end = max(self.hist_start + len(self.hist), start + len(hist))
+        if new_start != self.hist_start or new_end != self.hist_start + len(self.hist):
+            new_hist = np.zeros(new_end - new_start, dtype=np.int64)
+            new_hist[self.hist_start-new_start:self.hist_start-new_start+len(self.hist)] = self.hist
+            self.hist, self.hist_start = new_hist, new_start
+        self.hist[start-self.hist_start:start-self.hist_start+len(hist)] += hist
+
+    def variance(self):
+        return self.m2 / self.count
+
+    def std(self):
+        return np.sqrt(self.variance())
+
+    def percentile(self, q):
+        """Approximate percentile. The bin of the voxel with the rank of the
+        percentile is found, and its values are assumed to be evenly spread."""
+        assert self.count > 0 and 0 <= q <= 100
+        cumulative = np.cumsum(self.hist)
+        # Same rank as for np.percentile, from 0 to count-1
+        rank = q / 100 * (self.count - 1)
+        bin_ix = np.searchsorted(cumulative, rank, side='right')
+        previous = cumulative[bin_ix-1] if bin_ix > 0 else 0
+        fraction = (rank - previous + 0.5) / self.hist[bin_ix]
+        value = (self.hist_start + bin_ix + fraction) * self.bin_width
+        return float(min(max(value, self.min), self.max))
+
+    def summary(self, percentiles=(0.5, 50, 99.5)):
+        """Dictionary with the statistics, with percentiles named as in the
+        intensity properties of nnU-Net, e.g. 'percentile_00_5'."""
+        summary = OrderedDict()
+        summary['count'] = int(self.count)
+        summary['mean'] = float(self.mean)
+        summary['std'] = float(self.std())
+        summary['min'] = float(self.min)
+        summary['max'] = float(self.max)
+        for q in percentiles:
+            summary['percentile_'+'{:04.1f}'.format(q).replace('.', '_')] = self.percentile(q)
+        return summary
+
+@profiled
+def intensity_statistics(x, mask=None, bin_width=1.0):
+    """Intensity statistics of an image, computed slice by slice so that no
+    copy of the whole image is made.
+
+    Parameters:
+    x (numpy.ndarray): img
+    mask (numpy.ndarray): optional mask with same dimensions as x, e.g. the
+        foreground of a label map, so only these voxels are considered
+    bin_width (float): width of the histogram bins used for percentiles
+
+    Returns:
+    IntensityAccumulator: statistics, which can be merged with other cases
+    """
+    accumulator = IntensityAccumulator(bin_width=bin_width)
+    for slice_ix in range(x.shape[0]):
+        if mask is None:
+            accumulator.update(x[slice_ix])
+        else:
+            accumulator.update(x[slice_ix][mask[slice_ix]])
+    return accumulator
@@ -1,29 +1,74 @@
+import time
 import numpy as np
+from collections import OrderedDict
 
-from skimage.measure import label,regionprops
+from ds_info.utils.label_utils import compact_label_map
+from ds_info.utils.profiling import profiled
 
-def skimg_props(y, x=None, props_y=['area', 'area_convex', 'bbox', 'centroid'], 
-    props_x_y=['intensity_mean']):
+# Properties that take much longer than the area or centroid, e.g. because a
+# convex hull is computed. These are only calculated when requested.
+EXPENSIVE_PROPS = ['area_convex', 'image_convex', 'solidity', 'feret_diameter_max',
+    'moments', 'moments_central', 'moments_normalized', 'moments_hu', 
+    'moments_weighted', 'moments_weighted_central', 'moments_weighted_normalized',
+    'moments_weighted_hu', 'inertia_tensor', 'inertia_tensor_eigvals']
+
+# Properties with coordinates, which are shifted from the bounding box to the
+# whole image
+_COORDINATE_PROPS = ['bbox', 'centroid', 'centroid_weighted', 'coords', 'slice']
+
+@profiled
+def skimg_props(y, x=None, props_y=['area', 'bbox', 'centroid'], 
+    props_x_y=['intensity_mean'], timings=None):
     """Extract properties from a label map and optional intensity image. For 
     other region properties, see: https://scikit-image.org/docs/dev/api/skimage.measure.html#skimage.measure.regionprops
+    The region is first cropped to its bounding box, found with 
+    scipy.ndimage.find_objects, so that properties are calculated on the
+    sub-volume only. Coordinates are still relative to the whole image. 
 
     Parameters:
     y (numpy.ndarray): label map
     x (numpy.ndarray): img with same dimensions as y but continuous values
-    props_y (lst(str)): properties calculated from y
+    props_y (lst(str)): properties calculated from y, which may include
+        EXPENSIVE_PROPS such as 'area_convex'
     props_x_y (lst(str)): properties calculated from y and x (if x not None)
+    timings (dict(str -> float)): if not None, the seconds spent on each 
+        expensive property are added to it
 
     Returns:
     dict(str -> Any): property dictionary
     """
-    props = regionprops(label_image=y, intensity_image=x)
-    assert len(props) == 1 # Only one label
-    props_dict = {key: props[0][key] for key in props_y}
-    if x is not None and props_x_y:
-        for key in props_x_y:
+    from scipy.ndimage import find_objects
+    from skimage.measure import regionprops
+    if y.dtype == bool:
+        y = y.view(np.uint8)
+    slices = [s for s in find_objects(y) if s is not None]
+    assert len(slices) == 1 # Only one label
+    slices = slices[0]
+    props = regionprops(label_image=y[slices], intensity_image=None if x is None else x[slices])
+    keys = list(props_y) + (list(props_x_y) if x is not None else [])
+    props_dict = dict()
+    for key in keys:
+        if timings is not None and key in EXPENSIVE_PROPS:
+            start = time.time()
+            props_dict[key] = props[0][key]
+            timings[key] = timings.get(key, 0.0) + time.time() - start
+        else:
             props_dict[key] = props[0][key]
+        if key in _COORDINATE_PROPS:
+            props_dict[key] = _shift_coordinates(key, props_dict[key], slices)
     return props_dict
 
+def _shift_coordinates(key, value, slices):
+    offset = [s.start for s in slices]
+    if key == 'bbox':
+        return tuple(v + offset[ix % len(offset)] for ix, v in enumerate(value))
+    if key == 'coords':
+        return value + np.array(offset)
+    if key == 'slice':
+        return tuple(slice(s.start + o, s.stop + o, s.step) for s, o in zip(value, offset))
+    return tuple(v + o for v, o in zip(value, offset))
+
+@profiled
 def connected_components(y, connectivity=2):
     """Calculate the connected components of a label map.
 
@@ -35,11 +80,14 @@ def connected_components(y, connectivity=2):
 
     Returns:
     (numpy.ndarray, int): an array where each component is assigned a new label,
-        ant the number of connected components
+        with the smallest integer type that holds all components, and the 
+        number of connected components
     """
-    labeled_image, nr_components = label(y, return_num=True, connectivity=1)
-    return labeled_image, nr_components
+    from skimage.measure import label
+    labeled_image, nr_components = label(y, return_num=True, connectivity=connectivity)
+    return compact_label_map(labeled_image), nr_components
 
+@profiled
 def relative_area(array_a, val_a, vals_b='all', array_b=None):
     """Returns the area of val_a in array_a relative to the summed area of 
     vals_b in array_b.
@@ -61,8 +109,148 @@ def relative_area(array_a, val_a, vals_b='all', array_b=None):
     area_vals_b = sum((array_b == v).sum() for v in vals_b)
     return area_val_a/area_vals_b
 
+@profiled
 def relative_bounding_boxes(resolution, bb):
     assert len(resolution)==3 and len(bb)==6
     rel_values = [bb[0]/resolution[0], bb[1]/resolution[1], bb[2]/resolution[2],
         bb[3]/resolution[0], bb[4]/resolution[1], bb[5]/resolution[2]]
-    return tuple(round(v, 3) for v in rel_values)
\ No newline at end of file
+    return tuple(round(v, 3) for v in rel_values)
+
+@profiled
+def label_statistics(y, x=None):
+    """Calculate properties for all labels of a label map in one pass over its
+    slices, without building a map for each label. For each slice, the voxels
+    are counted per label and per position along each axis with np.bincount.
+    The count, bounding box and centroid of each label are then read from these
+    per-axis histograms, and the intensity mean from the summed intensities.
+
+    Parameters:
+    y (numpy.ndarray): label map with non-negative integer labels, at least 2D
+    x (numpy.ndarray): optional img with same dimensions as y
+
+    Returns:
+    OrderedDict(key -> OrderedDict(str -> Any)): a dictionary mapping each
+        foreground label to its 'area', 'area-rel' (relative to the whole
+        image), 'bbox', 'centroid' and, if x is not None, 'intensity_mean'.
+        Labels are ordered wrt the label value. The bounding boxes have the
+        format of skimage.measure.regionprops.
+    """
+    assert y.ndim >= 2
+    assert x is None or x.shape == y.shape
+    nr_bins = int(y.max()) + 1
+    # Histograms of label vs. position, for each axis
+    axis_counts = [np.zeros((nr_bins, n), dtype=np.int64) for n in y.shape]
+    # Positions along the axes of a slice, broadcastable to the slice shape
+    slice_dims = y.ndim - 1
+    positions = [np.arange(n, dtype=np.intp).reshape([-1 if ix == axis else 1 
+        for ix in range(slice_dims)]) for axis, n in enumerate(y.shape[1:])]
+    if x is not None:
+        intensity_sums = np.zeros(nr_bins)
+    for slice_ix in range(y.shape[0]):
+        y_slice = y[slice_ix].astype(np.intp)
+        flat_y_slice = y_slice.ravel()
+        axis_counts[0][:, slice_ix] = np.bincount(flat_y_slice, minlength=nr_bins)
+        for axis, n in enumerate(y.shape[1:]):
+            axis_counts[axis+1] += np.bincount((y_slice*n + positions[axis]).ravel(), 
+                minlength=nr_bins*n).reshape(nr_bins, n)
+        if x is not None:
+            intensity_sums += np.bincount(flat_y_slice, weights=x[slice_ix].ravel(), 
+                minlength=nr_bins)
+    areas = axis_counts[0].sum(axis=1)
+    stats = OrderedDict()
+    for lbl in np.flatnonzero(areas):
+        if lbl == 0:
+            continue
+        present = [np.flatnonzero(counts[lbl]) for counts in axis_counts]
+        label_stats = OrderedDict()
+        label_stats['area'] = areas[lbl]
+        label_stats['area-rel'] = areas[lbl]/y.size
+        label_stats['bbox'] = tuple(int(p[0]) for p in present) + tuple(int(p[-1])+1 for p in present)
+        label_stats['centroid'] = tuple(np.dot(counts[lbl], np.arange(len(counts[lbl])))/areas[lbl] 
+            for counts in axis_counts)
+        if x is not None:
+            label_stats['intensity_mean'] = intensity_sums[lbl]/areas[lbl]
+        stats[lbl] = label_stats
+    return stats
+
+@profiled
+def label_components(y, connectivity=2):
+    """Calculate the connected components of all labels of a label map at 
+    once. Neighboring voxels are in the same component if they have the same
+    label, so each component belongs to one label.
+
+    Parameters:
+    y (numpy.ndarray): label map with non-negative integer labels
+    connectivity (int): maximum number of orthogonal hops to consider a 
+        pixel/voxel a neighbor
+
+    Returns:
+    (numpy.ndarray, numpy.ndarray, numpy.ndarray): an array where each 
+        component is assigned a new label, with the smallest integer type that
+        holds all components, the size of each component and the label of each
+        component. The last two are indexed by component, where 0 is the 
+        background.
+    """
+    from skimage.measure import label
+    labeled_image, nr_components = label(y, return_num=True, connectivity=connectivity)
+    labeled_image = compact_label_map(labeled_image)
+    sizes = np.bincount(labeled_image.ravel(), minlength=nr_components+1)
+    component_labels = np.zeros(nr_components+1, dtype=y.dtype)
+    component_labels[labeled_image] = y
+    return labeled_image, sizes, component_labels
+
+@profiled
+def component_statistics(y, x=None, connectivity=2):
+    """Calculate the number of connected components of each label and the 
+    properties of the largest one. The components are labeled in one pass, and
+    the properties of the largest components are calculated within their
+    bounding boxes, so no map is built for each label or component.
+
+    Parameters:
+    y (numpy.ndarray): label map with non-negative integer labels
+    x (numpy.ndarray): optional img with same dimensions as y
+    connectivity (int): maximum number of orthogonal hops to consider a 
+        pixel/voxel a neighbor
+
+    Returns:
+    OrderedDict(key -> OrderedDict(str -> Any)): a dictionary mapping each
+        foreground label to its number of components 'nr_components', and
+        the 'area', 'bbox', 'centroid', 'area-rel-label' (relative to the 
+        area of the label), 'slices' (of the bounding box), 'mask' (within the
+        bounding box) and, if x is not None, 'intensity_mean' of its largest
+        component. Labels are ordered 
+        wrt the label value. Ties between largest components are resolved in
+        favour of the first component in raster order.
+    """
+    from scipy.ndimage import find_objects
+    labeled_image, sizes, component_labels = label_components(y, connectivity=connectivity)
+    components = np.arange(1, len(sizes))
+    sizes, component_labels = sizes[1:], component_labels[1:]
+    # Sort by label, then by decreasing size and then by component
+    order = np.lexsort((components, -sizes, component_labels))
+    sorted_labels = component_labels[order]
+    is_first = np.ones(len(order), dtype=bool)
+    is_first[1:] = sorted_labels[1:] != sorted_labels[:-1]
+    labels, largest = sorted_labels[is_first], components[order][is_first]
+    nr_components = np.diff(np.append(np.flatnonzero(is_first), len(order)))
+    label_areas = np.bincount(component_labels, weights=sizes)
+    # Bounding box of each component, found in one pass
+    component_slices = find_objects(labeled_image)
+    stats = OrderedDict()
+    for lbl, component, nr in zip(labels, largest, nr_components):
+        slices = component_slices[component-1]
+        mask = labeled_image[slices] == component
+        coords = np.nonzero(mask)
+        area = sizes[component-1]
+        label_stats = OrderedDict()
+        label_stats['nr_components'] = int(nr)
+        label_stats['area'] = area
+        label_stats['bbox'] = tuple(s.start for s in slices) + tuple(s.stop for s in slices)
+        label_stats['centroid'] = tuple(s.start + c.mean() for s, c in zip(slices, coords))
+        label_stats['area-rel-label'] = area / label_areas[lbl]
+        label_stats['slices'] = slices
+        label_stats['mask'] = mask
+        if x is not None:
+            label_stats['intensity_mean'] = x[slices][mask].mean()
+        stats[int(lbl)] = label_stats
+    return stats
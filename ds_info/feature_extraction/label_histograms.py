@@ -0,0 +1,225 @@
+#   Joint histograms of intensities and labels. These are stored for each case
+#   during extraction and merged, so that intensity statistics of each label
+#   can be queried for any subset of cases without reading the images again.
+
+import numpy as np
+from collections import OrderedDict
+from ds_info.utils.profiling import profiled
+from ds_info.utils.record_utils import read_records
+from ds_info.feature_extraction.intensity_stats import IntensityAccumulator
+
+def _accumulator(bin_width, count, mean, m2, min, max, hist, hist_start):
+    """IntensityAccumulator with the given statistics."""
+    accumulator = IntensityAccumulator(bin_width=bin_width)
+    accumulator.count, accumulator.mean, accumulator.m2 = int(count), float(mean), float(m2)
+    accumulator.min, accumulator.max = min, max
+    accumulator.hist, accumulator.hist_start = hist.astype(np.int64), int(hist_start)
+    return accumulator
+
+def _compact(values):
+    """Non-negative integers in the smallest unsigned dtype."""
+    return values.astype(np.min_scalar_type(values.max() if len(values) else 0))
+
+class LabelHistogram:
+    """Intensity statistics of the voxels of each label, including the
+    background, with an IntensityAccumulator for each label. Histograms are
+    pickled, e.g. by a RecordWriter, as the non-zero bins of all labels in
+    columnar arrays with the smallest dtypes.
+
+    Parameters:
+    bin_width (float): width of the histogram bins
+    """
+    def __init__(self, bin_width=1.0):
+        self.bin_width = bin_width
+        self.accumulators = dict() # label -> IntensityAccumulator
+
+    def update(self, x, y):
+        """Add the voxels of an image and its label map, e.g. of a slice."""
+        x, y = np.asarray(x), np.asarray(y)
+        for label in np.flatnonzero(np.bincount(y.ravel())):
+            label = int(label)
+            if label not in self.accumulators:
+                self.accumulators[label] = IntensityAccumulator(bin_width=self.bin_width)
+            self.accumulators[label].update(x[y == label])
+        return self
+
+    def merge(self, other):
+        """Add the statistics of another histogram with the same bin width."""
+        assert self.bin_width == other.bin_width
+        for label, accumulator in other.accumulators.items():
+            if label not in self.accumulators:
+                self.accumulators[label] = IntensityAccumulator(bin_width=self.bin_width)
+            self.accumulators[label].merge(accumulator)
+        return self
+
+    def labels(self):
+        return sorted(self.accumulators.keys())
+
+    def __getitem__(self, label):
+        return self.accumulators[label]
+
+    def __contains__(self, label):
+        return label in self.accumulators
+
+    def foreground(self, labels=None):
+        """Merged statistics of some labels, by default all but the background."""
+        labels = [label for label in self.labels() if label > 0] if labels is None else labels
+        accumulator = IntensityAccumulator(bin_width=self.bin_width)
+        for label in labels:
+            if label in self.accumulators:
+                accumulator.merge(self.accumulators[label])
+        return accumulator
+
+    def means(self):
+        """Intensity mean of each label."""
+        return OrderedDict((label, self.accumulators[label].mean) for label in self.labels())
+
+    def percentiles(self, q):
+        """Approximate q-th percentile of the intensities of each label."""
+        return OrderedDict((label, self.accumulators[label].percentile(q)) for label in self.labels())
+
+    def clipping_bounds(self, lower=0.5, upper=99.5, labels=None):
+        """Intensity window of the foreground voxels of some labels, between
+        two percentiles. With the defaults, these are the bounds to which
+        nnU-Net clips CT images."""
+        foreground = self.foreground(labels)
+        return foreground.percentile(lower), foreground.percentile(upper)
+
+    def summary(self, percentiles=(0.5, 50, 99.5)):
+        """Summary of the IntensityAccumulator of each label, keyed by label."""
+        return OrderedDict((str(label), self.accumulators[label].summary(percentiles=percentiles))
+            for label in self.labels())
+
+    def __getstate__(self):
+        accumulators = [self.accumulators[label] for label in self.labels()]
+        nonzero = [np.flatnonzero(accumulator.hist) for accumulator in accumulators]
+        state = {'bin_width': self.bin_width, 'labels': _compact(np.array(self.labels(), dtype=np.int64))}
+        for key in ['count', 'mean', 'm2', 'min', 'max', 'hist_start']:
+            state[key] = np.array([getattr(accumulator, key) for accumulator in accumulators],
+                dtype=np.int64 if key in ['count', 'hist_start'] else np.float64)
+        state['nr_nonzero'] = np.array([len(ixs) for ixs in nonzero], dtype=np.int64)
+        # Bins relative to the start of the histogram of their label
+        state['bins'] = _compact(np.concatenate([np.zeros(0, dtype=np.int64)] + nonzero))
+        state['counts'] = _compact(np.concatenate([np.zeros(0, dtype=np.int64)] +
+            [accumulator.hist[ixs] for accumulator, ixs in zip(accumulators, nonzero)]))
+        return state
+
+    def __setstate__(self, state):
+        self.bin_width = state['bin_width']
+        self.accumulators = dict()
+        ends = np.cumsum(state['nr_nonzero'])
+        for ix, label in enumerate(state['labels']):
+            bins = state['bins'][ends[ix]-state['nr_nonzero'][ix]:ends[ix]].astype(np.int64)
+            hist = np.zeros(bins[-1] + 1 if len(bins) else 0, dtype=np.int64)
+            hist[bins] = state['counts'][ends[ix]-len(bins):ends[ix]]
+            self.accumulators[int(label)] = _accumulator(self.bin_width, state['count'][ix],
+                state['mean'][ix], state['m2'][ix], state['min'][ix], state['max'][ix],
+                hist, state['hist_start'][ix])
+
+@profiled
+def label_histogram(x, y, bin_width=1.0):
+    """LabelHistogram of an image and its label map, computed slice by slice
+    so that no copy of the whole image is made."""
+    histogram = LabelHistogram(bin_width=bin_width)
+    for slice_ix in range(x.shape[0]):
+        histogram.update(x[slice_ix], y[slice_ix])
+    return histogram
+
+class HistogramStore:
+    """Label histograms of the subjects of a dataset, as stored during the
+    extraction in a records file of (subject name, LabelHistogram) pairs.
+    The statistics of all subjects are held in columnar arrays, so that
+    merging the histograms of any subset of subjects is vectorised.
+
+    Parameters:
+    path (str): records file, see extract_ds_stats
+    """
+    def __init__(self, path):
+        states = dict()
+        for subject_name, histogram in read_records(path):
+            # A later record of a subject replaces an earlier one
+            states[subject_name] = histogram.__getstate__()
+        self.subjects = sorted(states.keys())
+        bin_widths = set(state['bin_width'] for state in states.values())
+        assert len(bin_widths) <= 1, "Histograms have different bin widths"
+        self.bin_width = bin_widths.pop() if bin_widths else 1.0
+        states = [states[subject_name] for subject_name in self.subjects]
+        # A row for each label of each subject, and an entry for each non-zero bin
+        def column(key, dtype):
+            return np.concatenate([np.zeros(0, dtype=dtype)] + [state[key].astype(dtype) for state in states])
+        self.row_subject = np.repeat(np.arange(len(states)), [len(state['labels']) for state in states])
+        self.row_label = column('labels', np.int64)
+        for key in ['count', 'hist_start']:
+            setattr(self, 'row_'+key, column(key, np.int64))
+        for key in ['mean', 'm2', 'min', 'max']:
+            setattr(self, 'row_'+key, column(key, np.float64))
+        # Entries are ordered by subject, so those of a subject are contiguous
+        nr_nonzero = column('nr_nonzero', np.int64)
+        self.subject_entry_end = np.cumsum(np.bincount(self.row_subject, weights=nr_nonzero,
+            minlength=len(states))).astype(np.int64)
+        entry_row = np.repeat(np.arange(len(self.row_label)), nr_nonzero)
+        entry_bin = column('bins', np.int64) + self.row_hist_start[entry_row]
+        self.entry_count = column('counts', np.int64)
+        # Position of each entry in a dense (label, bin) histogram of all 
+        # subjects, so that entries are summed with one bincount
+        self.labels, self.row_label_ix = np.unique(self.row_label, return_inverse=True)
+        self.first_bin = entry_bin.min() if len(entry_bin) else 0
+        self.nr_bins = int(entry_bin.max() - self.first_bin + 1) if len(entry_bin) else 0
+        self.entry_key = self.row_label_ix[entry_row] * self.nr_bins + (entry_bin - self.first_bin)
+
+    def __len__(self):
+        return len(self.subjects)
+
+    def _subject_names(self, names, img_mode=None):
+        """Subject names of the given names, e.g. case names of a clustering,
+        which are completed with the mode suffix if img_mode is given."""
+        if img_mode is not None:
+            names = ['{}_{:04d}'.format(name, img_mode) for name in names]
+        return [name.split('.')[0] for name in names]
+
+    def merged(self, subjects=None, img_mode=None):
+        """LabelHistogram of the voxels of some subjects, all if None.
+
+        Parameters:
+        subjects (lst(str) or None): subject names, or file names
+        img_mode (int or None): if given, subjects are case names and the
+            subjects of this mode are merged
+
+        Returns:
+        LabelHistogram: merged histogram
+        """
+        if subjects is None:
+            rows = np.arange(len(self.row_label))
+            entry_key, entry_count = self.entry_key, self.entry_count
+        else:
+            subject_names = self._subject_names(subjects, img_mode=img_mode)
+            missing = set(subject_names) - set(self.subjects)
+            assert not missing, "No histograms for {}".format(sorted(missing))
+            subject_ixs = np.unique(np.searchsorted(self.subjects, subject_names))
+            rows = np.flatnonzero(np.isin(self.row_subject, subject_ixs))
+            # Entries of the subjects, as the concatenated ranges of each
+            ends = self.subject_entry_end[subject_ixs]
+            lengths = ends - np.concatenate([[0], self.subject_entry_end])[subject_ixs]
+            entries = np.arange(lengths.sum()) + np.repeat(ends - np.cumsum(lengths), lengths)
+            entry_key, entry_count = self.entry_key[entries], self.entry_count[entries]
+        label_ixs, row_label_ix = np.unique(self.row_label_ix[rows], return_inverse=True)
+        labels = self.labels[label_ixs]
+        # Moments are merged as with IntensityAccumulator.merge
+        count = np.bincount(row_label_ix, weights=self.row_count[rows], minlength=len(labels))
+        mean = np.bincount(row_label_ix, weights=self.row_count[rows] * self.row_mean[rows],
+            minlength=len(labels)) / count
+        m2 = np.bincount(row_label_ix, weights=self.row_m2[rows] + self.row_count[rows] *
+            (self.row_mean[rows] - mean[row_label_ix])**2, minlength=len(labels))
+        minimum, maximum = np.full(len(labels), np.inf), np.full(len(labels), -np.inf)
+        np.minimum.at(minimum, row_label_ix, self.row_min[rows])
+        np.maximum.at(maximum, row_label_ix, self.row_max[rows])
+        # All bins of all labels are summed with one bincount
+        hists = np.bincount(entry_key, weights=entry_count, minlength=len(self.labels) * self.nr_bins)
+        hists = hists.reshape(len(self.labels), self.nr_bins)
+        histogram = LabelHistogram(bin_width=self.bin_width)
+        for ix, label_ix in enumerate(label_ixs):
+            nonzero = np.flatnonzero(hists[label_ix])
+            hist = hists[label_ix, nonzero[0]:nonzero[-1]+1]
+            histogram.accumulators[int(labels[ix])] = _accumulator(self.bin_width, count[ix], 
+                mean[ix], m2[ix], minimum[ix], maximum[ix], hist, self.first_bin + nonzero[0])
+        return histogram
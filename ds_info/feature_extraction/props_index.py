@@ -0,0 +1,81 @@
+#   Vectorised queries over the properties of a dataset, e.g. to select the
+#   subjects closest to a given resolution and foreground size.
+
+import numpy as np
+from ds_info.feature_extraction.props_table import PropsTable
+
+class PropsIndex:
+    """Index over one or more features of a dataset, supporting k-nearest
+    neighbour, radius and box queries. Each feature is a dimension of the
+    index, and vector features contribute one dimension per entry. Distances
+    are Euclidean after dividing each dimension by its scale.
+
+    Parameters:
+    props (dict(str -> OrderedDict(str -> Any)) or PropsTable): properties
+    keys (lst(str or (str, int))): features used as dimensions. An entry of a
+        vector feature is selected with a (key, index) pair, e.g. ('spacing', 2)
+    scale (None, 'std' or lst(float)): scale of each dimension; 'std' divides
+        by the standard deviation of the subjects, so features with different
+        units have a similar weight
+    """
+    def __init__(self, props, keys, scale=None):
+        table = props if isinstance(props, PropsTable) else PropsTable.from_props(props)
+        self.subjects = np.array(table.subjects, dtype=object)
+        dims = []
+        for key in keys:
+            if isinstance(key, tuple):
+                key, ix = key
+                dims.append(table[key][:, ix])
+            else:
+                column = table[key]
+                dims.extend([column] if column.ndim == 1 else column.T)
+        self.values = np.stack(dims, axis=1).astype(np.float64)
+        if scale is None:
+            self.scale = np.ones(self.values.shape[1])
+        elif isinstance(scale, str):
+            assert scale == 'std'
+            self.scale = np.nanstd(self.values, axis=0)
+            self.scale[~(self.scale > 0)] = 1.0
+        else:
+            self.scale = np.asarray(scale, dtype=np.float64)
+            assert self.scale.shape == (self.values.shape[1],)
+        self.scaled_values = self.values / self.scale
+        self._tree = None
+
+    @property
+    def tree(self):
+        # Built on the first query that needs it
+        if self._tree is None:
+            from scipy.spatial import cKDTree
+            self._tree = cKDTree(self.scaled_values)
+        return self._tree
+
+    def _point(self, value):
+        return np.ravel(value).astype(np.float64) / self.scale
+
+    def distances(self, value):
+        """Scaled distance of each subject to value."""
+        return np.linalg.norm(self.scaled_values - self._point(value), axis=1)
+
+    def k_nearest(self, value, k=None):
+        """Subjects ordered by their distance to value, the k closest if k is
+        not None. Ties keep the order of the subjects, except for few
+        neighbours of many subjects, which are queried from the KD-tree."""
+        if k is not None and len(self.subjects) > 1000 and k < len(self.subjects) // 10:
+            _, ixs = self.tree.query(self._point(value), k=k)
+            return list(self.subjects[np.atleast_1d(ixs)])
+        ixs = np.argsort(self.distances(value), kind='stable')
+        return list(self.subjects[ixs if k is None else ixs[:k]])
+
+    def within_radius(self, value, radius):
+        """Subjects with a scaled distance to value of at most radius, in the
+        order of the subjects."""
+        ixs = self.tree.query_ball_point(self._point(value), r=radius)
+        return list(self.subjects[np.sort(np.asarray(ixs, dtype=np.int64))])
+
+    def in_box(self, mins, maxs):
+        """Subjects with all dimensions within [mins, maxs], given in the units
+        of the features, in the order of the subjects."""
+        mins, maxs = np.ravel(mins), np.ravel(maxs)
+        mask = np.all((self.values >= mins) & (self.values <= maxs), axis=1)
+        return list(self.subjects[mask])
@@ -0,0 +1,138 @@
+#   Columnar storage of the properties extracted for each subject.
+
+import numpy as np
+from collections import OrderedDict
+
+class PropsTable:
+    """Properties of a dataset as one array per feature, with a row per
+    subject. Scalar features are stored as arrays of shape (n,), and vector
+    features such as the resolution as arrays of shape (n, k).
+
+    Parameters:
+    subjects (lst(str)): subject names, in row order
+    columns (OrderedDict(str -> numpy.ndarray)): array for each feature
+    """
+    def __init__(self, subjects, columns):
+        self.subjects = list(subjects)
+        self.columns = OrderedDict(columns)
+        # Row of each subject
+        self.index = dict((subject, ix) for ix, subject in enumerate(self.subjects))
+        for key, column in self.columns.items():
+            assert column.ndim in [1, 2] and len(column) == len(self.subjects), key
+
+    @classmethod
+    def from_props(cls, props):
+        """Build the table from a dict(subject -> OrderedDict(feature -> value)),
+        as returned by extract_ds_stats. Features missing for a subject are
+        NaN, and are ignored by the statistics."""
+        subjects = list(props.keys())
+        keys = OrderedDict()
+        for subject_props in props.values():
+            for key, value in subject_props.items():
+                if key not in keys:
+                    keys[key] = np.shape(value)
+        columns = OrderedDict()
+        for key, shape in keys.items():
+            values = [props[subject].get(key) for subject in subjects]
+            if any(value is None for value in values):
+                values = [np.full(shape, np.nan) if value is None else value for value in values]
+            columns[key] = np.asarray(values)
+        return cls(subjects, columns)
+
+    def __len__(self):
+        return len(self.subjects)
+
+    def __getitem__(self, key):
+        return self.columns[key]
+
+    def __contains__(self, key):
+        return key in self.columns
+
+    def keys(self):
+        return self.columns.keys()
+
+    def row(self, subject):
+        """Properties of a subject, with tuples for vector features."""
+        ix = self.index[subject]
+        return OrderedDict((key, _to_value(column[ix])) for key, column in self.columns.items())
+
+    def to_props(self):
+        """Inverse of from_props."""
+        props = dict((subject, OrderedDict()) for subject in self.subjects)
+        for key, column in self.columns.items():
+            for subject, value in zip(self.subjects, column):
+                props[subject][key] = _to_value(value)
+        return props
+
+    def select(self, subjects):
+        """Table with the rows of some subjects."""
+        ixs = [self.index[subject] for subject in subjects]
+        return PropsTable(subjects, OrderedDict(
+            (key, column[ixs]) for key, column in self.columns.items()))
+
+    def mean_std(self, round=2):
+        means, stds = OrderedDict(), OrderedDict()
+        for key, column in self.columns.items():
+            means[key], stds[key] = np.nanmean(column, axis=0), np.nanstd(column, axis=0)
+            if round is not None:
+                means[key], stds[key] = np.round(means[key], round), np.round(stds[key], round)
+        return means, stds
+
+    def range(self):
+        mins, maxs = OrderedDict(), OrderedDict()
+        for key, column in self.columns.items():
+            mins[key], maxs[key] = np.nanmin(column, axis=0), np.nanmax(column, axis=0)
+        return mins, maxs
+
+    def to_pandas(self, columns=None):
+        """Data frame with a 'subject' column and a column per feature, where
+        vector features are divided into fixed-width columns, e.g. 'spacing_0'."""
+        import pandas as pd
+        data = OrderedDict([('subject', self.subjects)])
+        for key in (self.keys() if columns is None else columns):
+            column = self.columns[key]
+            if column.ndim == 1:
+                data[key] = column
+            else:
+                for ix in range(column.shape[1]):
+                    data['{}_{}'.format(key, ix)] = column[:, ix]
+        return pd.DataFrame(data)
+
+    def to_parquet(self, path):
+        """Store the table in Parquet format, keeping the type of each feature.
+        Vector features are stored as fixed-size lists. Requires pyarrow."""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        arrays, names = [pa.array(self.subjects, type=pa.string())], ['subject']
+        for key, column in self.columns.items():
+            if column.ndim == 1:
+                arrays.append(pa.array(column))
+            else:
+                arrays.append(pa.FixedSizeListArray.from_arrays(
+                    pa.array(np.ascontiguousarray(column).ravel()), column.shape[1]))
+            names.append(key)
+        pq.write_table(pa.Table.from_arrays(arrays, names=names), path)
+
+    @classmethod
+    def from_parquet(cls, path):
+        """Load a table stored with to_parquet. Requires pyarrow."""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        table = pq.read_table(path)
+        subjects = table.column('subject').to_pylist()
+        columns = OrderedDict()
+        for key in table.column_names:
+            if key == 'subject':
+                continue
+            array = table.column(key).combine_chunks()
+            if pa.types.is_fixed_size_list(array.type):
+                columns[key] = array.flatten().to_numpy(zero_copy_only=False).reshape(
+                    -1, array.type.list_size)
+            else:
+                columns[key] = array.to_numpy(zero_copy_only=False)
+        return cls(subjects, columns)
+
+def _to_value(value):
+    if np.ndim(value) == 0:
+        return value.item()
+    return tuple(value.tolist())
@@ -0,0 +1,138 @@
+#   On-disk cache of per-case features, stored in an SQLite database.
+
+import os
+import sys
+import json
+import pickle
+import sqlite3
+import hashlib
+import inspect
+
+def file_signature(file_paths):
+    """Cheap signature of a group of files: name, size and modification time.
+
+    Parameters:
+    file_paths (lst(str)): file paths
+
+    Returns:
+    str: signature in json format
+    """
+    signature = []
+    for file_path in file_paths:
+        stat = os.stat(file_path)
+        signature.append([os.path.basename(file_path), stat.st_size, stat.st_mtime_ns])
+    return json.dumps(signature)
+
+def content_hash(file_paths, block_size=2**20):
+    """SHA-1 hash of the contents of a group of files."""
+    sha = hashlib.sha1()
+    for file_path in file_paths:
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(block_size), b''):
+                sha.update(block)
+    return sha.hexdigest()
+
+def _imported_modules(module_name):
+    """Names of the ds_info modules that a module reaches through its imports
+    at module level, including itself."""
+    module_names, todo = set(), [module_name]
+    while todo:
+        module_name = todo.pop()
+        if module_name in module_names:
+            continue
+        module_names.add(module_name)
+        for value in vars(sys.modules[module_name]).values():
+            value_module = value.__name__ if inspect.ismodule(value) else getattr(value, '__module__', None)
+            if (isinstance(value_module, str) and value_module.split('.')[0] == 'ds_info' 
+                and value_module in sys.modules):
+                todo.append(value_module)
+    return module_names
+
+def feature_set_version(feature_fn, **kwargs):
+    """Version of a feature function, which changes whenever the source code
+    of its module, or of any ds_info module it reaches through its imports,
+    changes, e.g. of a helper of a module it imports from.
+
+    Parameters:
+    feature_fn (function): function that extracts the features of a case
+    kwargs: further arguments that change the features, e.g. img_mode
+
+    Returns:
+    str: version hash
+    """
+    module_names = _imported_modules(feature_fn.__module__)
+    sha = hashlib.sha1(feature_fn.__qualname__.encode())
+    for module_name in sorted(module_names):
+        sha.update(inspect.getsource(sys.modules[module_name]).encode())
+    sha.update(json.dumps(sorted((key, repr(value)) for key, value in kwargs.items())).encode())
+    return sha.hexdigest()
+
+class FeatureCache:
+    """Stores the features extracted for each case, keyed by the dataset, the
+    case name, the files the features were extracted from and the version of
+    the feature set. A case is looked up by the size and modification time of
+    its files, and if these changed, by the hash of their contents. Entries
+    of other feature set versions, e.g. extracted with another img_mode, are
+    kept, so runs with different options can share a cache file.
+
+    Parameters:
+    cache_path (str): path to the SQLite database, created if it does not exist
+    version (str): version of the feature set, see feature_set_version
+    """
+    def __init__(self, cache_path, version):
+        self.version = version
+        self.hits, self.misses, self.bytes_saved = 0, 0, 0
+        self.connection = sqlite3.connect(cache_path)
+        with self.connection:
+            self.connection.execute("""CREATE TABLE IF NOT EXISTS features (
+                dataset TEXT, case_name TEXT, version TEXT, signature TEXT,
+                content_hash TEXT, props BLOB, PRIMARY KEY (dataset, case_name, version))""")
+
+    def get(self, dataset_path, case_name, file_paths):
+        """Returns the cached features of a case, or None if these are missing
+        or outdated."""
+        dataset_path = os.path.abspath(dataset_path)
+        row = self.connection.execute("""SELECT signature, content_hash, props
+            FROM features WHERE dataset = ? AND case_name = ? AND version = ?""",
+            (dataset_path, case_name, self.version)).fetchone()
+        if row is not None:
+            signature, stored_hash, props = row
+            new_signature = file_signature(file_paths)
+            if new_signature != signature:
+                # Files were touched or rewritten, but may have the same content
+                if content_hash(file_paths) != stored_hash:
+                    row = None
+                else:
+                    with self.connection:
+                        self.connection.execute("""UPDATE features SET signature = ?
+                            WHERE dataset = ? AND case_name = ? AND version = ?""",
+                            (new_signature, dataset_path, case_name, self.version))
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.bytes_saved += sum(os.path.getsize(file_path) for file_path in file_paths)
+        return pickle.loads(props)
+
+    def put(self, dataset_path, case_name, file_paths, props):
+        """Stores the features of a case."""
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO features VALUES (?, ?, ?, ?, ?, ?)",
+                (os.path.abspath(dataset_path), case_name, self.version,
+                file_signature(file_paths), content_hash(file_paths),
+                pickle.dumps(props, protocol=pickle.HIGHEST_PROTOCOL)))
+
+    def remove_other_versions(self):
+        """Removes the entries of all other feature set versions, e.g. after
+        the source code changed, and returns their number."""
+        with self.connection:
+            return self.connection.execute(
+                "DELETE FROM features WHERE version != ?", (self.version,)).rowcount
+
+    def report(self):
+        """Summary of the cache use."""
+        return 'Cache hits: {} misses: {} bytes saved: {:.1f} MB'.format(
+            self.hits, self.misses, self.bytes_saved / 2**20)
+
+    def close(self):
+        self.connection.close()
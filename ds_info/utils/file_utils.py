@@ -0,0 +1,95 @@
+#   Indexing and linking of dataset files, used to create new datasets from
+#   the cases of existing ones.
+
+import os
+import re
+import shutil
+import fcntl
+from concurrent.futures import ThreadPoolExecutor
+
+LINK_STRATEGIES = ['copy', 'hardlink', 'reflink', 'symlink']
+# ioctl request that clones a file on copy-on-write file systems (Btrfs, XFS)
+FICLONE = 0x40049409
+
+def case_name_from_file(file_name, has_mode=False):
+    """Case name of an image or label map file.
+
+    Parameters:
+    file_name (str): file name, e.g. 'lung_001_0000.nii.gz' or 'lung_001.nii.gz'
+    has_mode (bool): whether the name ends with a mode, as for images
+
+    Returns:
+    str: case name, e.g. 'lung_001'
+    """
+    name = file_name.split('.')[0]
+    if has_mode:
+        name = re.sub(r'_\d{4}$', '', name)
+    return name
+
+def index_case_files(dir_path, has_mode=False):
+    """Group the files of a directory by exact case name.
+
+    Parameters:
+    dir_path (str): directory, e.g. imagesTr or labelsTr of a dataset
+    has_mode (bool): whether file names end with a mode, as for images
+
+    Returns:
+    dict(str -> lst(str)): file names for each case name
+    """
+    index = dict()
+    for file_name in sorted(os.listdir(dir_path)):
+        if os.path.isfile(os.path.join(dir_path, file_name)):
+            index.setdefault(case_name_from_file(file_name, has_mode), []).append(file_name)
+    return index
+
+def _reflink(src, dst):
+    with open(src, 'rb') as src_file, open(dst, 'wb') as dst_file:
+        fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+
+def link_file(src, dst, strategy='copy'):
+    """Create dst from src with a copy, hard link, reflink or symbolic link. If
+    reflinks are not supported by the file system, the file is copied.
+
+    Returns:
+    int: number of bytes written
+    """
+    assert strategy in LINK_STRATEGIES
+    if strategy == 'hardlink':
+        os.link(src, dst)
+        return 0
+    if strategy == 'symlink':
+        os.symlink(os.path.abspath(src), dst)
+        return 0
+    if strategy == 'reflink':
+        try:
+            _reflink(src, dst)
+            return 0
+        except OSError:
+            if os.path.exists(dst):
+                os.remove(dst)
+    shutil.copyfile(src, dst)
+    return os.path.getsize(dst)
+
+def transfer_files(file_pairs, strategy='copy', workers=8, dry_run=False):
+    """Create files from others, with a pool of threads for copies.
+
+    Parameters:
+    file_pairs (lst((str, str))): source and destination paths
+    strategy (str): one of LINK_STRATEGIES
+    workers (int): number of threads
+    dry_run (bool): only count the bytes that would be written
+
+    Returns:
+    int: number of bytes written. For a dry run with reflinks, the size of the
+        copies made if reflinks are not supported
+    """
+    assert strategy in LINK_STRATEGIES
+    if dry_run:
+        if strategy in ['hardlink', 'symlink']:
+            return 0
+        return sum(os.path.getsize(src) for src, _ in file_pairs)
+    if strategy in ['hardlink', 'symlink']:
+        return sum(link_file(src, dst, strategy) for src, dst in file_pairs)
+    # Copies are bound by I/O, so threads overlap them
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return sum(executor.map(lambda pair: link_file(pair[0], pair[1], strategy), file_pairs))
@@ -1,6 +1,7 @@
 
 import numbers
 import numpy as np
+from collections import OrderedDict
 
 def zeros_in_format(format_rep):
     if isinstance(format_rep, numbers.Number):
@@ -10,4 +11,41 @@ def zeros_in_format(format_rep):
     if isinstance(format_rep, tuple):
         return tuple([0]*len(format_rep))
     if isinstance(format_rep, np.ndarray):
-        return np.zeros_like(format_rep)
\ No newline at end of file
+        return np.zeros_like(format_rep)
+
+def props_schema(props_iter, label_names=None):
+    """Zero value of each property of a dataset, built from the properties of
+    one subject at a time so that these need not be in memory at once.
+    Properties of a label are named '<label>_<feature>'. If label_names are
+    given, e.g. from dataset.json, features are added for labels missing in
+    all subjects, with the format of the same feature of other labels.
+
+    Parameters:
+    props_iter (iterable(OrderedDict(str -> Any))): properties of each subject
+    label_names (lst(str) or None): foreground labels
+
+    Returns:
+    OrderedDict(str -> Any): zero value of each property, in the order the
+        properties were first found
+    """
+    schema, label_features = OrderedDict(), OrderedDict()
+    for props in props_iter:
+        for key, value in props.items():
+            if key not in schema:
+                schema[key] = zeros_in_format(value)
+            label, _, feature = key.partition('_')
+            if label.isdigit() and feature not in label_features:
+                label_features[feature] = zeros_in_format(value)
+    for label in (label_names or []):
+        for feature, zero in label_features.items():
+            key = '{}_{}'.format(label, feature)
+            if key not in schema:
+                schema[key] = zero
+    return schema
+
+def fill_missing_props(props, schema):
+    """Add the properties of a schema that are missing in props, with zeros."""
+    for key, zero in schema.items():
+        if key not in props:
+            props[key] = zeros_in_format(zero)
+    return props
@@ -0,0 +1,46 @@
+import numpy as np
+
+def center_crop(x, roi_size, downsample=1):
+    """Center-crop an array so its last dimensions have the specified size, in
+    the same way as monai.transforms.CenterSpatialCrop. Only slicing is used, 
+    so a view of x is returned and no data is copied. This also works for
+    torch tensors and memory-mapped arrays.
+
+    Parameters:
+    x (numpy.ndarray): array, e.g. an image with or without a channel dimension
+    roi_size (tuple(int)): size of the crop for the last len(roi_size) 
+        dimensions. Non-positive values keep the whole dimension.
+    downsample (int): keep every downsample-th voxel along each cropped dimension
+
+    Returns:
+    numpy.ndarray: view of the cropped array
+    """
+    spatial_shape = x.shape[-len(roi_size):]
+    crop_slices = []
+    for dim, roi_dim in zip(spatial_shape, roi_size):
+        if roi_dim <= 0:
+            roi_dim = dim
+        start = max(dim // 2 - roi_dim // 2, 0)
+        crop_slices.append(slice(start, min(start + roi_dim, dim), downsample))
+    return x[(Ellipsis,) + tuple(crop_slices)]
+
+def thumbnail(x, size):
+    """Resize the last dimensions of an array to a fixed size with linear
+    interpolation, e.g. to compare images of different shapes. The array is
+    first subsampled with the largest stride that keeps at least size voxels
+    along each dimension, so for memory-mapped arrays only these are read.
+
+    Parameters:
+    x (numpy.ndarray): array, e.g. an image with or without a channel dimension
+    size (tuple(int)): size of the last len(size) dimensions
+
+    Returns:
+    numpy.ndarray: float32 thumbnail
+    """
+    from scipy.ndimage import zoom
+    spatial_shape = x.shape[-len(size):]
+    strides = [max(1, dim // thumbnail_dim) for dim, thumbnail_dim in zip(spatial_shape, size)]
+    x = np.asarray(x[(Ellipsis,) + tuple(slice(None, None, stride) for stride in strides)], dtype=np.float32)
+    factors = [1] * (x.ndim - len(size)) + [thumbnail_dim / dim for dim, thumbnail_dim in 
+        zip(x.shape[-len(size):], size)]
+    return zoom(x, factors, order=1)
@@ -1,5 +1,11 @@
 import os
-import SimpleITK as sitk
+import re
+from collections import OrderedDict
+# SimpleITK is slow to import, so it is only imported by the functions that
+# read images
+from ds_info.utils.label_utils import compact_label_map
+from ds_info.utils.profiling import profiled, add_bytes_read
+from ds_info.utils.file_utils import index_case_files
 
 def list_files(dataset_path):
     """List files in a dataset directory with the format of the Medical
@@ -16,6 +22,53 @@ def list_files(dataset_path):
         os.path.isfile(os.path.join(train_img_path, f))]
     return file_names
 
+_case_indexes = dict() # imagesTr path -> (mtime_ns, index)
+
+def _case_index(dataset_path):
+    """index_case_files of the images of a dataset, which is listed again
+    only when files are added to or removed from the directory."""
+    img_dir = os.path.join(dataset_path, 'imagesTr')
+    mtime_ns = os.stat(img_dir).st_mtime_ns
+    if _case_indexes.get(img_dir, (None,))[0] != mtime_ns:
+        _case_indexes[img_dir] = mtime_ns, index_case_files(img_dir, has_mode=True)
+    return _case_indexes[img_dir][1]
+
+def list_cases(dataset_path):
+    """List the cases of a dataset with the format of the Medical Segmentation
+    Decathlon, with the image file of each mode.
+
+    Parameters:
+    dataset_path (str): path to a dataset
+
+    Returns:
+    OrderedDict(str -> lst(str)): image file names of each case, ordered wrt.
+        the case name and the mode
+    """
+    cases = _case_index(dataset_path)
+    return OrderedDict((case_name, list(cases[case_name])) for case_name in sorted(cases.keys()))
+
+def get_case_paths(dataset_path, case_name, cases=None):
+    """Paths of the images of all modes of a case, and of its label map,
+    which has the ending of the images, e.g. .nii or .nii.gz.
+
+    Parameters:
+    dataset_path (str): path to a dataset
+    case_name (str): name of the case, without mode or ending
+    cases (dict(str -> lst(str)) or None): image file names of each case,
+        e.g. of list_cases, by default those of the dataset
+
+    Returns:
+    (lst(str), str): image paths, ordered wrt. the mode, and label map path
+    """
+    cases = _case_index(dataset_path) if cases is None else cases
+    img_file_names = cases.get(case_name, [])
+    img_paths = [os.path.join(dataset_path, 'imagesTr', file_name) for file_name in img_file_names]
+    # The ending follows the mode suffix, e.g. _0000
+    ending = img_file_names[0][len(case_name)+5:] if img_file_names else '.nii.gz'
+    label_path = os.path.join(dataset_path, 'labelsTr', case_name + ending)
+    return img_paths, label_path
+
+@profiled
 def get_img_label(dataset_path, file_name):
     """Load an image or label map.
 
@@ -27,13 +80,114 @@ def get_img_label(dataset_path, file_name):
     Returns:
     (SimpleITK.SimpleITK.Image, SimpleITK.SimpleITK.Image): image and label map
     """
+    import SimpleITK as sitk
+    img_path, label_path = get_img_label_paths(dataset_path, file_name)
+    add_bytes_read(img_path, label_path)
+    return sitk.ReadImage(img_path), sitk.ReadImage(label_path)
+
+def get_img_label_paths(dataset_path, file_name):
+    """Paths of an image and the corresponding label map.
+
+    Parameters:
+    dataset_path (str): path to a dataset with the Medical Segmentation 
+        Decathlon structure
+    file_name (str): name of the image file, including ending
+
+    Returns:
+    (str, str): image and label map paths
+    """
     img_path = os.path.join(dataset_path, 'imagesTr', file_name)
-    # Remove the mode, e.g. _0000, _0001
-    for possible_mode in range(5):
-        file_name = file_name.replace('_000{}.nii'.format(possible_mode), '.nii')
+    # Remove the mode, e.g. _0000, _0001, only once so that case names ending
+    # with digits, e.g. case_0001_0000.nii.gz, are kept
+    file_name = re.sub(r'_000[0-4]\.nii', '.nii', file_name, count=1)
     label_path = os.path.join(dataset_path, 'labelsTr', file_name)
-    return sitk.ReadImage(img_path), sitk.ReadImage(label_path)
+    return img_path, label_path
+
+class ImageInfo:
+    """Header information of an image. It has the getters of a SimpleITK 
+    image for this information, so it can be used in place of one when the 
+    voxels are not needed, e.g. by img_features.voxel_spacing.
+    """
+    def __init__(self, size, spacing, origin, direction, nr_components=1):
+        self.size = tuple(size)
+        self.spacing = tuple(spacing)
+        self.origin = tuple(origin)
+        self.direction = tuple(direction)
+        self.nr_components = nr_components
+
+    def GetSize(self):
+        return self.size
+
+    def GetSpacing(self):
+        return self.spacing
+
+    def GetOrigin(self):
+        return self.origin
+
+    def GetDirection(self):
+        return self.direction
+
+    def GetDimension(self):
+        return len(self.size)
+
+    def GetNumberOfComponentsPerPixel(self):
+        return self.nr_components
+
+    def to_dict(self):
+        return {'size': self.size, 'spacing': self.spacing, 'origin': self.origin,
+            'direction': self.direction, 'nr_components': self.nr_components}
+
+    @classmethod
+    def from_dict(cls, info_dict):
+        return cls(**info_dict)
+
+    @classmethod
+    def from_image(cls, img):
+        """Information of a SimpleITK image."""
+        return cls(img.GetSize(), img.GetSpacing(), img.GetOrigin(), 
+            img.GetDirection(), img.GetNumberOfComponentsPerPixel())
+
+    def array_shape(self):
+        """Shape of the image in numpy format, i.e. as returned by 
+        sitk.GetArrayFromImage."""
+        shape = tuple(reversed(self.size))
+        if self.nr_components > 1:
+            shape += (self.nr_components,)
+        return shape
+
+@profiled
+def read_image_info(path):
+    """Read the header of an image file, without reading the voxels.
+
+    Parameters:
+    path (str): image path
+
+    Returns:
+    ImageInfo: size, spacing, origin, direction and number of components
+    """
+    import SimpleITK as sitk
+    reader = sitk.ImageFileReader()
+    reader.SetFileName(path)
+    reader.ReadImageInformation()
+    return ImageInfo(reader.GetSize(), reader.GetSpacing(), reader.GetOrigin(),
+        reader.GetDirection(), reader.GetNumberOfComponents())
+
+@profiled
+def get_img_label_info(dataset_path, file_name):
+    """Read the headers of an image and label map.
+
+    Parameters:
+    dataset_path (str): path to a dataset with the Medical Segmentation 
+        Decathlon structure
+    file_name (str): name of the file, including ending
+
+    Returns:
+    (ImageInfo, ImageInfo): image and label map information
+    """
+    img_path, label_path = get_img_label_paths(dataset_path, file_name)
+    return read_image_info(img_path), read_image_info(label_path)
 
+@profiled
 def get_arrays_from_img_label(img, label, img_mode=None):
     """Transform a SimpleITK image and label map into numpy arrays, and 
         optionally select a channel.
@@ -44,13 +198,229 @@ def get_arrays_from_img_label(img, label, img_mode=None):
     img_mode (int or None): optional mode channel, so output is 3D
 
     Returns:
-    (numpy.ndarray, numpy.ndarray): image and label in numpy format
+    (numpy.ndarray, numpy.ndarray): image and label in numpy format, the label
+        with the smallest integer type that holds all labels
     """
+    import SimpleITK as sitk
     img_np = sitk.GetArrayFromImage(img)
     if img_mode is not None:
         img_np = img_np[img_mode]
     label_np = sitk.GetArrayFromImage(label)
-    return img_np, label_np.astype(int)
+    return img_np, compact_label_map(label_np)
+
+# NUMPY STORE
+# Uncompressed copies of images and label maps, stored as .npy files in the 
+# 'npy' directory of a dataset, with a json sidecar with the image information.
+# These are loaded as memory-mapped arrays.
+import json
+import numpy as np
+from tqdm import tqdm
+
+def get_npy_path(dataset_path, path):
+    """Path of the npy copy of an image or label map file."""
+    dir_name = os.path.basename(os.path.dirname(path))
+    file_name = os.path.basename(path).split('.')[0] + '.npy'
+    return os.path.join(dataset_path, 'npy', dir_name, file_name)
+
+def _source_signature(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+def _npy_info(npy_path, path):
+    """ImageInfo stored in the json sidecar of the npy copy of a file, or None
+    if there is no copy or it is outdated, i.e. the size or modification time
+    of the file differ from those it was converted from. Equality is required,
+    so files replaced by older ones, e.g. with cp -p, are also detected."""
+    json_path = npy_path[:-len('.npy')]+'.json'
+    if not (os.path.isfile(npy_path) and os.path.isfile(json_path)):
+        return None
+    with open(json_path, 'r') as json_file:
+        sidecar = json.load(json_file)
+    if sidecar.get('source') != _source_signature(path):
+        return None
+    return ImageInfo.from_dict(sidecar['info'])
+
+def _write_atomically(path, write_fn, mode='w'):
+    """Write to a temporary file first, so an interrupted write does not
+    leave an incomplete file."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, mode) as f:
+        write_fn(f)
+    os.replace(tmp_path, path)
+
+@profiled
+def convert_to_npy(dataset_path, file_name, overwrite=False):
+    """Store uncompressed copies of an image and its label map. Label maps are
+    stored with the smallest integer type that holds all labels. Copies of
+    the current files, by size and modification time, are kept unless 
+    overwrite is True.
+
+    Parameters:
+    dataset_path (str): path to a dataset with the Medical Segmentation 
+        Decathlon structure
+    file_name (str): name of the image file, including ending
+    overwrite (bool): convert even if the copies are up to date
+    """
+    import SimpleITK as sitk
+    img_path, label_path = get_img_label_paths(dataset_path, file_name)
+    for path, is_label in [(img_path, False), (label_path, True)]:
+        npy_path = get_npy_path(dataset_path, path)
+        if not overwrite and _npy_info(npy_path, path) is not None:
+            continue
+        os.makedirs(os.path.dirname(npy_path), exist_ok=True)
+        # Taken before reading, so a file modified meanwhile is converted again
+        source = _source_signature(path)
+        add_bytes_read(path)
+        img = sitk.ReadImage(path)
+        img_np = sitk.GetArrayFromImage(img)
+        if is_label:
+            img_np = compact_label_map(img_np)
+        _write_atomically(npy_path, lambda f: np.save(f, img_np), mode='wb')
+        # The sidecar is written last, so an interrupted conversion does not
+        # leave a copy that looks up to date
+        sidecar = {'info': ImageInfo.from_image(img).to_dict(), 'source': source}
+        _write_atomically(npy_path[:-len('.npy')]+'.json', lambda f: json.dump(sidecar, f))
+
+def convert_ds_to_npy(dataset_path, overwrite=False):
+    """Store uncompressed copies of all images and label maps of a dataset."""
+    for file_name in tqdm(list_files(dataset_path)):
+        convert_to_npy(dataset_path, file_name, overwrite=overwrite)
+
+@profiled
+def load_img_label(dataset_path, file_name, img_mode=None, mmap_mode='r'):
+    """Load an image and label map as numpy arrays. If up-to-date copies were
+    stored with convert_to_npy, these are memory-mapped, so only the pages 
+    that are accessed are read from disk. Otherwise, the files are read with
+    SimpleITK.
+
+    Parameters:
+    dataset_path (str): path to a dataset with the Medical Segmentation 
+        Decathlon structure
+    file_name (str): name of the image file, including ending
+    img_mode (int or None): optional mode channel, so output is 3D
+    mmap_mode (str or None): mode for np.load, None to read into memory
+
+    Returns:
+    (numpy.ndarray, numpy.ndarray, ImageInfo): image and label in numpy 
+        format, and the information of the image
+    """
+    img_path, label_path = get_img_label_paths(dataset_path, file_name)
+    img_npy_path = get_npy_path(dataset_path, img_path)
+    label_npy_path = get_npy_path(dataset_path, label_path)
+    img_info = _npy_info(img_npy_path, img_path)
+    if img_info is not None and _npy_info(label_npy_path, label_path) is not None:
+        # Size of the mapped files, of which only accessed pages are read
+        add_bytes_read(img_npy_path, label_npy_path)
+        img_np = np.load(img_npy_path, mmap_mode=mmap_mode)
+        if img_mode is not None:
+            img_np = img_np[img_mode]
+        label_np = np.load(label_npy_path, mmap_mode=mmap_mode)
+        return img_np, label_np, img_info
+    img, label = get_img_label(dataset_path, file_name)
+    img_np, label_np = get_arrays_from_img_label(img, label, img_mode=img_mode)
+    return img_np, label_np, ImageInfo.from_image(img)
+
+@profiled
+def load_array(dataset_path, path, mmap_mode='r', is_label=False):
+    """Load one image or label map as a numpy array, memory-mapping its npy
+    copy if it is up to date. Label maps read with SimpleITK are cast to the
+    smallest integer type that holds all labels.
+
+    Returns:
+    (numpy.ndarray, ImageInfo): array and image information
+    """
+    npy_path = get_npy_path(dataset_path, path)
+    info = _npy_info(npy_path, path)
+    if info is not None:
+        add_bytes_read(npy_path)
+        return np.load(npy_path, mmap_mode=mmap_mode), info
+    import SimpleITK as sitk
+    add_bytes_read(path)
+    img = sitk.ReadImage(path)
+    array = sitk.GetArrayFromImage(img)
+    if is_label:
+        array = compact_label_map(array)
+    return array, ImageInfo.from_image(img)
+
+def load_array_info(dataset_path, path):
+    """Information of an image or label map, from the json sidecar of its 
+    npy copy if this is up to date, or else from the file header."""
+    npy_path = get_npy_path(dataset_path, path)
+    info = _npy_info(npy_path, path)
+    return read_image_info(path) if info is None else info
+
+def iter_slabs(dataset_path, path, slab_size, img_mode=None):
+    """Yields an image or label map in slabs of slab_size slices along the 
+    first array axis (z), so that only one slab is in memory. The npy copy is 
+    memory-mapped if it is up to date. Otherwise, each slab is streamed from
+    the file with the extract region of SimpleITK's ImageFileReader, which
+    is only possible for uncompressed files. A compressed file, e.g. .nii.gz,
+    would be decoded whole for each slab, so it raises a ValueError.
+
+    Parameters:
+    dataset_path (str): path to a dataset with the Medical Segmentation 
+        Decathlon structure
+    path (str): image or label map path
+    slab_size (int): number of slices of each slab
+    img_mode (int or None): mode of a 4D image
+
+    Yields:
+    (int, numpy.ndarray): index of the first slice and slab
+    """
+    npy_path = get_npy_path(dataset_path, path)
+    if _npy_info(npy_path, path) is not None:
+        add_bytes_read(npy_path)
+        array = np.load(npy_path, mmap_mode='r')
+        if img_mode is not None:
+            array = array[img_mode]
+        for start in range(0, array.shape[0], slab_size):
+            yield start, array[start:start+slab_size]
+        return
+    if path.endswith('.gz'):
+        raise ValueError("{} is compressed and has no up-to-date npy copy, so it cannot be read in "
+            "slabs. Store the copies first with convert_ds_to_npy.".format(path))
+    import SimpleITK as sitk
+    add_bytes_read(path)
+    reader = sitk.ImageFileReader()
+    reader.SetFileName(path)
+    reader.ReadImageInformation()
+    size = list(reader.GetSize())
+    assert len(size) == 3 or (len(size) == 4 and img_mode is not None)
+    nr_slices = size[2]
+    for start in range(0, nr_slices, slab_size):
+        nr_slab_slices = min(slab_size, nr_slices - start)
+        index, extract_size = [0, 0, start], size[:2] + [nr_slab_slices]
+        if len(size) == 4:
+            # A size of 0 removes the mode dimension
+            index, extract_size = index + [img_mode], extract_size + [0]
+        reader.SetExtractIndex(index)
+        reader.SetExtractSize(extract_size)
+        yield start, sitk.GetArrayFromImage(reader.Execute())
+
+@profiled
+def load_case(dataset_path, case_name, mmap_mode='r'):
+    """Load the images of all modes of a case and its label map, which is
+    read once.
+
+    Parameters:
+    dataset_path (str): path to a dataset with the Medical Segmentation 
+        Decathlon structure
+    case_name (str): name of the case, without mode or ending
+    mmap_mode (str or None): mode for np.load, None to read into memory
+
+    Returns:
+    (lst(numpy.ndarray), numpy.ndarray, ImageInfo): image of each mode, label
+        map and the information of the image of the first mode
+    """
+    img_paths, label_path = get_case_paths(dataset_path, case_name)
+    assert img_paths, "No images for case {}".format(case_name)
+    xs, x_info = [], None
+    for img_path in img_paths:
+        x, info = load_array(dataset_path, img_path, mmap_mode=mmap_mode)
+        xs.append(x)
+        x_info = info if x_info is None else x_info
+    y, _ = load_array(dataset_path, label_path, mmap_mode=mmap_mode, is_label=True)
+    return xs, y, x_info
 
 # PICKLE
 import pickle
@@ -94,7 +464,6 @@ def np_load(name, path='obj'):
     return obj
 
 # JSON
-import json
 def save_json(dict_obj, path, name):
     """Saves a dictionary in json format."""
     if '.json' not in name:
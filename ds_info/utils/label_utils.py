@@ -17,6 +17,24 @@ def map_label_voxels(y, mappings=[(2,0)]):
         y = np.where(y==key, value, y) 
     return y
 
+def compact_label_map(y):
+    """Cast a label map to the smallest integer type that holds its labels,
+    e.g. uint8 for up to 255 labels. No copy is made if the type is already 
+    the smallest one.
+
+    Parameters:
+    y (numpy.ndarray): label map
+
+    Returns:
+    numpy.ndarray: label map with a compact integer type
+    """
+    min_label, max_label = int(y.min()), int(y.max())
+    if min_label < 0:
+        # Signed type that holds both the smallest and the largest label
+        max_label = -max_label - 1
+    dtype = np.result_type(np.min_scalar_type(min_label), np.min_scalar_type(max_label))
+    return y.astype(dtype, copy=False)
+
 def divide_label_maps(y):
     """Turn a map with multiple labels into a list of maps with each label 1.
 
@@ -24,15 +42,13 @@ def divide_label_maps(y):
     y (numpy.ndarray): label map
 
     Returns:
-    OrderedDict(key -> numpy.ndarray): a dictionary mapping labels to label maps,
-        ordered wrt the label value
+    OrderedDict(key -> numpy.ndarray): a dictionary mapping labels to uint8 
+        label maps, ordered wrt the label value
     """
     labels = sorted(list(np.unique(y)))
     labels.pop(0)
     divided_label_maps = OrderedDict()
     for label in labels:
-        other_labels = [l for l in labels if l != label]
-        new_y = map_label_voxels(y, mappings=[(key, 0) for key in other_labels]+[(label, 1)])
-        divided_label_maps[label] = new_y
+        # A boolean mask seen as uint8, so there is one byte per voxel
+        divided_label_maps[label] = (y == label).view(np.uint8)
     return divided_label_maps
-
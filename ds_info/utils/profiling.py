@@ -0,0 +1,164 @@
+#   Opt-in timing of the stages of the feature pipeline. When profiling is
+#   disabled, a profiled function only checks a flag before being called.
+
+import os
+import csv
+import json
+import time
+import functools
+import contextlib
+import tracemalloc
+import numpy as np
+from collections import OrderedDict
+
+TRACE_COLUMNS = ['case', 'stage', 'depth', 'seconds', 'bytes_read', 'peak_memory']
+
+class _State:
+    enabled = False
+    track_memory = False
+    case = None
+    stack = []
+    records = []
+
+def enable(track_memory=False):
+    """Start recording stages. If track_memory, the peak memory allocated
+    within each stage is traced with tracemalloc, which slows down the
+    pipeline."""
+    _State.enabled = True
+    _State.track_memory = track_memory
+    if track_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+def disable():
+    _State.enabled = False
+    if _State.track_memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    _State.track_memory = False
+
+def is_enabled():
+    return _State.enabled
+
+def memory_tracked():
+    return _State.track_memory
+
+@contextlib.contextmanager
+def stage(name):
+    """Record the duration, bytes read and peak memory of a block."""
+    if not _State.enabled:
+        yield
+        return
+    entry = {'bytes_read': 0, 'peak_memory': 0}
+    if _State.track_memory:
+        if _State.stack:
+            # The peak so far belongs to the enclosing stage
+            parent = _State.stack[-1]
+            parent['peak_memory'] = max(parent['peak_memory'], tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+    _State.stack.append(entry)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        _State.stack.pop()
+        peak_memory = None
+        if _State.track_memory:
+            peak_memory = max(entry['peak_memory'], tracemalloc.get_traced_memory()[1])
+            if _State.stack:
+                parent = _State.stack[-1]
+                parent['peak_memory'] = max(parent['peak_memory'], peak_memory)
+        _State.records.append(OrderedDict([('case', _State.case), ('stage', name),
+            ('depth', len(_State.stack)), ('seconds', seconds),
+            ('bytes_read', entry['bytes_read']), ('peak_memory', peak_memory)]))
+
+@contextlib.contextmanager
+def case(name):
+    """Assign the stages of a block to a case, and record its total as the
+    'case' stage."""
+    if not _State.enabled:
+        yield
+        return
+    previous, _State.case = _State.case, name
+    try:
+        with stage('case'):
+            yield
+    finally:
+        _State.case = previous
+
+def profiled(fn=None, name=None):
+    """Decorator that records each call of a function as a stage, named after
+    its module and function, e.g. 'io_utils.load_img_label'."""
+    if fn is None:
+        return functools.partial(profiled, name=name)
+    if name is None:
+        name = fn.__module__.split('.')[-1] + '.' + fn.__qualname__
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not _State.enabled:
+            return fn(*args, **kwargs)
+        with stage(name):
+            return fn(*args, **kwargs)
+    return wrapper
+
+def add_bytes_read(*paths):
+    """Add the size of files read to the current stages."""
+    if not _State.enabled or not _State.stack:
+        return
+    nr_bytes = sum(os.path.getsize(path) for path in paths)
+    for entry in _State.stack:
+        entry['bytes_read'] += nr_bytes
+
+def pop_records():
+    """Return and clear the records, e.g. to send them from a worker process."""
+    records, _State.records = _State.records, []
+    return records
+
+def extend_records(records):
+    """Add records, e.g. those returned by a worker process."""
+    _State.records.extend(records)
+
+def summary(records):
+    """Number of calls, total, median (p50) and 95th percentile (p95) seconds,
+    bytes read and maximum peak memory of each stage, slowest stages first.
+
+    Parameters:
+    records (lst(dict)): records returned by pop_records
+
+    Returns:
+    lst(OrderedDict(str -> Any)): a row for each stage
+    """
+    stages = OrderedDict()
+    for record in records:
+        stages.setdefault(record['stage'], []).append(record)
+    rows = []
+    for name, stage_records in stages.items():
+        seconds = np.array([record['seconds'] for record in stage_records])
+        peaks = [record['peak_memory'] for record in stage_records if record['peak_memory'] is not None]
+        rows.append(OrderedDict([('stage', name), ('calls', len(stage_records)),
+            ('total', float(seconds.sum())), ('p50', float(np.percentile(seconds, 50))),
+            ('p95', float(np.percentile(seconds, 95))),
+            ('bytes_read', sum(record['bytes_read'] for record in stage_records)),
+            ('peak_memory', max(peaks) if peaks else None)]))
+    return sorted(rows, key=lambda row: -row['total'])
+
+def format_summary(rows):
+    """Text table of the rows returned by summary."""
+    lines = ['{:<45} {:>7} {:>10} {:>10} {:>10} {:>10} {:>10}'.format(
+        'stage', 'calls', 'total s', 'p50 s', 'p95 s', 'read MB', 'peak MB')]
+    for row in rows:
+        peak = '-' if row['peak_memory'] is None else '{:.1f}'.format(row['peak_memory'] / 2**20)
+        lines.append('{:<45} {:>7} {:>10.3f} {:>10.4f} {:>10.4f} {:>10.1f} {:>10}'.format(
+            row['stage'], row['calls'], row['total'], row['p50'], row['p95'],
+            row['bytes_read'] / 2**20, peak))
+    return '\n'.join(lines)
+
+def save_trace(records, path):
+    """Store the records as json, or as csv if path ends with '.csv'."""
+    if path.endswith('.csv'):
+        with open(path, 'w', newline='') as csv_file:
+            writer = csv.DictWriter(csv_file, fieldnames=TRACE_COLUMNS)
+            writer.writeheader()
+            writer.writerows(records)
+    else:
+        with open(path, 'w') as json_file:
+            json.dump({'records': records, 'summary': summary(records)}, json_file, indent=1)
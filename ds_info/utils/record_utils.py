@@ -0,0 +1,106 @@
+#   Append-only files of pickled records, e.g. the properties of each case, so
+#   that a long extraction can be resumed after an interruption.
+
+import os
+import pickle
+
+class RecordHeader(dict):
+    """First record of a file, e.g. with the options of the run writing it,
+    which is not yielded by read_records."""
+
+_END = object()
+
+def _read_record(f, path, size):
+    """Next record of an open file, or _END at the end of the file or at a 
+    last record truncated by an interrupted write, which can only end at the
+    end of the file. A corrupted record elsewhere raises an error."""
+    offset = f.tell()
+    if offset == size:
+        return _END
+    try:
+        return pickle.load(f)
+    except (EOFError, pickle.UnpicklingError):
+        if f.tell() < size:
+            raise pickle.UnpicklingError('Corrupted record at byte {} of {}'.format(offset, path))
+        return _END
+
+def _valid_end(path):
+    """Offset after the last complete record of a file."""
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        offset = 0
+        while _read_record(f, path, size) is not _END:
+            offset = f.tell()
+    return offset
+
+def _iter_records(path):
+    """All records of a file, including its header."""
+    if not os.path.isfile(path):
+        return
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        while True:
+            record = _read_record(f, path, size)
+            if record is _END:
+                return
+            yield record
+
+def read_header(path):
+    """Header of a file written by RecordWriter, or None if it has none or
+    does not exist."""
+    for record in _iter_records(path):
+        return dict(record) if isinstance(record, RecordHeader) else None
+    return None
+
+def read_records(path):
+    """Yields the records of a file written by RecordWriter, in the order
+    they were written, without the header. A last record truncated by an 
+    interrupted write is ignored, while a corrupted record before the end of
+    the file raises a pickle.UnpicklingError. Nothing is yielded if the file
+    does not exist."""
+    for ix, record in enumerate(_iter_records(path)):
+        if not (ix == 0 and isinstance(record, RecordHeader)):
+            yield record
+
+class RecordWriter:
+    """Appends records to a file. Each record is flushed to disk when it is
+    written, so an interruption loses at most the record being written. A 
+    truncated last record, left by an earlier interruption, is removed when
+    the file is opened.
+
+    Parameters:
+    path (str): file path, created if it does not exist
+    sync (bool): force each record to disk with os.fsync, so it also 
+        survives a crash of the machine
+    header (dict or None): if given, written as the first record of a new
+        file. An existing file must have been written with the same header,
+        e.g. when a run is resumed with the same options.
+    """
+    def __init__(self, path, sync=True, header=None):
+        end = 0
+        if os.path.isfile(path):
+            end = _valid_end(path)
+            if end < os.path.getsize(path):
+                with open(path, 'r+b') as f:
+                    f.truncate(end)
+        if end > 0 and read_header(path) != header:
+            raise ValueError('{} was written with {}, not {}'.format(path, read_header(path), header))
+        self.sync = sync
+        self.file = open(path, 'ab')
+        if end == 0 and header is not None:
+            self.write(RecordHeader(header))
+
+    def write(self, record):
+        pickle.dump(record, self.file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.file.flush()
+        if self.sync:
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -1,4 +1,4 @@
-from setuptools import setup, find_packages
+from setuptools import setup, find_namespace_packages
 
 setup(
     name='dataset_statistics',
@@ -6,5 +6,11 @@ setup(
     description='A project for extracting simple statistics from datasets with the nnUNet structure.',
     url='https://github.com/camgbus/dataset_statistics',
     keywords='python setuptools',
-    packages=find_packages(include=['ds_info', 'ds_info.*']),
+    # The ds_info packages have no __init__.py files
+    packages=find_namespace_packages(include=['ds_info', 'ds_info.*']),
+    # Parquet output of the properties, see PropsTable.to_parquet
+    extras_require={'parquet': ['pyarrow']},
+    entry_points={
+        'console_scripts': ['ds_info=ds_info.cli:main'],
+    },
 )
\ No newline at end of file
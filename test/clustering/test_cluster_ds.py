@@ -0,0 +1,37 @@
+import numpy as np
+from conftest import write_task
+from ds_info.clustering.cluster_ds import center_roi_all_subjects, center_roi
+
+def test_parallel_roi_matrix(tmp_path, monkeypatch):
+    dataset_path = write_task(str(tmp_path / 'nnUNet_raw_data' / 'Task997_Clusters'), nr_cases=5)
+    monkeypatch.setenv('nnUNet_raw_data_base', str(tmp_path))
+    X, ids = center_roi_all_subjects('Task997_Clusters', (4, 8, 8))
+    assert X.shape == (5, 4*8*8) and X.dtype == np.int16
+    assert sorted(ids) == ['case_{:03d}'.format(ix) for ix in range(5)]
+    assert np.array_equal(X[ids.index('case_002')], center_roi(dataset_path, 'case_002_0000.nii.gz', (4, 8, 8)))
+    memmap_path = str(tmp_path / 'X.dat')
+    for kwargs in [{'workers': 2}, {'memmap_path': memmap_path}, {'workers': 2, 'memmap_path': memmap_path}]:
+        X_workers, workers_ids = center_roi_all_subjects('Task997_Clusters', (4, 8, 8), dtype=np.float64, **kwargs)
+        assert X_workers.dtype == np.float64 and workers_ids == ids
+        assert np.array_equal(X_workers, X)
+    assert np.array_equal(np.memmap(memmap_path, dtype=np.float64, mode='r', shape=X.shape), X)
+
+def test_feature_clustering(tmp_path, monkeypatch):
+    from ds_info.utils.io_utils import pkl_load
+    from ds_info.clustering.cluster_ds import save_feature_clustering, save_clustering
+    write_task(str(tmp_path / 'nnUNet_raw_data' / 'Task997_Clusters'), nr_cases=6, nr_modes=2)
+    monkeypatch.setenv('nnUNet_raw_data_base', str(tmp_path))
+    roi_name = save_clustering(str(tmp_path), 'Task997_Clusters', 2, 2, (4, 8, 8), img_mode=None)
+    roi_clustering = pkl_load(name=roi_name, path=str(tmp_path))
+    for features in ['props', 'thumbnails']:
+        name = save_feature_clustering(str(tmp_path), 'Task997_Clusters', 2, 2, features=features, 
+            thumbnail_size=(4, 8, 8))
+        clustering = pkl_load(name=name, path=str(tmp_path))
+        # Same entries, and ids are case names
+        assert clustering.keys() == roi_clustering.keys()
+        assert sorted(clustering['ids']) == sorted(roi_clustering['ids'])
+        assert clustering['X'].shape == (6, 2) and len(clustering['labels']) == 6
+    # Thumbnails of one mode
+    name = save_feature_clustering(str(tmp_path), 'Task997_Clusters', 2, 2, features='thumbnails',
+        thumbnail_size=(4, 8, 8), img_mode=1)
+    assert pkl_load(name=name, path=str(tmp_path))['X'].shape == (6, 2)
@@ -0,0 +1,15 @@
+import pytest
+from benchmarks.synthetic import write_synthetic_task
+
+def write_task(dataset_path, nr_cases=4, shape=(8, 16, 16), nr_modes=1, seed=0):
+    """Writes a small synthetic task of the benchmarks, with cases of the same
+    shape and two labels of two components each. Label 2 is missing in the
+    first case."""
+    write_synthetic_task(dataset_path, nr_cases=nr_cases, shape=shape, nr_modes=nr_modes,
+        nr_fragments=2, seed=seed, shape_variation=0, case_name_format='case_{:03d}',
+        missing_labels={0: [2]})
+    return dataset_path
+
+@pytest.fixture
+def synthetic_task(tmp_path):
+    return write_task(str(tmp_path / 'Task999_Synthetic'))
@@ -0,0 +1,68 @@
+import os
+import random
+import pytest
+import numpy as np
+from ds_info.ds_division.define_new_splits import (create_new_splits, 
+    get_cases_from_splits, sample_disjoint, assert_split_integrity)
+from benchmarks.synthetic import write_old_splits
+
+def test_sample_disjoint():
+    subsets = sample_disjoint(list(range(10)), [3, 4, 3])
+    assert [len(subset) for subset in subsets] == [3, 4, 3]
+    assert sorted(sum(subsets, [])) == list(range(10))
+
+def test_assert_split_integrity():
+    splits = {'A': [{'train': ['a'], 'val': ['b']}], 'B': [{'train': ['a'], 'val': ['c']}]}
+    with pytest.raises(AssertionError):
+        assert_split_integrity(splits, nr_folds=1)
+
+def test_create_new_splits(tmp_path):
+    old_paths = [str(tmp_path / 'TaskA'), str(tmp_path / 'TaskB')]
+    new_paths = [str(tmp_path / 'TaskN1'), str(tmp_path / 'TaskN2')]
+    write_old_splits(old_paths[0], 'TaskA', 50)
+    write_old_splits(old_paths[1], 'TaskB', 30)
+    random.seed(0)
+    create_new_splits(['TaskN1', 'TaskN2'], new_paths, ['TaskA', 'TaskB'], old_paths, 
+        [[0.6, 0.4], [0.5, 0.5]])
+    new_splits = [get_cases_from_splits(path) for path in new_paths]
+    all_cases = set()
+    for task_splits in new_splits:
+        task_cases = set(task_splits[0]['train']) | set(task_splits[0]['val'])
+        assert all_cases.isdisjoint(task_cases)
+        all_cases |= task_cases
+    assert len(all_cases) == 80
+    # The same seed gives the same splits
+    random.seed(0)
+    create_new_splits(['TaskN1', 'TaskN2'], new_paths, ['TaskA', 'TaskB'], old_paths, 
+        [[0.6, 0.4], [0.5, 0.5]])
+    for path, task_splits in zip(new_paths, new_splits):
+        for fold_splits, new_fold_splits in zip(task_splits, get_cases_from_splits(path)):
+            assert list(fold_splits['val']) == list(new_fold_splits['val'])
+
+def test_seeded_splits_manifest(tmp_path):
+    old_paths = [str(tmp_path / 'TaskA')]
+    new_paths = [str(tmp_path / 'TaskN1'), str(tmp_path / 'TaskN2')]
+    write_old_splits(old_paths[0], 'TaskA', 40)
+    args = (['TaskN1', 'TaskN2'], new_paths, ['TaskA'], old_paths, [[0.5, 0.5]])
+    create_new_splits(*args, seed=3)
+    splits_file = os.path.join(new_paths[0], 'splits_final.pkl')
+    mtime = os.path.getmtime(splits_file)
+    assert os.path.isfile(os.path.join(new_paths[0], 'splits_manifest.json'))
+    # Same inputs and seed, so the splits are not created again
+    os.utime(splits_file, (mtime - 10, mtime - 10))
+    create_new_splits(*args, seed=3)
+    assert os.path.getmtime(splits_file) == mtime - 10
+    # A different seed creates new splits
+    create_new_splits(*args, seed=4)
+    assert os.path.getmtime(splits_file) != mtime - 10
+
+def test_generator_seed(tmp_path):
+    old_paths = [str(tmp_path / 'TaskA')]
+    new_paths = [str(tmp_path / 'TaskN1'), str(tmp_path / 'TaskN2')]
+    write_old_splits(old_paths[0], 'TaskA', 40)
+    val_cases = []
+    for _ in range(2):
+        create_new_splits(['TaskN1', 'TaskN2'], new_paths, ['TaskA'], old_paths, 
+            [[0.5, 0.5]], seed=np.random.default_rng(0))
+        val_cases.append(list(get_cases_from_splits(new_paths[0])[0]['val']))
+    assert val_cases[0] == val_cases[1] and len(val_cases[0]) == 4
@@ -0,0 +1,88 @@
+import os
+from ds_info.extract_stats_ds import extract_ds_stats, save_ds_stats
+
+def test_missing_labels_filled(synthetic_task):
+    props = extract_ds_stats(synthetic_task)
+    assert len(props) == 4
+    assert props['case_000_0000']['2_area-rel'] == 0.0
+    assert props['case_001_0000']['2_area-rel'] > 0
+
+def test_parallel_same_csv(synthetic_task, tmp_path):
+    save_ds_stats(synthetic_task, str(tmp_path), ds_name='serial')
+    save_ds_stats(synthetic_task, str(tmp_path), ds_name='parallel', workers=2)
+    with open(os.path.join(str(tmp_path), 'serial_stats.csv'), 'rb') as f:
+        serial = f.read()
+    with open(os.path.join(str(tmp_path), 'parallel_stats.csv'), 'rb') as f:
+        parallel = f.read()
+    assert serial == parallel
+
+def test_by_case_as_by_file(tmp_path):
+    from conftest import write_task
+    dataset_path = write_task(str(tmp_path / 'Task998_Modes'), nr_modes=3)
+    by_file, file_intensity = extract_ds_stats(dataset_path, intensity_stats=True)
+    by_case, case_intensity = extract_ds_stats(dataset_path, intensity_stats=True, by_case=True)
+    assert sorted(by_case.keys()) == ['case_000', 'case_001', 'case_002', 'case_003']
+    assert len(case_intensity) == 3
+    for case_name, case_props in by_case.items():
+        for mode in range(3):
+            file_props = by_file['{}_{:04d}'.format(case_name, mode)]
+            assert case_props['intensity_mean_{}'.format(mode)] == file_props['intensity_mean']
+            for key in ['resolution', 'spacing', '1_area-rel', '2_area-rel', '1_CC', '2_CC']:
+                assert case_props[key] == file_props[key]
+    # Each mode has its own intensity statistics, and by file these are merged
+    assert sum(mode_stats.count for mode_stats in case_intensity) == file_intensity.count
+    assert case_intensity[2].mean > case_intensity[0].mean
+
+def test_resume_from_records(synthetic_task, tmp_path):
+    import itertools
+    import pytest
+    from ds_info.extract_stats_ds import iter_ds_stats, finalize_ds_stats, records_header
+    from ds_info.utils.record_utils import RecordWriter, read_records
+    props, intensity = extract_ds_stats(synthetic_task, intensity_stats=True)
+    records_path = str(tmp_path / 'records.pkl')
+    # A run interrupted after two subjects, while writing the third
+    with RecordWriter(records_path, header=records_header(intensity_stats=True)) as writer:
+        for record in itertools.islice(iter_ds_stats(synthetic_task, intensity_stats=True), 2):
+            writer.write(record)
+    with open(records_path, 'ab') as f:
+        f.write(b'\x80\x05\x95')
+    assert len(list(read_records(records_path))) == 2
+    # The run is not resumed with other options
+    with pytest.raises(ValueError):
+        save_ds_stats(synthetic_task, str(tmp_path), ds_name='resumed', records_path=records_path)
+    save_ds_stats(synthetic_task, str(tmp_path), ds_name='resumed', intensity_stats=True, 
+        records_path=records_path)
+    resumed, resumed_intensity = finalize_ds_stats(records_path, synthetic_task, intensity_stats=True)
+    # In the order of extract_ds_stats
+    assert list(resumed.keys()) == list(props.keys()) and resumed == props
+    assert resumed_intensity.count == intensity.count
+
+def test_labels_of_dataset_json_filled(synthetic_task, tmp_path):
+    from ds_info.extract_stats_ds import iter_ds_stats, finalize_ds_stats
+    from ds_info.utils.record_utils import RecordWriter
+    records_path = str(tmp_path / 'records.pkl')
+    # Label 2 is missing in the first case
+    with RecordWriter(records_path) as writer:
+        for record in iter_ds_stats(synthetic_task, case_names=['case_000_0000']):
+            assert '2_area-rel' not in record[1]
+            writer.write(record)
+    props = finalize_ds_stats(records_path, synthetic_task)
+    assert props['case_000_0000']['2_area-rel'] == 0.0 and props['case_000_0000']['2_CC'] == 0.0
+    assert '2_area-rel' not in finalize_ds_stats(records_path)['case_000_0000']
+
+def test_unsupported_options_rejected(synthetic_task, tmp_path):
+    import pytest
+    records_path = str(tmp_path / 'records.pkl')
+    with pytest.raises(ValueError, match='memory limit'):
+        save_ds_stats(synthetic_task, str(tmp_path), ds_name='rejected', by_case=True, 
+            memory_limit=2**20, records_path=records_path)
+    assert not os.path.exists(records_path)
+    # Histograms are not computed with the metadata only or by case
+    histograms_path = str(tmp_path / 'histograms.pkl')
+    for options in [{'metadata_only': True}, {'by_case': True}]:
+        with pytest.raises(ValueError, match='histograms'):
+            extract_ds_stats(synthetic_task, histograms_path=histograms_path, **options)
+        with pytest.raises(ValueError, match='histograms'):
+            save_ds_stats(synthetic_task, str(tmp_path), ds_name='rejected', records_path=records_path,
+                histograms_path=histograms_path, **options)
+    assert not os.path.exists(records_path) and not os.path.exists(histograms_path)
@@ -0,0 +1,53 @@
+import os
+import pytest
+import numpy as np
+from skimage.measure import label
+from ds_info.utils.io_utils import convert_ds_to_npy, get_img_label_paths
+from ds_info.feature_extraction.feature_combinations import reduced_features
+from ds_info.feature_extraction.chunked_features import chunked_reduced_features, SlabComponents
+
+def test_components_stitched_across_slabs():
+    rng = np.random.default_rng(0)
+    y = rng.choice(3, size=(17, 12, 13), p=[0.6, 0.3, 0.1]).astype(np.uint8)
+    for connectivity in [1, 2, 3]:
+        for slab_size in [1, 4, 17]:
+            components = SlabComponents(connectivity=connectivity)
+            for start in range(0, y.shape[0], slab_size):
+                components.update(y[start:start+slab_size])
+            nr_components = components.nr_components()
+            for lbl in [1, 2]:
+                assert nr_components[lbl] == label(y == lbl, return_num=True, connectivity=connectivity)[1]
+
+def _assert_same_features(props, chunked_props):
+    assert list(props.keys()) == list(chunked_props.keys())
+    for key, value in props.items():
+        assert np.allclose(value, chunked_props[key]), key
+
+def _uncompress(dataset_path, file_name):
+    """Replace the .nii.gz image and label map of a case with .nii files."""
+    import SimpleITK as sitk
+    for path in get_img_label_paths(dataset_path, file_name):
+        sitk.WriteImage(sitk.ReadImage(path), path[:-len('.gz')])
+        os.remove(path)
+    return file_name[:-len('.gz')]
+
+def test_chunked_as_reduced_features(synthetic_task):
+    # Compressed files are only read in slabs from their npy copies
+    with pytest.raises(ValueError):
+        chunked_reduced_features(synthetic_task, 'case_000_0000.nii.gz', img_mode=None, slab_size=1)
+    file_names = ['case_000_0000.nii.gz', _uncompress(synthetic_task, 'case_001_0000.nii.gz')]
+    expected = [reduced_features(synthetic_task, file_name, img_mode=None, return_intensity_stats=True)
+        for file_name in file_names]
+    for with_npy in [False, True]:
+        if with_npy:
+            convert_ds_to_npy(synthetic_task)
+        for file_name, (props, intensity) in zip(file_names, expected):
+            if file_name.endswith('.gz') and not with_npy:
+                continue
+            for slab_size in [1, 3]:
+                chunked_props, chunked_intensity = chunked_reduced_features(synthetic_task, file_name, 
+                    img_mode=None, slab_size=slab_size, return_intensity_stats=True)
+                _assert_same_features(props, chunked_props)
+                _assert_same_features(intensity.summary(), chunked_intensity.summary())
+            _assert_same_features(props, chunked_reduced_features(synthetic_task, file_name, 
+                img_mode=None, memory_limit=2*16*16*32))
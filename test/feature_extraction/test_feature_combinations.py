@@ -0,0 +1,8 @@
+from ds_info.feature_extraction.feature_combinations import reduced_features, metadata_features
+
+def test_metadata_as_reduced_features(synthetic_task):
+    props = reduced_features(synthetic_task, 'case_001_0000.nii.gz', img_mode=None)
+    metadata = metadata_features(synthetic_task, 'case_001_0000.nii.gz', img_mode=None)
+    assert list(metadata.keys()) == ['resolution', 'spacing']
+    assert metadata['resolution'] == props['resolution']
+    assert metadata['spacing'] == props['spacing']
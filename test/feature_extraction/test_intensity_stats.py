@@ -0,0 +1,35 @@
+import numpy as np
+from ds_info.feature_extraction.intensity_stats import IntensityAccumulator, intensity_statistics, MAX_BIN
+
+def test_intensity_statistics():
+    rng = np.random.default_rng(0)
+    x = rng.integers(-1000, 2000, size=(10, 20, 30)).astype(np.int16)
+    mask = rng.random(x.shape) > 0.5
+    stats = intensity_statistics(x, mask=mask)
+    values = x[mask]
+    assert stats.count == values.size
+    assert np.isclose(stats.mean, values.mean())
+    assert np.isclose(stats.std(), values.std())
+    assert (stats.min, stats.max) == (values.min(), values.max())
+    for q in [0.5, 50, 99.5]:
+        assert abs(stats.percentile(q) - np.percentile(values, q)) <= 2
+
+def test_merged_as_joint_statistics():
+    rng = np.random.default_rng(1)
+    x_a, x_b = rng.normal(0, 10, size=(4, 50)), rng.normal(40, 5, size=(6, 20))
+    merged = intensity_statistics(x_a, bin_width=0.5).merge(intensity_statistics(x_b, bin_width=0.5))
+    joint = IntensityAccumulator(bin_width=0.5)
+    joint.update(np.concatenate([x_a.ravel(), x_b.ravel()]))
+    assert np.isclose(merged.mean, joint.mean)
+    assert np.isclose(merged.variance(), joint.variance())
+    assert np.array_equal(merged.hist, joint.hist)
+    assert merged.summary().keys() == joint.summary().keys()
+
+def test_extreme_and_nonfinite_values():
+    x = np.array([[np.nan, -3e38, 10.0, 11.0], [12.0, np.inf, 3e38, 13.0]], dtype=np.float32)
+    stats = intensity_statistics(x)
+    assert stats.count == 6 and stats.nr_nonfinite == 2
+    # Extreme values fall into the outermost bins, so the histogram is bounded
+    assert len(stats.hist) <= 2 * MAX_BIN + 1
+    assert stats.min == np.float32(-3e38) and stats.max == np.float32(3e38)
+    assert 10 <= stats.percentile(50) <= 13
@@ -0,0 +1,61 @@
+import numpy as np
+from skimage.measure import regionprops, label
+from ds_info.feature_extraction.label_features import label_statistics, component_statistics, connected_components, skimg_props
+
+def test_label_statistics_as_regionprops():
+    rng = np.random.default_rng(0)
+    y = np.zeros((6, 9, 7), dtype=np.uint8)
+    y[1:3, 2:8, 1:4] = 1
+    y[4, 0, 6] = 1
+    y[2:6, 5:9, 4:7] = 3
+    x = rng.normal(size=y.shape)
+    stats = label_statistics(y, x)
+    assert list(stats.keys()) == [1, 3]
+    for region in regionprops(y, intensity_image=x):
+        label_stats = stats[region.label]
+        assert label_stats['area'] == region.area
+        assert label_stats['area-rel'] == region.area/y.size
+        assert label_stats['bbox'] == region.bbox
+        assert np.allclose(label_stats['centroid'], region.centroid)
+        assert np.isclose(label_stats['intensity_mean'], region.intensity_mean)
+
+def test_label_statistics_background_only():
+    assert len(label_statistics(np.zeros((3, 4, 5), dtype=np.uint8))) == 0
+
+def test_connectivity_honoured():
+    y = np.zeros((3, 3, 3), dtype=np.uint8)
+    y[0, 0, 0] = y[1, 1, 0] = y[2, 2, 1] = 1
+    assert connected_components(y, connectivity=1)[1] == 3
+    assert connected_components(y, connectivity=2)[1] == 2
+    assert connected_components(y, connectivity=3)[1] == 1
+
+def test_component_statistics_as_per_label_components():
+    rng = np.random.default_rng(0)
+    y = rng.choice(4, size=(10, 12, 11), p=[0.7, 0.1, 0.15, 0.05]).astype(np.uint8)
+    x = rng.normal(size=y.shape)
+    for connectivity in [1, 2, 3]:
+        stats = component_statistics(y, x, connectivity=connectivity)
+        assert list(stats.keys()) == [1, 2, 3]
+        for lbl, label_stats in stats.items():
+            labeled_image, nr_components = label(y == lbl, return_num=True, connectivity=connectivity)
+            assert label_stats['nr_components'] == nr_components
+            largest = max(regionprops(labeled_image, intensity_image=x), key=lambda r: r.area)
+            assert label_stats['area'] == largest.area
+            assert label_stats['bbox'] == largest.bbox
+            assert np.allclose(label_stats['centroid'], largest.centroid)
+            assert np.isclose(label_stats['intensity_mean'], largest.intensity_mean)
+            assert label_stats['area-rel-label'] == largest.area / (y == lbl).sum()
+
+def test_skimg_props_cropped_as_full_image():
+    rng = np.random.default_rng(0)
+    y = np.zeros((12, 14, 10), dtype=bool)
+    y[3:8, 5:11, 2:6] = rng.random((5, 6, 4)) < 0.7
+    x = rng.normal(size=y.shape)
+    keys = ['area', 'bbox', 'centroid', 'coords', 'area_convex', 'moments']
+    timings = dict()
+    props = skimg_props(y, x, props_y=keys, timings=timings)
+    region = regionprops(y.view(np.uint8), intensity_image=x)[0]
+    for key in keys + ['intensity_mean']:
+        assert np.allclose(props[key], region[key]), key
+    # Only expensive properties are timed
+    assert sorted(timings.keys()) == ['area_convex', 'moments']
@@ -0,0 +1,55 @@
+import pickle
+import numpy as np
+from ds_info.feature_extraction.label_histograms import LabelHistogram, HistogramStore, label_histogram
+
+def test_label_histogram():
+    rng = np.random.default_rng(0)
+    x = rng.integers(-1000, 2000, size=(6, 20, 30)).astype(np.int16)
+    y = rng.choice([0, 1, 3], size=x.shape).astype(np.uint8)
+    histogram = label_histogram(x, y)
+    assert histogram.labels() == [0, 1, 3]
+    for label in [0, 1, 3]:
+        values = x[y == label]
+        assert histogram[label].count == values.size
+        assert np.isclose(histogram.means()[label], values.mean())
+        assert abs(histogram.percentiles(50)[label] - np.percentile(values, 50)) <= 2
+    lower, upper = histogram.clipping_bounds()
+    assert abs(lower - np.percentile(x[y > 0], 0.5)) <= 2 and abs(upper - np.percentile(x[y > 0], 99.5)) <= 2
+    # Pickled as compact arrays
+    unpickled = pickle.loads(pickle.dumps(histogram))
+    assert unpickled.summary() == histogram.summary()
+    for label in [0, 1, 3]:
+        assert np.array_equal(unpickled[label].hist, histogram[label].hist)
+
+def test_store_merged_as_joint(synthetic_task, tmp_path):
+    from ds_info.extract_stats_ds import extract_ds_stats
+    from ds_info.utils.io_utils import load_img_label
+    histograms_path = str(tmp_path / 'histograms.pkl')
+    props = extract_ds_stats(synthetic_task, histograms_path=histograms_path, histogram_bin_width=0.5)
+    store = HistogramStore(histograms_path)
+    assert store.subjects == sorted(props.keys())
+    # Subsets can also be selected by case name and mode, as in a clustering
+    for subjects, img_mode in [(['case_000_0000', 'case_002_0000'], None), (['case_001', 'case_003'], 0)]:
+        merged = store.merged(subjects, img_mode=img_mode)
+        joint = LabelHistogram(bin_width=0.5)
+        for subject in subjects:
+            file_name = subject + ('.nii.gz' if img_mode is None else '_0000.nii.gz')
+            x, y, _ = load_img_label(synthetic_task, file_name, img_mode=None)
+            joint.merge(label_histogram(x, y, bin_width=0.5))
+        assert merged.labels() == joint.labels()
+        for label in joint.labels():
+            assert merged[label].count == joint[label].count
+            assert np.isclose(merged[label].mean, joint[label].mean)
+            assert np.isclose(merged[label].variance(), joint[label].variance())
+            assert (merged[label].min, merged[label].max) == (joint[label].min, joint[label].max)
+            assert merged[label].hist_start == joint[label].hist_start
+            assert np.array_equal(merged[label].hist, joint[label].hist)
+
+def test_store_of_resumable_run(synthetic_task, tmp_path):
+    from ds_info.extract_stats_ds import save_ds_stats
+    from ds_info.utils.record_utils import read_header
+    histograms_path = str(tmp_path / 'histograms.pkl')
+    save_ds_stats(synthetic_task, str(tmp_path), ds_name='stored', records_path=str(tmp_path / 'records.pkl'),
+        histograms_path=histograms_path, histogram_bin_width=0.5)
+    assert read_header(histograms_path) == {'histogram_bin_width': 0.5}
+    assert HistogramStore(histograms_path).subjects == ['case_{:03d}_0000'.format(ix) for ix in range(4)]
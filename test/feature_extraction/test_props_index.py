@@ -0,0 +1,38 @@
+import numpy as np
+from collections import OrderedDict
+from ds_info.feature_extraction.props_index import PropsIndex
+from ds_info.feature_extraction.props_table import PropsTable
+from ds_info.feature_extraction.feature_combinations import select_subjects, select_k_nearest_subjects
+
+def _props(nr_subjects=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    return dict(('case_{}'.format(ix), OrderedDict([
+        ('resolution', tuple(int(v) for v in rng.integers(50, 60, size=3))),
+        ('1_area-rel', float(rng.integers(0, 20)) / 100)]))
+        for ix in range(nr_subjects))
+
+def test_same_as_python_selection():
+    props = _props()
+    # Integer values, so there are many ties
+    value = (55, 52, 51)
+    assert select_k_nearest_subjects(props, 'resolution', value, k=50, ix=1) == sorted(
+        props.keys(), key=lambda k: abs(props[k]['resolution'][1] - value[1]))[:50]
+    assert select_k_nearest_subjects(props, '1_area-rel', 0.1) == sorted(
+        props.keys(), key=lambda k: abs(props[k]['1_area-rel'] - 0.1))
+    mins, maxs = (52, 50, 50), (55, 60, 53)
+    assert select_subjects(props, 'resolution', mins, maxs) == [k for k in props
+        if all(lo <= v <= hi for v, lo, hi in zip(props[k]['resolution'], mins, maxs))]
+    # Tables are queried by column
+    table = PropsTable.from_props(props)
+    assert select_subjects(table, 'resolution', mins, maxs) == select_subjects(props, 'resolution', mins, maxs)
+    assert select_k_nearest_subjects(table, '1_area-rel', 0.1, k=20) == select_k_nearest_subjects(
+        props, '1_area-rel', 0.1, k=20)
+
+def test_scaled_queries():
+    props = _props()
+    index = PropsIndex(props, ['1_area-rel', ('resolution', 0)], scale='std')
+    value = (0.1, 55)
+    distances = index.distances(value)
+    nearest = index.k_nearest(value, k=10)
+    assert np.allclose(sorted(distances)[:10], sorted(distances[[list(props).index(s) for s in nearest]]))
+    assert index.within_radius(value, 0.5) == [s for s, d in zip(props, distances) if d <= 0.5]
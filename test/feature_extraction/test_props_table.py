@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+from collections import OrderedDict
+from ds_info.feature_extraction.props_table import PropsTable
+from ds_info.feature_extraction.feature_combinations import props_mean_std, props_range
+
+def _props():
+    return {'a': OrderedDict([('resolution', (8, 16, 16)), ('1_CC', 2), ('1_area-rel', 0.25)]),
+        'b': OrderedDict([('resolution', (10, 16, 20)), ('1_CC', 1), ('1_area-rel', 0.5)]),
+        'c': OrderedDict([('resolution', (12, 16, 12)), ('1_CC', 3)])}
+
+def test_columns_and_round_trip():
+    table = PropsTable.from_props(_props())
+    assert table['resolution'].shape == (3, 3)
+    assert table['resolution'].dtype.kind == 'i'
+    assert table.row('b') == _props()['b']
+    assert table.select(['a', 'b']).to_props() == dict((k, v) for k, v in _props().items() if k != 'c')
+
+def test_statistics():
+    means, stds = props_mean_std(_props())
+    assert np.array_equal(means['resolution'], [10, 16, 16])
+    # Missing features are ignored
+    assert means['1_area-rel'] == 0.38 and stds['1_area-rel'] == 0.12
+    mins, maxs = props_range(_props())
+    assert np.array_equal(mins['resolution'], [8, 16, 12]) and maxs['1_CC'] == 3
+
+def test_parquet(tmp_path):
+    pytest.importorskip('pyarrow')
+    table = PropsTable.from_props(_props())
+    path = str(tmp_path / 'props.parquet')
+    table.to_parquet(path)
+    loaded = PropsTable.from_parquet(path)
+    assert loaded.subjects == table.subjects
+    for key in table.keys():
+        assert loaded[key].dtype == table[key].dtype
+        assert np.array_equal(loaded[key], table[key], equal_nan=True)
@@ -0,0 +1,13 @@
+import sys
+import subprocess
+
+HEAVY_MODULES = ['SimpleITK', 'skimage', 'sklearn', 'scipy', 'pandas', 'matplotlib', 
+    'seaborn', 'torch', 'monai']
+
+def test_startup_imports_no_heavy_modules():
+    code = ("import sys; from ds_info.cli import get_parser; "
+        "get_parser().parse_args(['stats', 'Task', 'path']); "
+        "print(' '.join(m for m in {} if m in sys.modules))".format(HEAVY_MODULES))
+    result = subprocess.run([sys.executable, '-c', code], check=True, 
+        capture_output=True, text=True)
+    assert result.stdout.strip() == ''
@@ -0,0 +1,50 @@
+import os
+from ds_info.utils.cache_utils import FeatureCache
+from ds_info.extract_stats_ds import extract_ds_stats
+
+def test_cache_hits_and_misses(tmp_path):
+    file_path = str(tmp_path / 'case.nii.gz')
+    with open(file_path, 'wb') as f:
+        f.write(b'content')
+    cache_path = str(tmp_path / 'cache.sqlite')
+    cache = FeatureCache(cache_path, version='v1')
+    assert cache.get('ds', 'case', [file_path]) is None
+    cache.put('ds', 'case', [file_path], {'area': 1.0})
+    assert cache.get('ds', 'case', [file_path]) == {'area': 1.0}
+    # Touching the file keeps the entry, as the content did not change
+    os.utime(file_path, ns=(0, 0))
+    assert cache.get('ds', 'case', [file_path]) == {'area': 1.0}
+    with open(file_path, 'wb') as f:
+        f.write(b'new content')
+    assert cache.get('ds', 'case', [file_path]) is None
+    assert (cache.hits, cache.misses) == (2, 2)
+    cache.put('ds', 'case', [file_path], {'area': 2.0})
+    cache.close()
+    # Versions have separate entries, which are kept when another is opened
+    cache = FeatureCache(cache_path, version='v2')
+    assert cache.get('ds', 'case', [file_path]) is None
+    cache.put('ds', 'case', [file_path], {'area': 3.0})
+    cache.close()
+    cache = FeatureCache(cache_path, version='v1')
+    assert cache.get('ds', 'case', [file_path]) == {'area': 2.0}
+    assert cache.remove_other_versions() == 1
+    cache.close()
+
+def test_extraction_with_cache(synthetic_task, tmp_path):
+    cache_path = str(tmp_path / 'cache.sqlite')
+    props = extract_ds_stats(synthetic_task, cache_path=cache_path)
+    cached_props = extract_ds_stats(synthetic_task, cache_path=cache_path)
+    assert props == cached_props
+
+def test_version_follows_imports(monkeypatch):
+    import inspect
+    from ds_info.utils import label_utils
+    from ds_info.utils.cache_utils import feature_set_version
+    from ds_info.feature_extraction.feature_combinations import reduced_features
+    version = feature_set_version(reduced_features, img_mode=0)
+    # An edit of label_utils, which is only imported by the modules that 
+    # feature_combinations imports from, e.g. io_utils
+    getsource = inspect.getsource
+    monkeypatch.setattr(inspect, 'getsource', 
+        lambda module: getsource(module) + ('#' if module is label_utils else ''))
+    assert feature_set_version(reduced_features, img_mode=0) != version
@@ -0,0 +1,32 @@
+import os
+from ds_info.utils.file_utils import index_case_files, case_name_from_file, link_file, transfer_files
+
+def _write(path, nr_bytes):
+    with open(path, 'wb') as f:
+        f.write(b'\0'*nr_bytes)
+
+def test_index_case_files(tmp_path):
+    for name in ['case_1_0000.nii.gz', 'case_1_0001.nii.gz', 'case_10_0000.nii.gz']:
+        _write(os.path.join(tmp_path, name), 1)
+    index = index_case_files(str(tmp_path), has_mode=True)
+    # Exact case names, so case_1 does not match the files of case_10
+    assert index == {'case_1': ['case_1_0000.nii.gz', 'case_1_0001.nii.gz'],
+        'case_10': ['case_10_0000.nii.gz']}
+    assert case_name_from_file('case_0001.nii.gz') == 'case_0001'
+
+def test_link_strategies(tmp_path):
+    src = os.path.join(tmp_path, 'src.nii.gz')
+    _write(src, 100)
+    pairs = [(src, os.path.join(tmp_path, strategy)) for strategy in ['copy', 'hardlink', 'reflink', 'symlink']]
+    assert transfer_files(pairs[:1], 'copy', dry_run=True) == 100
+    assert transfer_files(pairs[1:2], 'hardlink', dry_run=True) == 0
+    assert not os.path.exists(pairs[0][1])
+    assert transfer_files(pairs[:1], 'copy', workers=2) == 100
+    assert link_file(*pairs[1], strategy='hardlink') == 0
+    assert os.stat(pairs[1][1]).st_nlink == 2
+    # Copied where the file system has no reflinks
+    assert link_file(*pairs[2], strategy='reflink') in [0, 100]
+    link_file(*pairs[3], strategy='symlink')
+    assert os.path.islink(pairs[3][1])
+    for _, dst in pairs:
+        assert os.path.getsize(dst) == 100
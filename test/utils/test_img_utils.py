@@ -0,0 +1,25 @@
+import numpy as np
+from ds_info.utils.img_utils import center_crop
+
+def test_center_crop():
+    x = np.arange(5*6*7).reshape(5, 6, 7)
+    crop = center_crop(x, (3, 4, 7))
+    # As monai.transforms.CenterSpatialCrop: start = center - size//2
+    assert np.array_equal(crop, x[1:4, 1:5, 0:7])
+    assert np.shares_memory(crop, x)
+    # Crops larger than the image keep the whole dimension
+    assert center_crop(x, (10, -1, 2)).shape == (5, 6, 2)
+
+def test_center_crop_channels_and_downsampling():
+    x = np.arange(2*8*8*8).reshape(2, 8, 8, 8)
+    crop = center_crop(x, (4, 4, 4), downsample=2)
+    assert np.array_equal(crop, x[:, 2:6:2, 2:6:2, 2:6:2])
+
+def test_thumbnail():
+    from ds_info.utils.img_utils import thumbnail
+    x = np.arange(2*20*33*50, dtype=np.int16).reshape(2, 20, 33, 50)
+    thumb = thumbnail(x, (8, 16, 16))
+    assert thumb.shape == (2, 8, 16, 16) and thumb.dtype == np.float32
+    # Corners are kept, and values are interpolated linearly
+    assert thumb[1, 0, 0, 0] == x[1, 0, 0, 0]
+    assert np.all(np.diff(thumb, axis=-1) > 0)
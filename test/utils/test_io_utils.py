@@ -0,0 +1,70 @@
+import os
+import numpy as np
+from ds_info.utils.io_utils import convert_ds_to_npy, load_img_label, get_npy_path, get_img_label_paths
+from ds_info.extract_stats_ds import extract_ds_stats
+
+def test_npy_store(synthetic_task):
+    x, y, x_info = load_img_label(synthetic_task, 'case_001_0000.nii.gz')
+    props = extract_ds_stats(synthetic_task)
+    convert_ds_to_npy(synthetic_task)
+    x_mmap, y_mmap, x_mmap_info = load_img_label(synthetic_task, 'case_001_0000.nii.gz')
+    assert isinstance(x_mmap, np.memmap) and isinstance(y_mmap, np.memmap)
+    assert np.array_equal(x, x_mmap) and np.array_equal(y, y_mmap)
+    assert y.dtype == y_mmap.dtype
+    assert x_info.to_dict() == x_mmap_info.to_dict()
+    assert extract_ds_stats(synthetic_task) == props
+
+def test_outdated_npy_copy_not_used(synthetic_task):
+    convert_ds_to_npy(synthetic_task)
+    img_path, _ = get_img_label_paths(synthetic_task, 'case_001_0000.nii.gz')
+    npy_mtime = os.path.getmtime(get_npy_path(synthetic_task, img_path))
+    os.utime(img_path, (npy_mtime + 10, npy_mtime + 10))
+    x, _, _ = load_img_label(synthetic_task, 'case_001_0000.nii.gz')
+    assert not isinstance(x, np.memmap)
+    convert_ds_to_npy(synthetic_task)
+    assert isinstance(load_img_label(synthetic_task, 'case_001_0000.nii.gz')[0], np.memmap)
+    # A file replaced by another with an older modification time, e.g. with
+    # cp -p, is also detected
+    _, other_path = get_img_label_paths(synthetic_task, 'case_002_0000.nii.gz')
+    other_path = other_path.replace('labelsTr', 'imagesTr').replace('.nii.gz', '_0000.nii.gz')
+    with open(other_path, 'rb') as f, open(img_path, 'wb') as g:
+        g.write(f.read())
+    os.utime(img_path, (0, 0))
+    x, _, _ = load_img_label(synthetic_task, 'case_001_0000.nii.gz')
+    assert not isinstance(x, np.memmap)
+    assert np.array_equal(x, load_img_label(synthetic_task, 'case_002_0000.nii.gz')[0])
+
+def test_label_path_of_case_ending_with_digits():
+    _, label_path = get_img_label_paths('ds', 'case_0001_0002.nii.gz')
+    assert label_path == os.path.join('ds', 'labelsTr', 'case_0001.nii.gz')
+
+def test_list_and_load_cases(tmp_path):
+    from conftest import write_task
+    from ds_info.utils.io_utils import list_cases, load_case
+    dataset_path = write_task(str(tmp_path / 'Task998_Modes'), nr_modes=2)
+    cases = list_cases(dataset_path)
+    assert list(cases.keys()) == ['case_000', 'case_001', 'case_002', 'case_003']
+    assert cases['case_001'] == ['case_001_0000.nii.gz', 'case_001_0001.nii.gz']
+    xs, y, x_info = load_case(dataset_path, 'case_001')
+    for mode, x in enumerate(xs):
+        x_mode, y_mode, _ = load_img_label(dataset_path, 'case_001_{:04d}.nii.gz'.format(mode))
+        assert np.array_equal(x, x_mode) and np.array_equal(y, y_mode)
+    # The same arrays are memory-mapped from the npy store
+    convert_ds_to_npy(dataset_path)
+    xs_mmap, y_mmap, _ = load_case(dataset_path, 'case_001')
+    assert isinstance(y_mmap, np.memmap) and np.array_equal(y, y_mmap)
+    assert all(np.array_equal(x, x_mmap) for x, x_mmap in zip(xs, xs_mmap))
+
+def test_case_paths_of_uncompressed_files(tmp_path):
+    from conftest import write_task
+    from ds_info.utils.io_utils import get_case_paths
+    dataset_path = write_task(str(tmp_path / 'Task998_Modes'), nr_cases=2, nr_modes=2)
+    for dir_name in ['imagesTr', 'labelsTr']:
+        for file_name in os.listdir(os.path.join(dataset_path, dir_name)):
+            if file_name.startswith('case_001'):
+                path = os.path.join(dataset_path, dir_name, file_name)
+                os.rename(path, path.replace('.nii.gz', '.nii'))
+    img_paths, label_path = get_case_paths(dataset_path, 'case_001')
+    assert [os.path.basename(path) for path in img_paths] == ['case_001_0000.nii', 'case_001_0001.nii']
+    assert label_path == os.path.join(dataset_path, 'labelsTr', 'case_001.nii')
+    assert os.path.isfile(label_path)
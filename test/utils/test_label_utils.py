@@ -0,0 +1,17 @@
+import numpy as np
+from ds_info.utils.label_utils import compact_label_map, divide_label_maps
+
+def test_compact_label_map():
+    y = np.array([[0, 1], [2, 300]])
+    assert compact_label_map(y).dtype == np.uint16
+    assert compact_label_map(np.array([[0., 1.], [2., 3.]])).dtype == np.uint8
+    assert compact_label_map(np.array([[-1, 1], [2, 3]])).dtype == np.int8
+    y = np.zeros((2, 2), dtype=np.uint8)
+    assert compact_label_map(y) is y
+
+def test_divide_label_maps():
+    y = np.array([[0, 1], [2, 2]], dtype=np.uint8)
+    label_maps = divide_label_maps(y)
+    assert list(label_maps.keys()) == [1, 2]
+    assert label_maps[2].dtype == np.uint8
+    assert np.array_equal(label_maps[2], [[0, 0], [1, 1]])
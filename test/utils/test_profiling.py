@@ -0,0 +1,58 @@
+import csv
+import json
+import numpy as np
+from ds_info.utils import profiling
+from ds_info.extract_stats_ds import extract_ds_stats
+
+def test_disabled_records_nothing():
+    assert not profiling.is_enabled()
+    wrapped = profiling.profiled(lambda x: x + 1, name='add')
+    assert wrapped(1) == 2
+    with profiling.stage('stage'):
+        pass
+    assert profiling.pop_records() == []
+
+def test_nested_stages_and_memory():
+    profiling.enable(track_memory=True)
+    try:
+        with profiling.case('case_0'):
+            with profiling.stage('outer'):
+                with profiling.stage('inner'):
+                    x = np.ones(2**20)
+                del x
+                y = np.ones(2**19)
+    finally:
+        profiling.disable()
+    records = dict((record['stage'], record) for record in profiling.pop_records())
+    assert set(records.keys()) == {'case', 'outer', 'inner'}
+    assert records['inner']['depth'] == 2 and records['case']['depth'] == 0
+    assert all(record['case'] == 'case_0' for record in records.values())
+    # The peak of a stage includes that of its inner stages
+    assert records['inner']['peak_memory'] >= 8 * 2**20
+    assert records['outer']['peak_memory'] >= records['inner']['peak_memory']
+    assert records['case']['seconds'] >= records['outer']['seconds'] >= records['inner']['seconds']
+
+def test_extraction_trace(synthetic_task, tmp_path):
+    profiling.enable()
+    try:
+        # A stage recorded before the workers are forked, e.g. a conversion
+        with profiling.stage('before'):
+            pass
+        extract_ds_stats(synthetic_task, workers=2)
+    finally:
+        profiling.disable()
+    records = profiling.pop_records()
+    rows = dict((row['stage'], row) for row in profiling.summary(records))
+    # Records inherited by the workers are not returned again
+    assert rows['before']['calls'] == 1
+    # Records are returned from the worker processes
+    assert rows['case']['calls'] == 4
+    assert rows['feature_combinations.reduced_features']['calls'] == 4
+    assert rows['io_utils.load_img_label']['bytes_read'] > 0
+    assert rows['case']['p95'] >= rows['case']['p50']
+    profiling.save_trace(records, str(tmp_path / 'trace.csv'))
+    profiling.save_trace(records, str(tmp_path / 'trace.json'))
+    with open(str(tmp_path / 'trace.csv')) as csv_file:
+        assert len(list(csv.DictReader(csv_file))) == len(records)
+    with open(str(tmp_path / 'trace.json')) as json_file:
+        assert len(json.load(json_file)['summary']) == len(rows)
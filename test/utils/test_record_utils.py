@@ -0,0 +1,38 @@
+import os
+import pickle
+import pytest
+from ds_info.utils.record_utils import RecordWriter, read_records, read_header
+
+def test_truncated_last_record_removed(tmp_path):
+    path = str(tmp_path / 'records.pkl')
+    with RecordWriter(path, header={'option': 1}) as writer:
+        for ix in range(3):
+            writer.write(('case_{}'.format(ix), list(range(ix))))
+    size = os.path.getsize(path)
+    with open(path, 'r+b') as f:
+        f.truncate(size - 3)
+    assert [name for name, _ in read_records(path)] == ['case_0', 'case_1']
+    assert read_header(path) == {'option': 1}
+    with RecordWriter(path, header={'option': 1}) as writer:
+        writer.write(('case_2', [0, 1]))
+    assert [name for name, _ in read_records(path)] == ['case_0', 'case_1', 'case_2']
+    with pytest.raises(ValueError):
+        RecordWriter(path, header={'option': 2})
+
+def test_corrupted_record_not_truncated(tmp_path):
+    path = str(tmp_path / 'records.pkl')
+    with RecordWriter(path) as writer:
+        for ix in range(3):
+            writer.write(('case_{}'.format(ix), list(range(ix))))
+    with open(path, 'rb') as f:
+        data = bytearray(f.read())
+    # The first opcode of the second record
+    second = len(pickle.dumps(('case_0', []), protocol=pickle.HIGHEST_PROTOCOL))
+    data[second] = ord(b'\xff')
+    with open(path, 'wb') as f:
+        f.write(data)
+    with pytest.raises(pickle.UnpicklingError):
+        list(read_records(path))
+    with pytest.raises(pickle.UnpicklingError):
+        RecordWriter(path)
+    assert os.path.getsize(path) == len(data)